@@ -0,0 +1,87 @@
+"""
+Cost of refusing cycle-forming links while a dataflow graph is built.
+
+Links of a random DAG are added in random order, every tenth attempt
+is a link backwards which would close a cycle. "before" checks each
+link with a full search from its end, as our tooling did; "after" is an
+``acyclic`` graph, where ``check_add_link`` consults the incrementally
+kept topological order.
+
+    python -m benchmarks.acyclic [nodes] [links]
+"""
+
+import sys
+import time
+import random
+
+from revigred.model import Graph, Link, Node, Port, Cancel
+from revigred.model.graph.traversal import reachable
+from revigred.utils import title
+
+class AcyclicGraph(Graph):
+    acyclic = True
+
+def make_links(nodes, links, seed=1):
+    "Returns links of a DAG in random order, with backward links mixed in"
+    rng = random.Random(seed)
+    ids = ["NODE-{}".format(i) for i in range(nodes)]
+    rng.shuffle(ids)
+    result = []
+    seen = set()
+    while len(result) < links:
+        # mostly local links, like chains of processing steps
+        start = rng.randrange(nodes - 1)
+        end = min(nodes - 1, start + 1 + int(rng.expovariate(0.05)))
+        if (start, end) in seen:
+            continue
+        seen.add((start, end))
+        result.append((ids[start], ids[end]))
+    rng.shuffle(result)
+    for index in range(0, len(result), 10):
+        start, end = result[index]
+        result.insert(index, (end, start))
+    return ids, result
+
+def build(graph_class, ids):
+    graph = graph_class()
+    for id in ids:
+        node = Node(id)
+        node.add_port(Port("out", ""))
+        node.add_port(Port("in", ""))
+        graph.add_node(node)
+    return graph
+
+def legacy(graph, start, end):
+    graph.check_add_link(start, "out", end, "in")
+    if reachable(graph, end, start):
+        raise Cancel()
+    graph.add_link(Link(start, "out", end, "in"))
+
+def incremental(graph, start, end):
+    graph.check_add_link(start, "out", end, "in")
+    graph.add_link(Link(start, "out", end, "in"))
+
+def run(graph_class, add, ids, links):
+    graph = build(graph_class, ids)
+    refused = 0
+    started = time.perf_counter()
+    for start, end in links:
+        try:
+            add(graph, start, end)
+        except Cancel:
+            refused += 1
+    return time.perf_counter() - started, refused
+
+def main(nodes, links):
+    print(title("{} links between {} nodes".format(links, nodes)))
+    ids, links = make_links(nodes, links)
+    print("{:>8} {:>10} {:>12} {:>10}".format("", "total, s", "per link, us", "refused"))
+    for name, graph_class, add in (("before", Graph, legacy),
+            ("after", AcyclicGraph, incremental)):
+        elapsed, refused = run(graph_class, add, ids, links)
+        print("{:>8} {:>10.2f} {:>12.1f} {:>10}".format(
+            name, elapsed, elapsed / len(links) * 1e6, refused))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 25000)
@@ -0,0 +1,73 @@
+"""
+Cold start of a large graph: memory-mapped checkpoint vs journal replay.
+
+    python -m benchmarks.checkpoint [nodes]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+from revigred.model import (
+    GraphModel,
+    Journal,
+    write_checkpoint,
+    )
+from revigred.utils import title
+
+PORTS = [("in", ""), ("out", "")]
+
+def make_dump(count):
+    nodes = []
+    links = []
+    for i in range(count):
+        id = "NODE-{:032x}".format(i)
+        nodes.append((id, PORTS, {"x": i, "y": i, "title": "node"}))
+        if i:
+            links.append(("NODE-{:032x}".format(i - 1), "out", id, "in"))
+    return len(nodes) * 3 + len(links) - 1, nodes, links
+
+def write_journal(path, rev, nodes, links):
+    loop = asyncio.new_event_loop()
+    journal = Journal(path, loop=loop)
+    rev = 0
+    for id, ports, state in nodes:
+        journal.append(rev, "createNode", (id,))
+        journal.append(rev + 1, "changePorts", (id, [dict(name=name, title=title) for name, title in ports]))
+        journal.append(rev + 2, "changeState", (id, state))
+        rev += 3
+    for key in links:
+        journal.append(rev, "addLink", key)
+        rev += 1
+    journal.close()
+    loop.close()
+
+def measure(**kwargs):
+    start = time.perf_counter()
+    model = GraphModel(**kwargs)
+    elapsed = time.perf_counter() - start
+    model.close()
+    return elapsed, len(model.graph._nodes_by_id)
+
+def main(count=500000):
+    print(title("cold start of {} nodes".format(count)))
+    rev, nodes, links = make_dump(count)
+    with tempfile.TemporaryDirectory() as directory:
+        checkpoint = os.path.join(directory, "graph.checkpoint")
+        start = time.perf_counter()
+        write_checkpoint(checkpoint, rev, nodes, links)
+        print("checkpoint written in {:.2f}s, {:.1f} MB".format(
+            time.perf_counter() - start, os.path.getsize(checkpoint) / 2**20))
+        elapsed, loaded = measure(checkpoint=checkpoint)
+        print("checkpoint load:  {:.2f}s ({} nodes)".format(elapsed, loaded))
+
+        journal = os.path.join(directory, "graph.journal")
+        write_journal(journal, rev, nodes, links)
+        print("journal size {:.1f} MB".format(os.path.getsize(journal) / 2**20))
+        elapsed, loaded = measure(journal=journal)
+        print("journal replay:   {:.2f}s ({} nodes)".format(elapsed, loaded))
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,126 @@
+"""
+Client memory over a long session of server events.
+
+Nodes are created, changed, linked and removed again, while one
+long-lived node has its state changed all the time and patched now and
+then. "before" is the old ``Branch`` of cells which kept every revision,
+with ``top()`` taking ``max()`` over them; "after" is ``ClientGraph`` with
+bounded history. Live size should stay flat.
+
+    python -m benchmarks.client_soak [events]
+"""
+
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+from sentinels import NOTHING
+
+from revigred.model import ClientGraph, ClientGraphModel
+from revigred.model.graph.client import Branch, Repo
+from revigred.utils import title
+
+class Cell(object):
+    def __init__(self):
+        self._value = NOTHING
+
+    @property
+    def empty(self):
+        return self._value is NOTHING
+
+    def set(self, value):
+        self._value = value
+
+    def get(self):
+        return self._value
+
+class LegacyBranch(Branch):
+    def __init__(self):
+        self._cells = defaultdict(Cell)
+
+    def add(self, rev, value):
+        assert self._cells[rev].empty
+        self._cells[rev].set(value)
+
+    def get(self, rev):
+        assert not self._cells[rev].empty
+        return self._cells[rev].get()
+
+    def top(self):
+        return max(self._cells)
+
+    @property
+    def empty(self):
+        return not self._cells
+
+class LegacyRepo(Repo):
+    branch_factory = LegacyBranch
+
+    def current(self):
+        if self._their.empty:
+            return NOTHING
+        return self._their.get(self._their.top())
+
+class LegacyGraph(ClientGraph):
+    repo_factory = LegacyRepo
+
+    def confirmed(self, rev):
+        pass
+
+class LegacyModel(ClientGraphModel):
+    graph_factory = LegacyGraph
+
+def events(count):
+    "Yields server events, `count` of them"
+    rev = 0
+    serial = 0
+    keep = "NODE-keep"
+    yield ("createNode", [keep], {"rev": rev})
+    rev += 1
+    while rev < count:
+        id1 = "NODE-{:032x}".format(serial)
+        id2 = "NODE-{:032x}".format(serial + 1)
+        serial += 2
+        cycle = [
+            ("createNode", [id1]),
+            ("createNode", [id2]),
+            ("changeState", [id1, {"x": serial}]),
+            ("addLink", [id1, "out", id2, "in"]),
+            ("removeNode", [id1]),
+            ("removeNode", [id2]),
+            ("changeState", [keep, {"serial": serial}]),
+            ]
+        if serial % 200 == 0:
+            cycle.append(("patchState", [keep, [[["seen"], serial]]]))
+        for name, args in cycle:
+            yield (name, args, {"rev": rev})
+            rev += 1
+
+def soak(model_class, count, samples=5):
+    model = model_class()
+    step = count // samples
+    result = []
+    tracemalloc.start()
+    started = time.perf_counter()
+    for index, message in enumerate(events(count)):
+        model.receive(message)
+        if (index + 1) % step == 0:
+            result.append((tracemalloc.get_traced_memory()[0],
+                time.perf_counter() - started))
+    tracemalloc.stop()
+    return result
+
+def main(count):
+    print(title("client live memory over {} server events".format(count)))
+    before = soak(LegacyModel, count)
+    after = soak(ClientGraphModel, count)
+    step = count // len(after)
+    print("{:>10} {:>14} {:>10} {:>14} {:>10}".format(
+        "events", "before, KiB", "time, s", "after, KiB", "time, s"))
+    for i, (old, new) in enumerate(zip(before, after)):
+        print("{:>10} {:>14.1f} {:>10.1f} {:>14.1f} {:>10.1f}".format(
+            (i + 1) * step, old[0] / 1024, old[1], new[0] / 1024, new[1]))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
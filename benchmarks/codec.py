@@ -0,0 +1,44 @@
+"""
+Payload size and encode/decode cost of a typical event stream per codec.
+
+    python -m benchmarks.codec
+"""
+
+import timeit
+import uuid
+
+from revigred.codec import CODECS
+from revigred.record import Record
+from revigred.utils import title
+
+def make_stream(count=1000):
+    messages = []
+    rev = 0
+    previous = None
+    for i in range(count):
+        id = "NODE-" + uuid.uuid4().hex
+        messages.append(('createNode', [id], {'rev': rev}))
+        messages.append(('changePorts', [id, [Record(name='in', title='')]], {'rev': rev + 1}))
+        messages.append(('changeState', [id, {'__type__': 'File', 'path': '/tmp/' + str(i)}], {'rev': rev + 2}))
+        if previous is not None:
+            messages.append(('addLink', [previous, 'in', id, 'in'], {'rev': rev + 3}))
+        previous = id
+        rev += 4
+    return messages
+
+def main():
+    messages = make_stream()
+    print(title("codec cost for {} messages".format(len(messages))))
+    print("{:>20} {:>12} {:>14} {:>14}".format(
+        "codec", "bytes", "encode, us", "decode, us"))
+    for codec in CODECS:
+        payloads = [codec.encode(message) for message in messages]
+        size = sum(len(payload) for payload in payloads)
+        encode = timeit.timeit(lambda: [codec.encode(message) for message in messages], number=5) / 5
+        decode = timeit.timeit(lambda: [codec.decode(payload) for payload in payloads], number=5) / 5
+        print("{:>20} {:>12} {:>14.2f} {:>14.2f}".format(
+            codec.subprotocol, size,
+            encode / len(messages) * 1e6, decode / len(messages) * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Graph size and time to first content when a Root is set to a large tree.
+
+"before" materializes the whole tree like the old eager fill; "after"
+uses the default ``expand_depth`` and ``max_entries`` and then expands
+a single folder on demand.
+
+    python -m benchmarks.expand [entries]
+"""
+
+import sys
+import time
+import uuid
+import asyncio
+import tempfile
+
+from benchmarks.scan import FakeOrigin, ScanModel, make_tree
+from revigred.utils import title
+
+def fill(model, loop, id, path, user):
+    started = time.perf_counter()
+    model.on_nodeStateChanged(FakeOrigin(user, 1), id, {"path": path})
+    while model._scans:
+        loop.run_until_complete(next(iter(model._scans.values())).done)
+    return time.perf_counter() - started
+
+def run(path, eager):
+    loop = asyncio.new_event_loop()
+    model = ScanModel(loop=loop)
+    if eager:
+        model.expand_depth = None
+        model.max_entries = None
+    user = model.create_new_user()
+    id = "NODE-" + uuid.uuid4().hex
+    model.on_nodeCreated(FakeOrigin(user, 0), id)
+    elapsed = fill(model, loop, id, path, user)
+    nodes = len(model.graph._nodes_by_id)
+    expand = None
+    if not eager:
+        folder = next(link.end_id for link in model.graph.find_links_startswith(id)
+            if model.graph.get_node(link.end_id).get_state()["__type__"] == "Folder")
+        started = time.perf_counter()
+        model.on_expandNode(FakeOrigin(user, 2), folder)
+        while model._scans:
+            loop.run_until_complete(next(iter(model._scans.values())).done)
+        expand = (time.perf_counter() - started, len(model.graph._nodes_by_id))
+    model.close()
+    loop.close()
+    return elapsed, nodes, expand
+
+def main(entries):
+    print(title("eager versus lazy fill of {} entries".format(entries)))
+    with tempfile.TemporaryDirectory() as path:
+        make_tree(path, entries)
+        elapsed, nodes, _ = run(path, True)
+        print("before: filled in {:.3f}s, {} nodes".format(elapsed, nodes))
+        elapsed, nodes, (expanded, total) = run(path, False)
+        print("after:  filled in {:.3f}s, {} nodes".format(elapsed, nodes))
+        print("        one folder expanded in {:.3f}s, {} nodes".format(expanded, total))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,87 @@
+"""
+Encode cost of one graph event as a function of connected users.
+
+"before" reproduces the old path where every recipient ran its own
+``json.dumps(...).encode()``; "after" goes through ``GraphModel._callAll``
+with shared frames.
+
+    python -m benchmarks.fanout
+"""
+
+import json
+import timeit
+
+from revigred.model import GraphModel, User
+from revigred.utils import title
+
+def encode(frame):
+    return json.dumps(frame.message).encode("utf-8")
+
+class Counting(object):
+    def __init__(self):
+        self.encodes = 0
+
+    def encode(self, frame):
+        self.encodes += 1
+        return encode(frame)
+
+class LegacyProtocol(object):
+    def __init__(self, counter):
+        self.counter = counter
+
+    def sendFrame(self, frame):
+        self.counter.encode(frame)
+
+class SharedProtocol(LegacyProtocol):
+    def sendFrame(self, frame):
+        frame.encode(self, self.counter.encode)
+
+class DirectUser(User):
+    "Skips per-tick coalescing so only encoding is measured"
+    def send_frame(self, frame):
+        self._protocol.sendFrame(frame)
+
+class DirectModel(GraphModel):
+    user_factory = DirectUser
+
+class FakeOrigin(object):
+    def __init__(self, user, rev):
+        self.user = user
+        self.rev = rev
+
+def make_model(users, protocol):
+    model = DirectModel()
+    for i in range(users):
+        user = model.create_new_user()
+        user.connect(protocol)
+    return model
+
+STATE = {"x": 100, "y": 200, "title": "node", "props": list(range(20))}
+
+def run(users, protocol_factory, events=200):
+    counter = Counting()
+    protocol = protocol_factory(counter)
+    model = make_model(users, protocol)
+    origin = FakeOrigin(next(iter(model._users.values())), 0)
+    model.on_nodeCreated(origin, "NODE-0")
+    counter.encodes = 0
+
+    def event():
+        model.on_nodeStateChanged(origin, "NODE-0", STATE)
+
+    seconds = timeit.timeit(event, number=events)
+    return seconds / events, counter.encodes / events
+
+def main():
+    print(title("fan-out encode cost per event"))
+    print("{:>8} {:>14} {:>10} {:>14} {:>10} {:>8}".format(
+        "users", "before, us", "encodes", "after, us", "encodes", "speedup"))
+    for users in (1, 10, 50, 100, 500, 1000):
+        before, before_encodes = run(users, LegacyProtocol)
+        after, after_encodes = run(users, SharedProtocol)
+        print("{:>8} {:>14.1f} {:>10.0f} {:>14.1f} {:>10.0f} {:>7.1f}x".format(
+            users, before * 1e6, before_encodes, after * 1e6, after_encodes,
+            before / after))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Cost of removing a hub node with many links for a number of users.
+
+"before" broadcasts one ``removeLink`` per incident link and then
+``removeNode``; "after" is ``GraphModel.on_nodeRemoved`` which sends a
+single ``removeNode`` implying the links.
+
+    python -m benchmarks.hub
+"""
+
+import time
+
+from revigred.model import GraphModel, User
+from revigred.model.graph import Link
+from revigred.utils import title
+
+class CountingProtocol(object):
+    def __init__(self):
+        self.frames = 0
+
+    def sendFrame(self, frame):
+        self.frames += 1
+        frame.encode(self, lambda frame: frame.message)
+
+class DirectUser(User):
+    "Skips per-tick coalescing so every frame reaches protocol"
+    def send_frame(self, frame):
+        self._protocol.sendFrame(frame)
+
+class DirectModel(GraphModel):
+    user_factory = DirectUser
+
+class LegacyModel(DirectModel):
+    def on_nodeRemoved(self, origin, id):
+        links = list(self.graph.find_links_startswith(id))
+        links.extend(link for link in self.graph.find_links_endswith(id)
+            if link.start_id != id)
+        for link in links:
+            self.graph.remove_link(link.start_id, link.start_name,
+                link.end_id, link.end_name)
+            self.removeLinkAll(None, link.start_id, link.start_name,
+                link.end_id, link.end_name)
+        self.graph.remove_node(id)
+        self.removeNodeAll(origin, id)
+
+class FakeOrigin(object):
+    def __init__(self, user, rev):
+        self.user = user
+        self.rev = rev
+
+def run(model_class, users, links):
+    protocol = CountingProtocol()
+    model = model_class()
+    for i in range(users):
+        model.create_new_user().connect(protocol)
+    graph = model.graph
+    graph.add_node(graph.node_factory("NODE-hub"))
+    for i in range(links):
+        id = "NODE-{}".format(i)
+        graph.add_node(graph.node_factory(id))
+        graph.add_link(Link("NODE-hub", "out", id, "in"))
+    origin = FakeOrigin(next(iter(model._users.values())), 0)
+
+    start = time.perf_counter()
+    model.on_nodeRemoved(origin, "NODE-hub")
+    seconds = time.perf_counter() - start
+    return seconds, protocol.frames
+
+def main():
+    print(title("hub node removal"))
+    print("{:>8} {:>8} {:>12} {:>10} {:>12} {:>10} {:>8}".format(
+        "links", "users", "before, ms", "frames", "after, ms", "frames",
+        "speedup"))
+    for links, users in ((100, 10), (1000, 10), (10000, 1), (10000, 10),
+            (10000, 50)):
+        before, before_frames = run(LegacyModel, users, links)
+        after, after_frames = run(DirectModel, users, links)
+        print("{:>8} {:>8} {:>12.1f} {:>10} {:>12.1f} {:>10} {:>7.1f}x".format(
+            links, users, before * 1e3, before_frames, after * 1e3,
+            after_frames, before / after))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Mutation throughput of GraphModel with and without the journal.
+Mutations are issued in bursts of `burst` per loop iteration, so every
+burst shares one group-committed fsync.
+
+    python -m benchmarks.journal
+"""
+
+import os
+import time
+import asyncio
+import tempfile
+
+from revigred.model import GraphModel
+from revigred.utils import title
+
+class FakeOrigin(object):
+    def __init__(self, user, rev):
+        self.user = user
+        self.rev = rev
+
+def run(count, burst, journal=None):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    model = GraphModel(journal=journal)
+    origin = FakeOrigin(None, 0)
+
+    def mutate(i):
+        if i >= count:
+            loop.stop()
+            return
+        for j in range(i, min(count, i + burst)):
+            id = "NODE-{:032x}".format(j)
+            model.on_nodeCreated(origin, id)
+            model.on_nodeStateChanged(origin, id, {"x": j, "y": j})
+        loop.call_soon(mutate, i + burst)
+
+    try:
+        start = time.perf_counter()
+        loop.call_soon(mutate, 0)
+        loop.run_forever()
+        model.close()
+        elapsed = time.perf_counter() - start
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    return count * 4 / elapsed
+
+def main(count=20000):
+    print(title("journaled vs in-memory mutations"))
+    print("{:>8} {:>18} {:>18}".format("burst", "memory, events/s", "journal, events/s"))
+    with tempfile.TemporaryDirectory() as directory:
+        for burst in (1, 10, 100, 1000):
+            path = os.path.join(directory, "graph-{}.journal".format(burst))
+            memory = run(count, burst)
+            journaled = run(count, burst, journal=path)
+            print("{:>8} {:>18.0f} {:>18.0f}".format(burst, memory, journaled))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Memory taken by graph storage per node and per link.
+
+"before" reproduces the old layout: listener table allocated by every
+node, ``__dict__`` on every object and a separate key tuple per link;
+"after" is ``revigred.model.graph.storage``. Identifiers arrive as fresh
+strings, as they do from decoded messages.
+
+    python -m benchmarks.memory [sizes...]
+"""
+
+import sys
+import uuid
+import tracemalloc
+from collections import defaultdict
+
+from revigred.model.graph import Graph, Node, Port, Link
+from revigred.utils import title
+
+class LegacyPort(object):
+    def __init__(self, name, title):
+        self._name = name
+        self._title = title
+
+    @property
+    def name(self):
+        return self._name
+
+class LegacyNode(object):
+    def __init__(self, id):
+        self._listeners = defaultdict(set)
+        self._id = id
+        self._state = {}
+        self._ports = []
+        self._ports_by_name = {}
+
+    @property
+    def id(self):
+        return self._id
+
+    def add_port(self, port):
+        self._ports.append(port)
+        self._ports_by_name[port.name] = port
+
+class LegacyLink(object):
+    def __init__(self, start_id, start_name, end_id, end_name):
+        self.start_id = start_id
+        self.start_name = start_name
+        self.end_id = end_id
+        self.end_name = end_name
+
+class LegacyGraph(object):
+    def __init__(self):
+        self._nodes_by_id = {}
+        self._links_by_key = {}
+        self._links_by_start_id = defaultdict(dict)
+        self._links_by_end_id = defaultdict(dict)
+
+    def add_node(self, node):
+        self._nodes_by_id[node.id] = node
+
+    def add_link(self, link):
+        key = (link.start_id, link.start_name, link.end_id, link.end_name)
+        self._links_by_start_id[link.start_id][key] = link
+        self._links_by_end_id[link.end_id][key] = link
+        self._links_by_key[key] = link
+
+LEGACY = (LegacyGraph, LegacyNode, LegacyPort, LegacyLink)
+COMPACT = (Graph, Node, Port, Link)
+
+def fresh(value):
+    "Returns equal string which is a distinct object"
+    return (value + " ")[:-1]
+
+def measure(classes, size):
+    graph_class, node_class, port_class, link_class = classes
+    ids = ["NODE-" + uuid.uuid4().hex for i in range(size)]
+
+    tracemalloc.start()
+    graph = graph_class()
+    for id in ids:
+        node = node_class(fresh(id))
+        node.add_port(port_class(fresh("in"), ""))
+        node.add_port(port_class(fresh("out"), ""))
+        graph.add_node(node)
+    nodes = tracemalloc.get_traced_memory()[0]
+    for start, end in zip(ids, ids[1:] + ids[:1]):
+        graph.add_link(link_class(fresh(start), fresh("out"), fresh(end), fresh("in")))
+    links = tracemalloc.get_traced_memory()[0] - nodes
+    tracemalloc.stop()
+    return nodes / size, links / size
+
+def main(sizes):
+    print(title("graph storage memory, bytes"))
+    print("{:>10} {:>14} {:>14} {:>14} {:>14}".format(
+        "size", "node before", "node after", "link before", "link after"))
+    for size in sizes:
+        node_before, link_before = measure(LEGACY, size)
+        node_after, link_after = measure(COMPACT, size)
+        print("{:>10} {:>14.0f} {:>14.0f} {:>14.0f} {:>14.0f}".format(
+            size, node_before, node_after, link_before, link_after))
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100000, 1000000])
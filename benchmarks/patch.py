@@ -0,0 +1,71 @@
+"""
+Bytes on the wire for interactive edits sent as full state versus patch.
+
+"before" is ``changeState`` carrying the whole new state, "after" is
+``patchState`` carrying only the changed key paths. Sizes are those of
+one broadcast message encoded by each codec.
+
+    python -m benchmarks.patch
+"""
+
+from revigred.codec import CODECS
+from revigred.frozen import apply_patch, freeze
+from revigred.utils import title
+
+ID = "NODE-0123456789abcdef0123456789abcdef"
+
+NODES = {
+    "file": {
+        "__type__": "File", "path": "/srv/projects/revigred/revigred/model/graph/storage.py",
+        "x": 412, "y": 218, "title": "storage.py", "collapsed": False,
+        },
+    "filter": {
+        "__type__": "Filter", "x": 1200, "y": 640, "title": "Gaussian blur",
+        "color": "#336699", "collapsed": False,
+        "params": {
+            "radius": 4.5, "sigma": 1.2, "mode": "reflect", "truncate": 4.0,
+            "channels": ["r", "g", "b", "a"], "preserve_range": True,
+            },
+        "meta": {"author": "Mary Smith", "created": "2015-03-02T10:11:12Z",
+            "comment": "softens edges before thresholding"},
+        },
+    "table": {
+        "__type__": "Table", "x": 80, "y": 960, "title": "Measurements",
+        "columns": ["time", "sensor", "value", "unit", "flags"],
+        "rows": [[i * 0.5, "sensor-{}".format(i % 7), i * 1.25, "mV", []]
+            for i in range(40)],
+        },
+    }
+
+EDITS = [
+    ("move", [[["x"], 437], [["y"], 221]]),
+    ("rename", [[["title"], "renamed"]]),
+    ("toggle", [[["collapsed"], True]]),
+    ]
+
+def sizes(codec, state, patch):
+    new = apply_patch(freeze(state), patch)
+    full = codec.encode(("changeState", [ID, new], {"rev": 123456}))
+    delta = codec.encode(("patchState", [ID, patch], {"rev": 123456}))
+    return len(full), len(delta)
+
+def main():
+    print(title("interactive edit message size, bytes"))
+    print("{:>8} {:>8} {:>8} {:>10} {:>10} {:>8}".format(
+        "codec", "node", "edit", "before", "after", "saved"))
+    for codec in CODECS:
+        name = codec.subprotocol.split(".")[-1]
+        total_full = total_delta = 0
+        for node, state in NODES.items():
+            for edit, patch in EDITS:
+                full, delta = sizes(codec, state, patch)
+                total_full += full
+                total_delta += delta
+                print("{:>8} {:>8} {:>8} {:>10} {:>10} {:>7.1f}%".format(
+                    name, node, edit, full, delta, 100 - 100 * delta / full))
+        print("{:>8} {:>8} {:>8} {:>10} {:>10} {:>7.1f}%".format(
+            name, "all", "", total_full, total_delta,
+            100 - 100 * total_delta / total_full))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Populating a node with many ports, as filling a large folder does.
+
+"before" re-sends the whole ``changePorts`` list after every added port
+and keeps ports in a list; "after" sends one ``addPort`` delta per port
+and keeps them in ``Ports``. Bytes are JSON-encoded messages.
+
+    python -m benchmarks.ports
+"""
+
+import time
+
+from revigred.codec import JSONCodec
+from revigred.model.graph import Node, Port
+from revigred.utils import title
+
+ID = "NODE-0123456789abcdef0123456789abcdef"
+
+class LegacyNode(Node):
+    "Old list of ports serialized anew on every read"
+    __slots__ = ("_list", "_by_name")
+
+    def __init__(self, id):
+        super().__init__(id)
+        self._list = []
+        self._by_name = {}
+
+    def add_port(self, port, index=None):
+        self._list.insert(len(self._list) if index is None else index, port)
+        self._by_name[port.name] = port
+
+    def remove_port(self, name):
+        self._list.remove(self._by_name.pop(name))
+
+    def get_ports(self):
+        return [port.serialize() for port in self._list]
+
+def populate(node, names, codec, delta):
+    sent = 0
+    for rev, name in enumerate(names):
+        port = Port(name, name)
+        node.add_port(port)
+        if delta:
+            message = ("addPort", [ID, port.serialize(), None], {"rev": rev})
+        else:
+            message = ("changePorts", [ID, node.get_ports()], {"rev": rev})
+        sent += len(codec.encode(message))
+    return sent
+
+def run(node_class, size, delta):
+    codec = JSONCodec()
+    names = ["entry-{:06}.txt".format(i) for i in range(size)]
+    node = node_class(ID)
+    start = time.perf_counter()
+    sent = populate(node, names, codec, delta)
+    populated = time.perf_counter() - start
+    start = time.perf_counter()
+    for name in names:
+        node.remove_port(name)
+    removed = time.perf_counter() - start
+    return sent, populated, removed
+
+def main():
+    print(title("node population with ports"))
+    print("{:>7} {:>12} {:>10} {:>10} {:>10} {:>9} {:>10}".format(
+        "ports", "before, KB", "after, KB", "before, s", "after, s",
+        "clear old", "clear new"))
+    for size in (100, 1000, 5000):
+        sent_before, time_before, clear_before = run(LegacyNode, size, False)
+        sent_after, time_after, clear_after = run(Node, size, True)
+        print("{:>7} {:>12.1f} {:>10.1f} {:>10.3f} {:>10.3f} {:>9.4f} {:>10.4f}".format(
+            size, sent_before / 1024, sent_after / 1024, time_before,
+            time_after, clear_before, clear_after))
+
+if __name__ == '__main__':
+    main()
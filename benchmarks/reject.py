@@ -0,0 +1,78 @@
+"""
+Cost of a client spamming commands which the graph rejects.
+
+One user keeps removing a node which does not exist, while others watch.
+"before" is the old ``_callSelf`` which sent ``nop`` to every other user
+to keep revisions contiguous; "after" answers the sender only and the
+next real event carries ``since``. Reported are time per rejected
+command and frames queued for the other users.
+
+    python -m benchmarks.reject [commands]
+"""
+
+import sys
+import time
+import asyncio
+
+from revigred.frame import Frame
+from revigred.model import GraphModel
+from revigred.utils import title
+
+class CountingProtocol(object):
+    write_buffer_size = 0
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.frames = 0
+
+    def sendFrame(self, frame):
+        self.frames += 1
+
+    def sendFrames(self, frames):
+        self.frames += len(frames)
+
+class LegacyModel(GraphModel):
+    def _callSelf(self, name, origin, *args, **kwargs):
+        rev = self.graph.rev
+        common = Frame("nop", (), dict(rev=rev))
+        for user in self._users.values():
+            if origin is not None and origin.user is user:
+                user.send(name, *args, rev=rev, origin=origin.rev, **kwargs)
+            else:
+                user.send_frame(common)
+
+def run(model_class, users, commands):
+    loop = asyncio.new_event_loop()
+    model = model_class()
+    spammer = model.create_new_user()
+    spammer.connect(CountingProtocol(loop))
+    watchers = []
+    for _ in range(users):
+        user = model.create_new_user()
+        user.connect(CountingProtocol(loop))
+        watchers.append(user)
+    started = time.perf_counter()
+    for rev in range(commands):
+        spammer.dispatch("nodeRemoved", "NODE-missing", rev=rev)
+        if rev % 1000 == 999:
+            loop.call_soon(loop.stop)
+            loop.run_forever()
+    loop.call_soon(loop.stop)
+    loop.run_forever()
+    elapsed = time.perf_counter() - started
+    frames = sum(user._protocol.frames for user in watchers)
+    loop.close()
+    return elapsed, frames
+
+def main(commands):
+    print(title("{} rejected commands".format(commands)))
+    print("{:>8} {:>14} {:>12} {:>14} {:>12}".format(
+        "users", "before, us", "frames", "after, us", "frames"))
+    for users in (10, 100, 1000):
+        before, before_frames = run(LegacyModel, users, commands)
+        after, after_frames = run(GraphModel, users, commands)
+        print("{:>8} {:>14.1f} {:>12} {:>14.1f} {:>12}".format(users,
+            before / commands * 1e6, before_frames, after / commands * 1e6, after_frames))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,145 @@
+"""
+Viewers one hot graph can serve, alone and with read replicas.
+
+A stream of ``changeState`` events goes to every viewer of one graph.
+"before" is a single ``GraphModel`` process with all viewers; "after"
+is a ``Primary`` process owning the graph and replica processes sharing
+viewers among them. Transports only encode, like ``ServerProtocol``.
+Reported are deliveries per second, from the first event until the last
+one is flushed to all viewers, and how many viewers that is enough for
+at `rate` events per second. Replicas need cores of their own to help.
+
+    python -m benchmarks.replicas [events] [replicas]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import multiprocessing
+
+from revigred.codec import JSONCodec
+from revigred.model import GraphModel
+from revigred.model.graph.replica import Primary, ReplicaModel
+from revigred.utils import title
+
+NODES = 16
+RATE = 60
+CHUNK = 50
+
+class EncodingProtocol(object):
+    codec = JSONCodec()
+    write_buffer_size = 0
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def sendFrame(self, frame):
+        self.codec.encode_frame(frame)
+
+    def sendFrames(self, frames):
+        self.codec.encode_batch([self.codec.encode_frame(frame) for frame in frames])
+
+def join(model, viewers, loop):
+    for _ in range(viewers):
+        model.create_new_user().connect(EncodingProtocol(loop))
+
+def tick(loop):
+    loop.run_until_complete(asyncio.sleep(0))
+
+def create_nodes(model):
+    for i in range(NODES):
+        model.on_nodeCreated(None, "NODE-{}".format(i))
+
+def drive(model, events, loop):
+    "Changes states in chunks, waiting for links to replicas to drain"
+    for start in range(0, events, CHUNK):
+        for serial in range(start, min(events, start + CHUNK)):
+            model.on_nodeStateChanged(None, "NODE-{}".format(serial % NODES),
+                {"serial": serial, "title": "node", "x": 10, "y": 20})
+        tick(loop)
+        while any(user.stats.paused for user in model._users.values()):
+            loop.run_until_complete(asyncio.sleep(0.001))
+
+def single(viewers, events):
+    loop = asyncio.new_event_loop()
+    model = GraphModel()
+    create_nodes(model)
+    join(model, viewers, loop)
+    started = time.perf_counter()
+    drive(model, events, loop)
+    tick(loop)
+    elapsed = time.perf_counter() - started
+    loop.close()
+    return elapsed
+
+def primary(path, replicas, events, ready, result):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    model = GraphModel()
+    create_nodes(model)
+    server = Primary(model, path, loop=loop)
+    loop.run_until_complete(server.start())
+    while ready.value < replicas:
+        loop.run_until_complete(asyncio.sleep(0.01))
+    result.put(("start", time.time()))
+    drive(model, events, loop)
+    # keep serving until replicas are done
+    loop.run_until_complete(asyncio.sleep(3600))
+
+def replica(path, viewers, last_rev, ready, result):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    model = ReplicaModel(path, loop=loop)
+    loop.run_until_complete(model.connect())
+    join(model, viewers, loop)
+    while model.graph.next_rev < NODES * 3:
+        loop.run_until_complete(asyncio.sleep(0.01))
+    with ready.get_lock():
+        ready.value += 1
+    while model.graph.next_rev <= last_rev:
+        loop.run_until_complete(asyncio.sleep(0.001))
+    tick(loop)
+    result.put(("end", time.time()))
+
+def replicated(viewers, events, replicas):
+    path = os.path.join(tempfile.mkdtemp(), "primary.sock")
+    ready = multiprocessing.Value("i", 0)
+    result = multiprocessing.Queue()
+    server = multiprocessing.Process(target=primary,
+        args=(path, replicas, events, ready, result))
+    server.start()
+    while not os.path.exists(path):
+        time.sleep(0.01)
+    last_rev = NODES * 3 + events - 1
+    followers = [multiprocessing.Process(target=replica,
+            args=(path, viewers // replicas, last_rev, ready, result))
+        for _ in range(replicas)]
+    for process in followers:
+        process.start()
+    times = dict(start=None, end=0)
+    for _ in range(replicas + 1):
+        name, value = result.get()
+        times[name] = max(times[name] or 0, value)
+    for process in followers:
+        process.join()
+    server.terminate()
+    server.join()
+    os.unlink(path)
+    return times["end"] - times["start"]
+
+def main(events, replicas):
+    print(title("{} events to viewers of one graph, {} replicas, {} cores".format(
+        events, replicas, os.cpu_count())))
+    print("{:>8} {:>14} {:>10} {:>14} {:>10}".format(
+        "viewers", "before, del/s", "max", "after, del/s", "max"))
+    for viewers in (1000, 4000, 16000):
+        before = viewers * events / single(viewers, events)
+        after = viewers * events / replicated(viewers, events, replicas)
+        print("{:>8} {:>14.0f} {:>10.0f} {:>14.0f} {:>10.0f}".format(
+            viewers, before, before / RATE, after, after / RATE))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 4)
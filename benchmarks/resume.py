@@ -0,0 +1,87 @@
+"""
+Cost of a client reconnecting to a large graph after a short drop.
+
+While the client is away a few ``changeState`` events happen, then it
+comes back. "before" opens a new user, which gets the whole graph as a
+snapshot; "after" resumes the session from the last revision the client
+has seen and gets only the revisions it has missed. Reported are time
+and bytes encoded per reconnect.
+
+    python -m benchmarks.resume [reconnects]
+"""
+
+import sys
+import time
+import asyncio
+
+from revigred.codec import JSONCodec
+from revigred.model import GraphModel
+from revigred.utils import title
+
+MISSED = 10
+
+class EncodingProtocol(object):
+    codec = JSONCodec()
+    write_buffer_size = 0
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.size = 0
+
+    def sendFrame(self, frame):
+        self.size += len(self.codec.encode_frame(frame))
+
+    def sendFrames(self, frames):
+        self.size += len(self.codec.encode_batch(
+            [self.codec.encode_frame(frame) for frame in frames]))
+
+    def abort(self):
+        pass
+
+def tick(loop):
+    loop.call_soon(loop.stop)
+    loop.run_forever()
+
+def run(nodes, reconnects, resume):
+    loop = asyncio.new_event_loop()
+    model = GraphModel()
+    for i in range(nodes):
+        model.on_nodeCreated(None, "NODE-{}".format(i))
+    user = model.create_new_user()
+    user.connect(EncodingProtocol(loop))
+    user.channel_opened()
+    tick(loop)
+    elapsed = 0
+    size = 0
+    for serial in range(reconnects):
+        session, seen = user.session, model.graph.rev
+        user.disconnect()
+        for i in range(MISSED):
+            model.on_nodeStateChanged(None, "NODE-{}".format(i % nodes),
+                {"serial": serial, "x": 10, "y": 20})
+        started = time.perf_counter()
+        if resume:
+            user = model.resume_user(session, seen)
+        else:
+            user = model.create_new_user()
+        protocol = EncodingProtocol(loop)
+        user.connect(protocol)
+        user.channel_opened()
+        tick(loop)
+        elapsed += time.perf_counter() - started
+        size += protocol.size
+    loop.close()
+    return elapsed / reconnects, size // reconnects
+
+def main(reconnects):
+    print(title("reconnects after {} missed events".format(MISSED)))
+    print("{:>8} {:>12} {:>12} {:>12} {:>12}".format(
+        "nodes", "before, us", "bytes", "after, us", "bytes"))
+    for nodes in (100, 1000, 10000):
+        before, before_size = run(nodes, reconnects, False)
+        after, after_size = run(nodes, reconnects, True)
+        print("{:>8} {:>12.1f} {:>12} {:>12.1f} {:>12}".format(nodes,
+            before * 1e6, before_size, after * 1e6, after_size))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
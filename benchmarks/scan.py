@@ -0,0 +1,121 @@
+"""
+Event loop stalls while a Root node is filled from a large directory.
+
+"before" walks the tree with ``os.listdir`` / ``os.path.isdir`` right in
+the message handler, like the old ``fill_node``; "after" is the
+``FSGraphModel`` scan in worker threads applied in batches. A ticker
+scheduled every millisecond records the longest gap between its runs.
+
+    python -m benchmarks.scan [entries]
+"""
+
+import os
+import sys
+import time
+import uuid
+import asyncio
+import tempfile
+
+from revigred.model import User
+from revigred.model.graph.fs import FSGraphModel
+from revigred.utils import title
+
+class FakeOrigin(object):
+    def __init__(self, user, rev):
+        self.user = user
+        self.rev = rev
+
+class SilentUser(User):
+    def send_frame(self, frame):
+        pass
+
+class ScanModel(FSGraphModel):
+    user_factory = SilentUser
+
+class LegacyModel(ScanModel):
+    def scan(self, id, path):
+        self.fill_node(path, id)
+        future = self.loop.create_future()
+        future.set_result(None)
+        return future
+
+    def fill_node(self, path, parent_id):
+        for name in os.listdir(path):
+            subpath = os.path.join(path, name)
+            is_dir = os.path.isdir(subpath)
+            node = self.add_entry(parent_id, name, subpath, is_dir)
+            if is_dir:
+                self.fill_node(subpath, node.id)
+
+def make_tree(path, entries, width=20):
+    "Creates `entries` files spread over folders `width` entries wide"
+    folders = [path]
+    created = 0
+    while created < entries:
+        folder = folders.pop(0)
+        for i in range(width):
+            subpath = os.path.join(folder, "entry-{}".format(i))
+            if i % 4 == 0:
+                os.mkdir(subpath)
+                folders.append(subpath)
+            else:
+                open(subpath, "w").close()
+            created += 1
+
+class Ticker(object):
+    def __init__(self, loop, interval=0.001):
+        self.loop = loop
+        self.interval = interval
+        self.longest = 0
+        self.last = None
+        self.running = True
+
+    def tick(self):
+        now = time.perf_counter()
+        if self.last is not None:
+            self.longest = max(self.longest, now - self.last)
+        self.last = now
+        if self.running:
+            self.loop.call_later(self.interval, self.tick)
+
+def run(model_class, path):
+    loop = asyncio.new_event_loop()
+    model = model_class(loop=loop)
+    user = model.create_new_user()
+    id = "NODE-" + uuid.uuid4().hex
+    model.on_nodeCreated(FakeOrigin(user, 0), id)
+    ticker = Ticker(loop)
+
+    def start():
+        model.on_nodeStateChanged(FakeOrigin(user, 1), id, {"path": path})
+        return model._scans[id].done if id in model._scans else None
+
+    async def main():
+        ticker.tick()
+        await asyncio.sleep(0.01)
+        started = time.perf_counter()
+        done = start()
+        if done is not None:
+            await done
+        elapsed = time.perf_counter() - started
+        ticker.running = False
+        return elapsed
+
+    elapsed = loop.run_until_complete(main())
+    nodes = len(model.graph._nodes_by_id)
+    model.close()
+    loop.close()
+    return elapsed, ticker.longest, nodes
+
+def main(entries):
+    print(title("loop stall while filling {} entries".format(entries)))
+    with tempfile.TemporaryDirectory() as path:
+        make_tree(path, entries)
+        print("{:>8} {:>10} {:>16} {:>8}".format("", "total, s", "longest stall, ms", "nodes"))
+        for name, model_class in (("before", LegacyModel), ("after", ScanModel)):
+            elapsed, stall, nodes = run(model_class, path)
+            print("{:>8} {:>10.2f} {:>16.1f} {:>8}".format(
+                name, elapsed, stall * 1e3, nodes))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
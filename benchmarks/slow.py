@@ -0,0 +1,101 @@
+"""
+Server memory held for one client which stopped reading.
+
+One stalled client and a number of healthy ones watch a stream of
+``changeState`` broadcasts over a few nodes. The stalled transport has
+asked to pause writing from the start. "before" ignores that and keeps
+writing into its buffer, like ``User`` did; "after" keeps frames in the
+bounded outbox with each slow consumer policy. Reported are bytes and
+frames held for the stalled client and the time of the whole stream.
+
+    python -m benchmarks.slow [events]
+"""
+
+import sys
+import time
+import asyncio
+
+from revigred.codec import JSONCodec
+from revigred.model import GraphModel
+from revigred.model.graph.model import GraphUser
+from revigred.utils import title
+
+class FakeOrigin(object):
+    def __init__(self, user, rev):
+        self.user = user
+        self.rev = rev
+
+class BufferingProtocol(object):
+    "Encodes frames like ServerProtocol, a stalled one keeps the bytes"
+    codec = JSONCodec()
+
+    def __init__(self, loop, stalled=False):
+        self.loop = loop
+        self.stalled = stalled
+        self.buffer = []
+        self.write_buffer_size = 0
+
+    def sendFrame(self, frame):
+        self.sendFrames([frame])
+
+    def sendFrames(self, frames):
+        data = self.codec.encode_batch([frame.encode(self.codec, self.codec.encode_frame)
+            for frame in frames])
+        if self.stalled:
+            self.buffer.append(data)
+            self.write_buffer_size += len(data)
+
+    def abort(self):
+        self.stalled = False
+        self.buffer = []
+        self.write_buffer_size = 0
+
+class LegacyUser(GraphUser):
+    def pause_writing(self):
+        pass
+
+class LegacyModel(GraphModel):
+    user_factory = LegacyUser
+
+def run(model_class, policy, events, users=20, nodes=50):
+    loop = asyncio.new_event_loop()
+    model = model_class()
+    owner = model.create_new_user()
+    owner.connect(BufferingProtocol(loop))
+    for _ in range(users):
+        model.create_new_user().connect(BufferingProtocol(loop))
+    slow = model.create_new_user()
+    slow.slow_policy = policy
+    slow.connect(BufferingProtocol(loop, stalled=True))
+    slow.pause_writing()
+    ids = ["NODE-{}".format(i) for i in range(nodes)]
+    for id in ids:
+        model.on_nodeCreated(FakeOrigin(owner, 0), id)
+
+    started = time.perf_counter()
+    for tick in range(events // nodes):
+        for id in ids:
+            model.on_nodeStateChanged(FakeOrigin(owner, 0), id, {"tick": tick, "id": id})
+        loop.call_soon(loop.stop)
+        loop.run_forever()
+    elapsed = time.perf_counter() - started
+    stats = slow.stats
+    loop.close()
+    return elapsed, stats.buffered, stats.queued, stats.dropped + stats.coalesced
+
+def main(events):
+    print(title("stalled client among healthy ones, {} events".format(events)))
+    print("{:>22} {:>10} {:>14} {:>10} {:>10}".format(
+        "", "total, s", "buffered, KiB", "queued", "shed"))
+    for name, model_class, policy in (
+            ("before", LegacyModel, "resync"),
+            ("after, resync", GraphModel, "resync"),
+            ("after, coalesce", GraphModel, "coalesce"),
+            ("after, disconnect", GraphModel, "disconnect"),
+            ):
+        elapsed, buffered, queued, shed = run(model_class, policy, events)
+        print("{:>22} {:>10.2f} {:>14.1f} {:>10} {:>10}".format(
+            name, elapsed, buffered / 1024, queued, shed))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
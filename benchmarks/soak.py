@@ -0,0 +1,84 @@
+"""
+Memory of a graph going through millions of add/remove cycles.
+
+Each cycle creates a few fresh nodes, links them, queries their links,
+removes the links and then the nodes, like clients editing a long-lived
+document do. "before" is the old ``defaultdict`` adjacency which kept
+a bucket per node ever seen; "after" is ``Graph`` with ``Adjacency``.
+Live size should stay flat.
+
+    python -m benchmarks.soak [cycles]
+"""
+
+import sys
+import tracemalloc
+from collections import defaultdict
+
+from revigred.model.graph import Graph, Node, Link
+from revigred.utils import title
+
+class LegacyGraph(Graph):
+    "Keeps old adjacency in `find_links_*` and `*_link`"
+    def __init__(self):
+        super().__init__()
+        self._links_by_start_id = defaultdict(dict)
+        self._links_by_end_id = defaultdict(dict)
+
+    def add_link(self, link):
+        self._links_by_start_id[link.start_id][link] = link
+        self._links_by_end_id[link.end_id][link] = link
+        self._links_by_key[link] = link
+
+    def remove_link(self, start_id, start_name, end_id, end_name):
+        key = (start_id, start_name, end_id, end_name)
+        del self._links_by_key[key]
+        del self._links_by_start_id[start_id][key]
+        del self._links_by_end_id[end_id][key]
+
+    def find_links_startswith(self, start_id):
+        yield from list(self._links_by_start_id[start_id].values())
+
+    def find_links_endswith(self, end_id):
+        yield from list(self._links_by_end_id[end_id].values())
+
+WIDTH = 4
+
+def cycle(graph, serial):
+    ids = ["NODE-{:032x}".format(serial * WIDTH + i) for i in range(WIDTH)]
+    for id in ids:
+        graph.add_node(Node(id))
+    pairs = list(zip(ids, ids[1:] + ids[:1]))
+    for start, end in pairs:
+        graph.add_link(Link(start, "out", end, "in"))
+    for id in ids:
+        list(graph.find_links_startswith(id))
+        list(graph.find_links_endswith(id))
+    for start, end in pairs:
+        graph.remove_link(start, "out", end, "in")
+    for id in ids:
+        graph.remove_node(id)
+
+def soak(graph_class, cycles, samples=5):
+    graph = graph_class()
+    tracemalloc.start()
+    result = []
+    step = cycles // samples
+    for serial in range(cycles):
+        cycle(graph, serial)
+        if (serial + 1) % step == 0:
+            result.append(tracemalloc.get_traced_memory()[0])
+    tracemalloc.stop()
+    return result
+
+def main(cycles):
+    print(title("live memory over add/remove cycles, KiB"))
+    before = soak(LegacyGraph, cycles)
+    after = soak(Graph, cycles)
+    step = cycles // len(after)
+    print("{:>10} {:>14} {:>14}".format("cycles", "before", "after"))
+    for i, (old, new) in enumerate(zip(before, after)):
+        print("{:>10} {:>14.1f} {:>14.1f}".format(
+            (i + 1) * step, old / 1024, new / 1024))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,56 @@
+"""
+Cost of node state reads and writes for states of 1 KB to 1 MB.
+
+"before" is the old ``Node`` which stored state as given and returned
+``deepcopy`` of it on every read; "after" is ``Node`` which freezes
+state once on write and hands out the frozen value.
+
+    python -m benchmarks.state
+"""
+
+import json
+import timeit
+from copy import deepcopy
+
+from revigred.model.graph import Node
+from revigred.utils import title
+
+class LegacyNode(Node):
+    __slots__ = ()
+
+    def get_state(self):
+        return deepcopy(self._state)
+
+    def set_state(self, state):
+        self._state = state
+
+def make_state(size):
+    "Nested state of roughly `size` bytes of JSON"
+    item = {"name": "port", "title": "Port title", "tags": ["a", "b"], "value": 1.5}
+    count = max(1, size // len(json.dumps(item)))
+    return {"x": 10, "y": 20, "items": [dict(item, value=i) for i in range(count)]}
+
+def measure(node_class, state, reads=10):
+    node = node_class("NODE-1")
+    number = max(1, 20000 // len(state["items"]))
+    write = timeit.timeit(lambda: node.set_state(state), number=number) / number
+    read = timeit.timeit(node.get_state, number=number * reads) / (number * reads)
+    return write, read
+
+def main():
+    print(title("node state write / read, us"))
+    print("{:>8} {:>12} {:>12} {:>12} {:>12} {:>10}".format(
+        "size", "write before", "read before", "write after", "read after",
+        "speedup"))
+    for size in (1 << 10, 1 << 14, 1 << 17, 1 << 20):
+        state = make_state(size)
+        write_before, read_before = measure(LegacyNode, state)
+        write_after, read_after = measure(Node, state)
+        # a broadcast writes once and reads once
+        speedup = (write_before + read_before) / (write_after + read_after)
+        print("{:>7}K {:>12.1f} {:>12.1f} {:>12.1f} {:>12.2f} {:>9.1f}x".format(
+            size >> 10, write_before * 1e6, read_before * 1e6,
+            write_after * 1e6, read_after * 1e6, speedup))
+
+if __name__ == '__main__':
+    main()
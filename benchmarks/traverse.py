@@ -0,0 +1,62 @@
+"""
+Collecting everything below a node of a large graph.
+
+"before" is the recursive ``FSGraph.walk`` over ``find_links_startswith``,
+which copies links of every node into a list; "after" is
+``traversal.descendants`` over the live adjacency index. A wide tree and a
+single deep chain of the same number of links are measured.
+
+    python -m benchmarks.traverse [links]
+"""
+
+import sys
+import time
+
+from revigred.model import Graph, Link
+from revigred.model.graph.traversal import descendants
+from revigred.utils import title
+
+def walk(graph, id, nodes, links):
+    if id in nodes:
+        return
+    nodes[id] = id
+    for link in graph.find_links_startswith(id):
+        links[link] = link
+        walk(graph, link.end_id, nodes, links)
+
+def legacy(graph, id):
+    nodes = {}
+    walk(graph, id, nodes, {})
+    del nodes[id]
+    return set(nodes)
+
+def tree(graph, size, width=8):
+    for i in range(1, size + 1):
+        graph.add_link(Link(str((i - 1) // width), "out", str(i), "in"))
+
+def chain(graph, size):
+    for i in range(1, size + 1):
+        graph.add_link(Link(str(i - 1), "out", str(i), "in"))
+
+def measure(function, graph):
+    started = time.perf_counter()
+    try:
+        found = len(function(graph, "0"))
+    except RecursionError:
+        return None, "RecursionError"
+    return time.perf_counter() - started, found
+
+def main(size):
+    print(title("descendants over {} links".format(size)))
+    print("{:>8} {:>8} {:>10} {:>10}".format("", "shape", "time, s", "found"))
+    for shape, build in (("tree", tree), ("chain", chain)):
+        graph = Graph()
+        build(graph, size)
+        for name, function in (("before", legacy), ("after", descendants)):
+            elapsed, found = measure(function, graph)
+            elapsed = "-" if elapsed is None else "{:.2f}".format(elapsed)
+            print("{:>8} {:>8} {:>10} {:>10}".format(name, shape, elapsed, found))
+        del graph
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
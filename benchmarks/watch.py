@@ -0,0 +1,102 @@
+"""
+Cost of bringing a mirrored tree up to date after many files change.
+
+"before" sets the Root path again, which removes everything and scans
+the tree from scratch; "after" watches the tree and applies the
+changes reported by inotify. Half of the changed files are removed and
+as many new ones are created, like a checkout of another branch.
+
+    python -m benchmarks.watch [entries] [changed]
+"""
+
+import os
+import sys
+import time
+import uuid
+import asyncio
+import tempfile
+
+from benchmarks.scan import FakeOrigin, ScanModel, make_tree
+from revigred.model import User
+from revigred.utils import title
+
+class CountingUser(User):
+    "Counts frames and the writes they would be coalesced into"
+    loop = None
+    frames = 0
+    writes = 0
+    pending = False
+
+    def send_frame(self, frame):
+        cls = CountingUser
+        cls.frames += 1
+        if not cls.pending:
+            cls.pending = True
+            cls.writes += 1
+            cls.loop.call_soon(setattr, cls, "pending", False)
+
+class WatchModel(ScanModel):
+    user_factory = CountingUser
+    expand_depth = None
+    max_entries = None
+
+def files(path):
+    for folder, _, names in os.walk(path):
+        for name in names:
+            yield os.path.join(folder, name)
+
+def checkout(path, changed):
+    old = sorted(files(path))[:changed // 2]
+    for subpath in old:
+        os.remove(subpath)
+        open(subpath + ".new", "w").close()
+
+def settle(model, loop):
+    while model._scans:
+        loop.run_until_complete(next(iter(model._scans.values())).done)
+
+def run(path, changed, watch):
+    loop = asyncio.new_event_loop()
+    model = WatchModel(loop=loop, watch=watch)
+    CountingUser.loop = loop
+    user = model.create_new_user()
+    id = "NODE-" + uuid.uuid4().hex
+    model.on_nodeCreated(FakeOrigin(user, 0), id)
+    model.on_nodeStateChanged(FakeOrigin(user, 1), id, {"path": path})
+    settle(model, loop)
+    nodes = len(model.graph._nodes_by_id)
+    CountingUser.frames = CountingUser.writes = 0
+
+    started = time.perf_counter()
+    checkout(path, changed)
+    if watch:
+        # until watcher goes quiet
+        while True:
+            count = CountingUser.frames
+            loop.run_until_complete(asyncio.sleep(model.watcher_factory.delay * 3))
+            if count == CountingUser.frames and count:
+                break
+    else:
+        model.on_nodeStateChanged(FakeOrigin(user, 2), id, {"path": path})
+        settle(model, loop)
+    elapsed = time.perf_counter() - started
+    result = (elapsed, CountingUser.frames, CountingUser.writes,
+        len(model.graph._nodes_by_id) - nodes)
+    model.close()
+    loop.close()
+    return result
+
+def main(entries, changed):
+    print(title("sync of {} changed files in tree of {}".format(changed, entries)))
+    print("{:>8} {:>10} {:>10} {:>8} {:>8}".format(
+        "", "total, s", "frames", "writes", "nodes"))
+    for name, watch in (("before", False), ("after", True)):
+        with tempfile.TemporaryDirectory() as path:
+            make_tree(path, entries)
+            elapsed, frames, writes, nodes = run(path, changed, watch)
+        print("{:>8} {:>10.2f} {:>10} {:>8} {:>+8}".format(
+            name, elapsed, frames, writes, nodes))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
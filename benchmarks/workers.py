@@ -0,0 +1,145 @@
+"""
+Throughput of graph events served by supervised worker processes.
+
+Every connection opens a document with its request line, then sends
+``changeState`` events, each answered once the model has broadcast it to
+all connections of that document. The server side is ``Supervisor`` with
+``Worker`` processes, connections which land on a worker not owning their
+document are handed over. "before" is one worker, like the single loop of
+``__main__``. Client processes generate the load; for a fair picture they
+need cores of their own, so run it where there are at least twice as many
+cores as the largest worker count.
+
+    python -m benchmarks.workers [seconds] [workers...]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import multiprocessing
+
+from revigred.codec import JSONCodec
+from revigred.model import Documents, GraphModel, Origin
+from revigred.model.documents import document_name
+from revigred.supervisor import Supervisor, Worker
+from revigred.utils import title
+
+DOCUMENTS = 64
+CONNECTIONS = 256
+NODES = 16
+
+class EventProtocol(asyncio.Protocol):
+    "Turns lines into state changes of the requested document"
+    codec = JSONCodec()
+
+    def __init__(self, documents, loop):
+        self.documents = documents
+        self.loop = loop
+        self.buffer = b""
+        self.user = None
+        self.write_buffer_size = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        if self.user is not None:
+            self.user.disconnect()
+
+    def data_received(self, data):
+        self.buffer += data
+        if self.user is None:
+            head, sep, self.buffer = self.buffer.partition(b"\r\n\r\n")
+            if not sep:
+                self.buffer = head
+                return
+            path = head.split(b"\r\n")[0].split()[1].decode()
+            model = self.documents.get(document_name(path))
+            self.user = model.create_new_user()
+            self.user.connect(self)
+            if not model.graph.has_node("NODE-0"):
+                for i in range(NODES):
+                    model.on_nodeCreated(Origin(self.user, 0), "NODE-{}".format(i))
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            serial = int(line)
+            self.user.model.on_nodeStateChanged(Origin(self.user, 0),
+                "NODE-{}".format(serial % NODES), {"serial": serial, "x": 10, "y": 20})
+        if lines:
+            self.transport.write(b"ok\n" * len(lines))
+
+    def sendFrame(self, frame):
+        frame.encode(self.codec, self.codec.encode_frame)
+
+    def sendFrames(self, frames):
+        self.codec.encode_batch([frame.encode(self.codec, self.codec.encode_frame)
+            for frame in frames])
+
+def serve(index, listener, channels):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    documents = Documents(GraphModel, loop=loop)
+    worker = Worker(index, listener, channels,
+        lambda: EventProtocol(documents, loop), loop)
+    worker.start()
+    loop.run_forever()
+
+def client(port, connections, seconds, result):
+    "Sends events one by one over each connection, counts answered ones"
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    done = 0
+    deadline = time.time() + seconds
+
+    async def session(number):
+        nonlocal done
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        path = "/doc-{}".format(number % DOCUMENTS)
+        writer.write("GET {} HTTP/1.1\r\n\r\n".format(path).encode())
+        serial = 0
+        while time.time() < deadline:
+            writer.write("{}\n".format(serial).encode())
+            await reader.readline()
+            serial += 1
+            done += 1
+        writer.close()
+
+    loop.run_until_complete(asyncio.gather(
+        *[session(number) for number in connections]))
+    loop.close()
+    result.put(done)
+
+def run(workers, clients, seconds):
+    supervisor = Supervisor("127.0.0.1", 0, workers, serve)
+    supervisor.start()
+    time.sleep(0.5)
+    result = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client, args=(supervisor.port,
+            range(index, CONNECTIONS, clients), seconds, result))
+        for index in range(clients)]
+    for process in processes:
+        process.start()
+    done = sum(result.get(timeout=seconds + 60) for _ in processes)
+    for process in processes:
+        process.join()
+    supervisor.stop()
+    supervisor.wait()
+    return done / seconds
+
+def main(seconds, counts):
+    cores = os.cpu_count()
+    clients = max(1, cores // 2)
+    print(title("events/s over {} connections, {} documents, {} cores".format(
+        CONNECTIONS, DOCUMENTS, cores)))
+    print("{:>16} {:>12} {:>10}".format("", "events/s", "speedup"))
+    base = None
+    for workers in counts:
+        rate = run(workers, clients, seconds)
+        base = base or rate
+        name = "before" if workers == 1 else "{} workers".format(workers)
+        print("{:>16} {:>12.0f} {:>10.2f}".format(name, rate, rate / base))
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0,
+        [int(arg) for arg in sys.argv[2:]] or [1, 2, 4])
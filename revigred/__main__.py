@@ -8,12 +8,16 @@ if __name__ == '__main__' and __package__ is None:
 
 import sys
 import asyncio
+from functools import partial
 from datetime import datetime
 
 from metaconfig import Config
 
 from revigred.reloader import run_with_reloader
 from revigred.protocol import ServerFactory
+from revigred.model import Documents
+from revigred.model.graph.replica import Primary, ReplicaModel
+from revigred.supervisor import Supervisor, Worker
 from revigred.utils import title
 
 def parse_args():
@@ -26,6 +30,10 @@ def parse_args():
     parser.add_argument('-c', '--config', 
         dest='config', help='path to config file (should be yaml)')
 
+    parser.add_argument('-w', '--workers', type=int, default=None,
+        dest='workers', help='number of worker processes, documents are '
+            'spread among them by requested path')
+
     return parser.parse_args()
 
 def main():
@@ -38,19 +46,44 @@ def main():
     config.load(args.config)
 
     server = config.get_dependency("server")
+    model = server.model
     host = server.host
     port = server.port
     logger = server.logging.logger
     handler = server.logging.handler
+    workers = args.workers or server.get("workers", 1)
+
+    if workers > 1:
+        # every document gets its own model of configured kind
+        document = server.get("document", type(model))
+        with handler.applicationbound():
+            logger.info("Starting {} workers at http://{}:{}".format(
+                workers, host, port))
+        supervisor = Supervisor(host, port, workers,
+            partial(serve_worker, document, server))
+        try:
+            supervisor.run()
+        finally:
+            print("Stopping server.")
+        return
 
     with handler.applicationbound():
         logger.info("Starting server at http://{}:{}".format(host, port))
 
         loop = asyncio.get_event_loop()
 
+        primary = None
+        if server.get("replicas") is not None:
+            # replica processes follow this model and serve their own users
+            primary = Primary(model, server.replicas, loop=loop)
+            loop.run_until_complete(primary.start())
+            logger.info("Serving replicas at {}".format(server.replicas))
+        if isinstance(model, ReplicaModel):
+            loop.run_until_complete(model.connect())
+
         ws_url = "ws://{}:{}".format(host, port)
         factory = ServerFactory(ws_url, 
-            loop=loop, model=server.model, logger=logger, debug=False)
+            loop=loop, model=model, logger=logger, debug=False)
 
         coro = loop.create_server(factory, host, port)
         server = loop.run_until_complete(coro)
@@ -63,8 +96,34 @@ def main():
             sys.exit(3)
         finally:
             server.close()
+            if primary is not None:
+                primary.close()
+            model.close()
             loop.close()
             print("Stopping server.")
 
+def serve_worker(document, server, index, listener, channels):
+    logger = server.logging.logger
+    with server.logging.handler.applicationbound():
+        logger.info("Worker {} started".format(index))
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        documents = Documents(document, loop=loop)
+
+        ws_url = "ws://{}:{}".format(server.host, server.port)
+        factory = ServerFactory(ws_url,
+            loop=loop, documents=documents, logger=logger, debug=False)
+
+        worker = Worker(index, listener, channels, factory, loop)
+        worker.start()
+        try:
+            loop.run_forever()
+        finally:
+            worker.stop()
+            documents.close()
+            loop.close()
+            logger.info("Worker {} stopped".format(index))
+
 if __name__ == '__main__':
     run_with_reloader(main)
@@ -0,0 +1,148 @@
+'''
+Wire codecs negotiated through WebSocket subprotocols.
+'''
+
+__all__ = [
+    'Codec',
+    'JSONCodec',
+    'MsgPackCodec',
+    'CODECS',
+    'select_codec',
+    ]
+
+import re
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class Codec(object):
+    """
+    Converts messages `(name, args, kwargs)` to payloads and back.
+    Codecs are stateless, so one instance serves every connection and
+    frames encoded by it can be shared between them.
+
+    Subclasses provide `encode(message)`, `decode(payload)` and
+    `encode_batch(parts)`, which joins already encoded messages into a
+    single payload.
+    """
+    subprotocol = None
+    binary = False
+
+    def encode_frame(self, frame):
+        return frame.encode(self, self._encode_frame)
+
+    def _encode_frame(self, frame):
+        return self.encode(frame.message)
+
+    def __repr__(self):
+        return "{}()".format(self.__class__.__name__)
+
+class JSONCodec(Codec):
+    subprotocol = "revigred.json"
+    binary = False
+
+    def encode(self, message):
+        return json.dumps(message).encode("utf-8")
+
+    def encode_batch(self, parts):
+        return b"[" + b",".join(parts) + b"]"
+
+    def decode(self, payload):
+        return json.loads(payload.decode("utf-8"))
+
+class MsgPackCodec(Codec):
+    """
+    MessagePack with a static string table. Command names and common keys
+    go as one-byte symbols, `NODE-<32 hex>` and `USER-<32 hex>` identifiers
+    as 16 raw bytes. The table is fixed, not per connection, so encoded
+    frames stay shareable between connections.
+    """
+    subprotocol = "revigred.msgpack"
+    binary = True
+
+    SYMBOL = 1
+    IDENTIFIER = 2
+
+    SYMBOLS = (
+        "nop", "auth", "rev", "origin", "id", "name", "title", "path",
+        "__type__", "Root", "Folder", "File", "in",
+        "createNode", "removeNode", "changeState", "changePorts",
+        "addLink", "removeLink",
+        "nodeCreated", "nodeRemoved", "nodeStateChanged",
+        "linkAdded", "linkRemoved",
+        # appended only, codes above must stay put
+        "patchState", "nodeStatePatched",
+        "addPort", "removePort", "movePort",
+        "expandNode", "collapseNode", "expanded", "truncated",
+        "since", "session",
+        )
+    PREFIXES = ("NODE", "USER")
+
+    IDENTIFIER_RE = re.compile(r"(NODE|USER)-([0-9a-f]{32})")
+
+    def __init__(self):
+        self._codes = {symbol: code for code, symbol in enumerate(self.SYMBOLS)}
+        self._prefixes = {prefix: code for code, prefix in enumerate(self.PREFIXES)}
+
+    def _compact(self, value):
+        kind = type(value)
+        if kind is str:
+            code = self._codes.get(value)
+            if code is not None:
+                return msgpack.ExtType(self.SYMBOL, bytes((code,)))
+            match = self.IDENTIFIER_RE.fullmatch(value)
+            if match is not None:
+                prefix, digits = match.groups()
+                data = bytes((self._prefixes[prefix],)) + bytes.fromhex(digits)
+                return msgpack.ExtType(self.IDENTIFIER, data)
+            return value
+        if isinstance(value, (list, tuple)):
+            return [self._compact(item) for item in value]
+        if isinstance(value, dict):
+            return {self._compact(key): self._compact(item)
+                for key, item in value.items()}
+        return value
+
+    def _expand(self, code, data):
+        if code == self.SYMBOL:
+            return self.SYMBOLS[data[0]]
+        if code == self.IDENTIFIER:
+            return self.PREFIXES[data[0]] + "-" + data[1:].hex()
+        return msgpack.ExtType(code, data)
+
+    def encode(self, message):
+        return msgpack.packb(self._compact(message), use_bin_type=True)
+
+    def encode_batch(self, parts):
+        size = len(parts)
+        if size < 16:
+            header = bytes((0x90 | size,))
+        elif size < 0x10000:
+            header = struct.pack(">BH", 0xdc, size)
+        else:
+            header = struct.pack(">BI", 0xdd, size)
+        return header + b"".join(parts)
+
+    def decode(self, payload):
+        return msgpack.unpackb(payload, raw=False,
+            ext_hook=self._expand, strict_map_key=False)
+
+CODECS = [JSONCodec()]
+if msgpack is not None:
+    CODECS.append(MsgPackCodec())
+
+def select_codec(protocols, codecs=CODECS):
+    """
+    Picks codec for the first of `protocols` offered by client which is
+    supported. Falls back to the first codec when nothing matches.
+    """
+    supported = {codec.subprotocol: codec for codec in codecs}
+    for protocol in protocols:
+        codec = supported.get(protocol)
+        if codec is not None:
+            return codec
+    return codecs[0]
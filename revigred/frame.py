@@ -0,0 +1,36 @@
+'''
+Holding Frame class.
+'''
+
+__all__ = [
+    'Frame',
+    ]
+
+class Frame(object):
+    """
+    Outgoing message which may be delivered to many recipients.
+    Each encoder is applied to the message at most once, so the payload
+    is shared between all connections using the same encoder.
+    """
+
+    def __init__(self, name, args=(), kwargs=None):
+        self._message = (name, args, kwargs or {})
+        self._encoded = {}
+
+    @property
+    def name(self):
+        return self._message[0]
+
+    @property
+    def message(self):
+        return self._message
+
+    def encode(self, key, encoder):
+        "Returns `encoder(frame)` cached under `key`"
+        try:
+            return self._encoded[key]
+        except KeyError:
+            return self._encoded.setdefault(key, encoder(self))
+
+    def __repr__(self):
+        return "{}{}".format(self.__class__.__name__, self._message)
@@ -0,0 +1,150 @@
+'''
+Immutable containers for values shared without copying.
+'''
+
+__all__ = [
+    'FrozenError',
+    'FrozenDict',
+    'FrozenList',
+    'freeze',
+    'thaw',
+    'PatchError',
+    'validate_patch',
+    'apply_patch',
+    ]
+
+class FrozenError(TypeError): pass
+class PatchError(ValueError): pass
+
+def _readonly(self, *args, **kwargs):
+    raise FrozenError("{} is immutable".format(self.__class__.__name__))
+
+class FrozenDict(dict):
+    """
+    This class is derived from dict, so it is serialized as usual,
+    but refuses modification. Copies of it are the instance itself.
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, dict.__repr__(self))
+
+class FrozenList(list):
+    "Read-only counterpart of list, see `FrozenDict`"
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = clear = extend = insert = pop = remove = reverse = sort = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return self.__class__, (list(self),)
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, list.__repr__(self))
+
+SCALARS = frozenset((str, int, float, bool, bytes, type(None)))
+
+def freeze(value):
+    """
+    Returns immutable version of `value` built from dicts, lists and
+    scalars. Already frozen parts are reused as they are, so a new value
+    made from an old one only pays for what has changed.
+    """
+    kind = type(value)
+    # exact types first, state decoded from messages consists of them only
+    if kind is dict:
+        return FrozenDict({key: item if type(item) in SCALARS else freeze(item)
+            for key, item in value.items()})
+    if kind is list or kind is tuple:
+        return FrozenList([item if type(item) in SCALARS else freeze(item)
+            for item in value])
+    if kind in SCALARS or isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return FrozenList([freeze(item) for item in value])
+    return value
+
+def thaw(value):
+    "Returns mutable deep copy of frozen `value`"
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [thaw(item) for item in value]
+    return value
+
+# ____________________________________________________________________________ #
+
+def validate_patch(patch):
+    """
+    Checks shape of `patch`, a list of `[path, value]` operations setting
+    value and `[path]` operations deleting it. Path is a non-empty list
+    of dict keys and list indices.
+    """
+    if not isinstance(patch, list):
+        raise PatchError("patch must be a list")
+    for operation in patch:
+        if not isinstance(operation, list) or len(operation) not in (1, 2):
+            raise PatchError("bad operation {!r}".format(operation))
+        path = operation[0]
+        if not isinstance(path, list) or not path:
+            raise PatchError("bad path {!r}".format(path))
+        for key in path:
+            if type(key) is not str and type(key) is not int:
+                raise PatchError("bad path {!r}".format(path))
+
+def apply_patch(value, patch):
+    """
+    Returns frozen `value` with `patch` applied. Containers along changed
+    paths are copied, everything else is shared with `value`. Setting
+    list index equal to its length appends.
+    """
+    validate_patch(patch)
+    for operation in patch:
+        value = _apply(value, operation[0], operation[1:])
+    return value
+
+def _apply(value, path, operand):
+    key = path[0]
+    last = len(path) == 1
+    if isinstance(value, dict):
+        if type(key) is not str or (key not in value and not (last and operand)):
+            raise PatchError("no key {!r}".format(key))
+        result = dict(value)
+    elif isinstance(value, list):
+        size = len(value)
+        if type(key) is not int or not (0 <= key < size or
+                (key == size and last and operand)):
+            raise PatchError("no index {!r}".format(key))
+        result = list(value)
+        if key == size:
+            result.append(None)
+    else:
+        raise PatchError("{!r} is not a container".format(key))
+    if not last:
+        result[key] = _apply(value[key], path[1:], operand)
+    elif operand:
+        result[key] = freeze(operand[0])
+    else:
+        del result[key]
+    return FrozenDict(result) if isinstance(value, dict) else FrozenList(result)
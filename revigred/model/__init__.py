@@ -1,7 +1,9 @@
 from .users import *
+from .documents import *
 from .graph import *
 
 __all__ = ([]
     + users.__all__
+    + documents.__all__
     + graph.__all__
     )
@@ -0,0 +1,81 @@
+import re
+import asyncio
+from functools import partial
+
+__all__ = [
+    "Documents",
+    "document_name",
+    ]
+
+NAME_RE = re.compile(r"[\w.-]*(/[\w.-]+)*")
+
+def document_name(path):
+    "Returns name of graph document requested with URL `path`"
+    return path.split("?", 1)[0].strip("/")
+
+class Documents(object):
+    """
+    Graph documents by name. Each one has its own model, made by calling
+    `factory` without arguments on first use, and closed once nobody has
+    used it for `idle_timeout` seconds. At most `max_documents` are open,
+    requests for more ones or for malformed names raise ValueError.
+    """
+    max_documents = 1000
+    max_name = 256
+    idle_timeout = 60.0
+
+    def __init__(self, factory, loop=None):
+        self._factory = factory
+        self._loop = loop
+        self._models = {}
+        self._timers = {}
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    def __len__(self):
+        return len(self._models)
+
+    def __iter__(self):
+        return iter(self._models)
+
+    def __contains__(self, name):
+        return name in self._models
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is None:
+            if len(name) > self.max_name or not NAME_RE.fullmatch(name):
+                raise ValueError("document name {!r} is malformed".format(name))
+            if len(self._models) >= self.max_documents:
+                raise ValueError("too many documents are open")
+            model = self._models[name] = self._factory()
+            model.emptied = partial(self._wait, name)
+        # the model is closed if no user joins it after all
+        self._wait(name)
+        return model
+
+    def _wait(self, name):
+        timer = self._timers.get(name)
+        if timer is not None:
+            timer.cancel()
+        self._timers[name] = self.loop.call_later(
+            self.idle_timeout, self._expire, name)
+
+    def _expire(self, name):
+        del self._timers[name]
+        model = self._models[name]
+        if model.idle:
+            del self._models[name]
+            model.close()
+
+    def close(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for model in self._models.values():
+            model.close()
+        self._models.clear()
@@ -1,9 +1,15 @@
 from .model import *
 from .storage import *
+from .journal import *
+from .checkpoint import *
 from .events import *
+from .client import *
 
 __all__ = ([]
     + model.__all__
     + storage.__all__
+    + journal.__all__
+    + checkpoint.__all__
     + events.__all__
+    + client.__all__
     )
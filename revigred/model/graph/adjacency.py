@@ -0,0 +1,130 @@
+from itertools import count
+
+__all__ = [
+    "Adjacency",
+    ]
+
+class Adjacency(object):
+    """
+    Links indexed by the ports they connect. Nodes and `(node, port)`
+    pairs are interned to integers while they have links. Every entry
+    is dropped together with the last link which needs it, so lookups
+    of unknown nodes and removed links leave nothing behind.
+    """
+
+    def __init__(self):
+        self._serial = count()
+        self._node_of = {}
+        self._port_of = {}
+        self._ports = {}
+        self._outgoing = {}
+        self._incoming = {}
+
+    def __len__(self):
+        return sum(len(links) for links in self._outgoing.values())
+
+    def _acquire(self, id, name):
+        node = self._node_of.get(id)
+        if node is None:
+            node = self._node_of[id] = next(self._serial)
+            self._ports[node] = {}
+        port = self._port_of.get((node, name))
+        if port is None:
+            port = self._port_of[(node, name)] = next(self._serial)
+            self._ports[node][port] = name
+        return port
+
+    def _release(self, id, name, port):
+        if port in self._outgoing or port in self._incoming:
+            return
+        node = self._node_of[id]
+        del self._port_of[(node, name)]
+        ports = self._ports[node]
+        del ports[port]
+        if not ports:
+            del self._ports[node]
+            del self._node_of[id]
+
+    def _find(self, id, name):
+        node = self._node_of.get(id)
+        if node is None:
+            return None
+        return self._port_of.get((node, name))
+
+    def add(self, link):
+        start = self._acquire(link.start_id, link.start_name)
+        end = self._acquire(link.end_id, link.end_name)
+        self._outgoing.setdefault(start, {})[end] = link
+        self._incoming.setdefault(end, {})[start] = link
+
+    def remove(self, start_id, start_name, end_id, end_name):
+        "Removes link in O(1), raises `KeyError` if there is none"
+        start = self._find(start_id, start_name)
+        end = self._find(end_id, end_name)
+        links = self._outgoing.get(start)
+        if links is None or end not in links:
+            raise KeyError((start_id, start_name, end_id, end_name))
+        link = links.pop(end)
+        if not links:
+            del self._outgoing[start]
+        links = self._incoming[end]
+        del links[start]
+        if not links:
+            del self._incoming[end]
+        self._release(start_id, start_name, start)
+        if end != start:
+            self._release(end_id, end_name, end)
+        return link
+
+    def _collect(self, index, id):
+        node = self._node_of.get(id)
+        if node is None:
+            return []
+        result = []
+        for port in self._ports[node]:
+            links = index.get(port)
+            if links is not None:
+                result.extend(links.values())
+        return result
+
+    def _iterate(self, index, id, names):
+        node = self._node_of.get(id)
+        if node is None:
+            return
+        for port, name in self._ports[node].items():
+            if names is not None and name not in names:
+                continue
+            links = index.get(port)
+            if links is not None:
+                yield from links.values()
+
+    def iter_outgoing(self, id, names=None):
+        """
+        Yields links starting at node `id`, at ports in `names` if given,
+        without copying. Links must not change until it is exhausted.
+        """
+        return self._iterate(self._outgoing, id, names)
+
+    def iter_incoming(self, id, names=None):
+        "Yields links ending at node `id`, see `iter_outgoing`"
+        return self._iterate(self._incoming, id, names)
+
+    def outgoing(self, id):
+        "Returns links starting at node `id`"
+        return self._collect(self._outgoing, id)
+
+    def incoming(self, id):
+        "Returns links ending at node `id`"
+        return self._collect(self._incoming, id)
+
+    def starting_at(self, id, name):
+        "Returns links starting at port `name` of node `id`"
+        return list(self._outgoing.get(self._find(id, name), {}).values())
+
+    def fan_out(self, id, name):
+        "Number of links starting at port `name` of node `id`"
+        return len(self._outgoing.get(self._find(id, name), ()))
+
+    def fan_in(self, id, name):
+        "Number of links ending at port `name` of node `id`"
+        return len(self._incoming.get(self._find(id, name), ()))
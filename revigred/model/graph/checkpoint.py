@@ -0,0 +1,69 @@
+import gc
+import os
+import mmap
+import pickle
+
+from .journal import Journal
+
+__all__ = [
+    "read_checkpoint",
+    "write_checkpoint",
+    "load_checkpoint",
+    "compact",
+    ]
+
+MAGIC = b"RVGRCKP1"
+
+def write_checkpoint(path, rev, nodes, links):
+    "Atomically replaces checkpoint at `path` with graph dump"
+    temp = path + ".tmp"
+    with open(temp, "wb") as stream:
+        stream.write(MAGIC)
+        pickle.dump((rev, nodes, links), stream, protocol=pickle.HIGHEST_PROTOCOL)
+        stream.flush()
+        os.fsync(stream.fileno())
+    os.replace(temp, path)
+
+def read_checkpoint(path):
+    "Returns `(rev, nodes, links)` decoded straight from memory-mapped file"
+    with open(path, "rb") as stream:
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            if view[:len(MAGIC)] != MAGIC:
+                raise ValueError("{} is not a graph checkpoint".format(path))
+            data = memoryview(view)
+            payload = data[len(MAGIC):]
+            try:
+                return pickle.loads(payload)
+            finally:
+                payload.release()
+                data.release()
+
+def load_checkpoint(graph, path):
+    """
+    Fills `graph` from checkpoint at `path`. Garbage collector is paused
+    meanwhile, its passes over millions of fresh objects would dominate.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        graph.load(*read_checkpoint(path))
+    finally:
+        if enabled:
+            gc.enable()
+
+def compact(model_class, path, segment):
+    """
+    Folds journal `segment` into checkpoint at `path` and removes the
+    segment. Meant to run in a worker process, off the serving loop.
+    Returns revision of the new checkpoint.
+    """
+    model = model_class()
+    if os.path.exists(path):
+        load_checkpoint(model.graph, path)
+    for rev, name, args in Journal.read(segment):
+        if rev >= model.graph.next_rev:
+            model.replay(rev, name, *args)
+    rev, nodes, links = model.graph.dump()
+    write_checkpoint(path, rev, nodes, links)
+    os.remove(segment)
+    return rev
@@ -1,7 +1,20 @@
 from functools import partial
+from itertools import islice
+from collections import defaultdict, deque, OrderedDict
 from enum import Enum
 from sentinels import NOTHING
 
+from revigred.utils import DocDescribed
+from revigred.codec import JSONCodec
+from revigred.frozen import apply_patch
+
+__all__ = [
+    "ClientGraph",
+    "ClientGraphModel",
+    "InvalidCommand",
+    "InvalidRevision",
+    ]
+
 class InvalidCommand(DocDescribed, ValueError):
     "Command {name} was not found"
     def __init__(self, name):
@@ -21,35 +34,37 @@ class Existence(Enum):
     CREATED = True
     REMOVED = False
 
-class Cell(object):
-    def __init__(self):
-        self._value = NOTHING
-
-    @property
-    def empty(self):
-        return self._value is NOTHING
-
-    def set(self, value):
-        self._value = value
-
-    def get(self):
-        return self._value
-
 class Branch(object):
-    cell_factory = Cell
+    "Values by revision, revisions only grow, so the last one is on top"
     def __init__(self):
-        self._cells = defaultdict(self.cell_factory)
+        self._values = OrderedDict()
+
+    def __len__(self):
+        return len(self._values)
 
     def add(self, rev, value):
-        assert self._cells[rev].empty
-        self._cells[rev].set(value)
+        assert rev not in self._values
+        self._values[rev] = value
 
     def get(self, rev):
-        assert not self._cells[rev].empty
-        return self._cells[rev].get()
+        return self._values[rev]
 
     def top(self):
-        return max(self._cells)
+        return next(reversed(self._values))
+
+    @property
+    def empty(self):
+        return not self._values
+
+    def compact(self, rev):
+        "Drops values older than `rev` except the latest of them"
+        values = self._values
+        while len(values) > 1:
+            keys = iter(values)
+            first = next(keys)
+            if next(keys) > rev:
+                break
+            del values[first]
 
 class Repo(object):
     branch_factory = Branch
@@ -58,9 +73,10 @@ class Repo(object):
         self._conflict = self.branch_factory()
         self._unresolved = deque()
         self._receivers = []
+        self._current = NOTHING
 
     def resolve(self, rev, origin, value):
-        self._their.add(rev, value)
+        self.store(rev, value)
         expected = self._unresolved.popleft()
         if expected != origin:
             raise InvalidRevision(origin, expected)
@@ -71,6 +87,47 @@ class Repo(object):
 
     def store(self, rev, value):
         self._their.add(rev, value)
+        self._current = value
+
+    def current(self):
+        "Latest value confirmed by server"
+        return self._current
+
+    def compact(self, rev):
+        """
+        Forgets confirmed values older than `rev` but the current one, and
+        own changes once none is pending. Tells whether the entity was
+        removed before `rev` and there is nothing else to remember.
+        """
+        self._their.compact(rev)
+        if not self._unresolved:
+            if not self._conflict.empty:
+                self._conflict = self.branch_factory()
+            return self._current is Existence.REMOVED and self._their.top() < rev
+        return False
+
+    @property
+    def settled(self):
+        "Nothing is left to compact or forget until it changes again"
+        return (not self._unresolved and len(self._their) <= 1 and
+            self._current is not Existence.REMOVED)
+
+    def keep_pending(self, other):
+        "Takes over own changes of `other` which server has not answered yet"
+        self._conflict = other._conflict
+        self._unresolved = other._unresolved
+
+    def settle(self, rev, origin, value):
+        "Resolves own pending change `origin` if it is the next one, stores otherwise"
+        if origin is not None and self._unresolved and self._unresolved[0] == origin:
+            self.resolve(rev, origin, value)
+        else:
+            self.store(rev, value)
+
+    def discard(self, origin):
+        "Forgets own pending change `origin` rejected by server"
+        if self._unresolved and self._unresolved[0] == origin:
+            self._unresolved.popleft()
 
     def _publish(self, event, *args, **kwargs):
         for callback in self._receivers:
@@ -86,60 +143,285 @@ class Repo(object):
             return
         self._receivers.remove(callback)
 
+class PortList(object):
+    """
+    Ports of a node as received, in order and by name, which port deltas
+    edit in place. Appends and removals are O(1), insertions and moves
+    O(distance from the end), like server side `Ports`.
+    """
+    __slots__ = ("_ports",)
+
+    def __init__(self, ports=()):
+        self._ports = OrderedDict((port["name"], port) for port in ports)
+
+    def __len__(self):
+        return len(self._ports)
+
+    def __iter__(self):
+        return iter(self._ports.values())
+
+    def insert(self, index, port):
+        size = len(self._ports)
+        self._ports[port["name"]] = port
+        if index is not None and index < size:
+            for key in list(islice(self._ports, max(index, 0), size)):
+                self._ports.move_to_end(key)
+
+    def remove(self, name):
+        return self._ports.pop(name)
+
+    def move(self, name, index):
+        self.insert(index, self.remove(name))
+
+class Repos(dict):
+    "Repos of entities by key, remembers ones written since last compaction"
+    def __init__(self, factory):
+        super().__init__()
+        self._factory = factory
+        self._dirty = set()
+
+    def __missing__(self, key):
+        repo = self[key] = self._factory()
+        return repo
+
+    def write(self, key):
+        self._dirty.add(key)
+        return self[key]
+
+    def compact(self, rev):
+        """
+        Compacts written repos, drops and returns keys of removed entities.
+        Repos which are not settled yet are looked at next time again.
+        """
+        removed = []
+        dirty = set()
+        for key in self._dirty:
+            repo = self.get(key)
+            if repo is None:
+                continue
+            if repo.compact(rev):
+                del self[key]
+                removed.append(key)
+            elif not repo.settled:
+                dirty.add(key)
+        self._dirty = dirty
+        return removed
+
 class ClientGraph(object):
+    """
+    Keeps revisions confirmed by server for the last `history` of them,
+    every `history` revisions older ones are compacted away and entities
+    removed before that are forgotten.
+    """
     repo_factory = Repo
+    repos_factory = Repos
+    history = 1024
+
     def __init__(self):
         self._rev = 0
-        self._nodes = defaultdict(self.repo_factory)
-        self._ports = defaultdict(self.repo_factory)
-        self._states = defaultdict(self.repo_factory)
-        self._links = defaultdict(self.repo_factory)
+        self._reset(0)
+
+    def _reset(self, rev):
+        self._nodes = self.repos_factory(self.repo_factory)
+        self._ports = self.repos_factory(self.repo_factory)
+        self._states = self.repos_factory(self.repo_factory)
+        self._links = self.repos_factory(self.repo_factory)
+        self._links_by_node = defaultdict(set)
+        self._compacted = rev
+
+    def _link(self, key):
+        self._links_by_node[key[0]].add(key)
+        self._links_by_node[key[2]].add(key)
+        return self._links.write(key)
+
+    def _unlink(self, key):
+        for id in (key[0], key[2]):
+            keys = self._links_by_node.get(id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._links_by_node[id]
+
+    def _cascade(self, id):
+        "Returns repos of links attached to removed node `id`"
+        keys = self._links_by_node.pop(id, ())
+        for key in keys:
+            other = key[2] if key[0] == id else key[0]
+            if other in self._links_by_node:
+                self._links_by_node[other].discard(key)
+        return [self._links.write(key) for key in keys]
+
+    def confirmed(self, rev):
+        "Server revision `rev` arrived, compacts history if it is time"
+        if rev < self._compacted + self.history:
+            return
+        self._compacted = rev
+        horizon = rev - self.history
+        for id in self._nodes.compact(horizon):
+            self._ports.pop(id, None)
+            self._states.pop(id, None)
+        self._ports.compact(horizon)
+        self._states.compact(horizon)
+        for key in self._links.compact(horizon):
+            self._unlink(key)
 
     # ======================================================================== #
 
     def create_node(self, id):
-        node = self._nodes[id]
+        node = self._nodes.write(id)
         node.initiate(self._rev, Existence.CREATED)
 
     def remove_node(self, id):
-        node = self._nodes[id]
+        node = self._nodes.write(id)
         node.initiate(self._rev, Existence.REMOVED)
 
     def add_link(self, start_id, start_name, end_id, end_name):
         key = (start_id, start_name, end_id, end_name)
-        link = self._links[key]
+        link = self._link(key)
         link.initiate(self._rev, Existence.CREATED)
 
     def remove_link(self, start_id, start_name, end_id, end_name):
         key = (start_id, start_name, end_id, end_name)
-        link = self._links[key]
+        link = self._link(key)
         link.initiate(self._rev, Existence.REMOVED)
 
     # ======================================================================== #
 
+    def load(self, nodes, links, rev):
+        """
+        Replaces known contents with server snapshot taken before `rev`.
+        Own changes still pending are kept, their answers come later.
+        """
+        previous = (self._nodes, self._ports, self._states, self._links)
+        self._reset(rev)
+        if rev > 0:
+            for id, ports, state in nodes:
+                self._nodes.write(id).store(rev - 1, Existence.CREATED)
+                self._ports.write(id).store(rev - 1, ports)
+                self._states.write(id).store(rev - 1, state)
+            for key in links:
+                self._link(tuple(key)).store(rev - 1, Existence.CREATED)
+        current = (self._nodes, self._ports, self._states, self._links)
+        for repos, old in zip(current, previous):
+            for key, repo in old.items():
+                if repo._unresolved:
+                    if repos is self._links:
+                        self._link(key).keep_pending(repo)
+                    else:
+                        repos.write(key).keep_pending(repo)
+
+    def batch_applied(self, events, rev, origin):
+        "Applies events of one transaction, the last value per entity wins"
+        values = {}
+        for name, args in events:
+            if name == "createNode":
+                values[self._nodes.write(args[0])] = Existence.CREATED
+            elif name == "removeNode":
+                values[self._nodes.write(args[0])] = Existence.REMOVED
+                for link in self._cascade(args[0]):
+                    if link.current() is not Existence.REMOVED:
+                        values[link] = Existence.REMOVED
+            elif name == "changePorts":
+                values[self._ports.write(args[0])] = args[1]
+            elif name == "changeState":
+                values[self._states.write(args[0])] = args[1]
+            elif name == "patchState":
+                repo = self._states.write(args[0])
+                state = values.get(repo, NOTHING)
+                if state is NOTHING:
+                    state = repo.current()
+                values[repo] = apply_patch(state, args[1])
+            elif name == "addLink":
+                values[self._link(tuple(args))] = Existence.CREATED
+            elif name == "removeLink":
+                values[self._link(tuple(args))] = Existence.REMOVED
+            elif name == "showNode":
+                id, ports, state, links = args
+                values[self._nodes.write(id)] = Existence.CREATED
+                values[self._ports.write(id)] = ports
+                values[self._states.write(id)] = state
+                for key in links:
+                    values[self._link(tuple(key))] = Existence.CREATED
+            elif name == "hideNode":
+                values[self._nodes.write(args[0])] = Existence.REMOVED
+        for repo, value in values.items():
+            repo.settle(rev, origin, value)
+
+    def batch_rejected(self, origin):
+        for repos in (self._nodes, self._ports, self._states, self._links):
+            for repo in repos.values():
+                repo.discard(origin)
+
     def node_added(self, id, rev, origin):
-        node = self._nodes[id]
+        node = self._nodes.write(id)
         if origin is not None:
             node.resolve(rev, origin, Existence.CREATED)
         else:
             node.store(rev, Existence.CREATED)
 
     def node_removed(self, id, rev, origin):
-        node = self._nodes[id]
+        node = self._nodes.write(id)
         if origin is not None:
             node.resolve(rev, origin, Existence.REMOVED)
         else:
             node.store(rev, Existence.REMOVED)
+        for link in self._cascade(id):
+            if link.current() is not Existence.REMOVED:
+                link.store(rev, Existence.REMOVED)
+
+    def node_shown(self, id, ports, state, links, rev):
+        self._nodes.write(id).store(rev, Existence.CREATED)
+        self._ports.write(id).store(rev, ports)
+        self._states.write(id).store(rev, state)
+        for key in links:
+            self._link(tuple(key)).store(rev, Existence.CREATED)
+
+    def node_hidden(self, id, rev):
+        self._nodes.write(id).store(rev, Existence.REMOVED)
 
     def ports_changed(self, id, ports, rev, origin):
-        node = self._states[id]
+        node = self._ports.write(id)
         if origin is not None:
             node.resolve(rev, origin, ports)
         else:
             node.store(rev, ports)
 
+    def _edit_ports(self, id, rev):
+        """
+        Returns latest ports of node `id` to be edited by a delta. They are
+        copied once after a whole list, then edited in place, so revisions
+        between deltas all share the latest ports.
+        """
+        repo = self._ports.write(id)
+        ports = repo.current()
+        if not isinstance(ports, PortList):
+            ports = PortList(() if ports is NOTHING else ports)
+        repo.store(rev, ports)
+        return ports
+
+    def port_added(self, id, port, index, rev):
+        self._edit_ports(id, rev).insert(index, port)
+
+    def port_removed(self, id, name, rev):
+        self._edit_ports(id, rev).remove(name)
+
+    def port_moved(self, id, name, index, rev):
+        self._edit_ports(id, rev).move(name, index)
+
     def state_changed(self, id, state, rev, origin):
-        node = self._states[id]
+        node = self._states.write(id)
+        if origin is not None:
+            node.resolve(rev, origin, state)
+        else:
+            node.store(rev, state)
+
+    def state_patched(self, id, patch, rev, origin):
+        "Applies `patch` to the latest state confirmed by server"
+        node = self._states.write(id)
+        if patch is None:
+            node.discard(origin)
+            return
+        state = apply_patch(node.current(), patch)
         if origin is not None:
             node.resolve(rev, origin, state)
         else:
@@ -147,15 +429,15 @@ class ClientGraph(object):
 
     def link_added(self, start_id, start_name, end_id, end_name, rev, origin):
         key = (start_id, start_name, end_id, end_name)
-        link = self._links[key]
+        link = self._link(key)
         if origin is not None:
             link.resolve(rev, origin, Existence.CREATED)
         else:
             link.store(rev, Existence.CREATED)
 
-    def link_remove(self, start_id, start_name, end_id, end_name, rev, origin):
+    def link_removed(self, start_id, start_name, end_id, end_name, rev, origin):
         key = (start_id, start_name, end_id, end_name)
-        link = self._links[key]
+        link = self._link(key)
         if origin is not None:
             link.resolve(rev, origin, Existence.REMOVED)
         else:
@@ -163,9 +445,16 @@ class ClientGraph(object):
 
 class ClientGraphModel(object):
     graph_factory = ClientGraph
-    def __init__(self):
+    codec_factory = JSONCodec
+    def __init__(self, codec=None):
         self._graph = self.graph_factory()
+        self._codec = codec or self.codec_factory()
         self._server_rev = 0
+        self._session = None
+
+    @property
+    def codec(self):
+        return self._codec
 
     @property
     def graph(self):
@@ -175,16 +464,62 @@ class ClientGraphModel(object):
         func = getattr(self, "on_" + name, None)
         if func is None:
             raise InvalidCommand(name)
+        since = kwargs.pop("since", None)
+        if since is not None:
+            self._skip(since, kwargs["rev"])
         func(*args, **kwargs)
 
+    def receive(self, message):
+        """
+        Dispatches decoded wire message. Server coalesces messages produced
+        within one loop iteration into a list of `(name, args, kwargs)`.
+        """
+        if message and not isinstance(message[0], str):
+            for name, args, kwargs in message:
+                self.dispatch(name, *args, **kwargs)
+        else:
+            name, args, kwargs = message
+            self.dispatch(name, *args, **kwargs)
+
+    def feed(self, payload):
+        "Decodes payload received from server with negotiated codec"
+        self.receive(self._codec.decode(payload))
+
+    def command(self, name, *args, **kwargs):
+        "Encodes command to be sent to server with negotiated codec"
+        return self._codec.encode((name, args, kwargs))
+
+    def _skip(self, since, rev):
+        "Revisions from `since` up to `rev` were meant for other users only"
+        if since <= self._server_rev < rev:
+            self._server_rev = rev
+
     def _check_rev(self, rev):
         if rev != self._server_rev:
             raise InvalidRevision(rev, self._server_rev)
         self._server_rev = rev + 1
+        self.graph.confirmed(rev)
+
+    @property
+    def resume_params(self):
+        """
+        Query parameters for reconnecting, so the server sends only
+        revisions missed meanwhile. None before authentication.
+        """
+        if self._session is None:
+            return None
+        return {"session": self._session, "rev": self._server_rev - 1}
+
+    def on_auth(self, id, session=None):
+        self._session = session
 
     def on_nop(self, rev):
         self._check_rev(rev)
 
+    def on_snapshot(self, nodes, links, rev):
+        self._server_rev = rev
+        self.graph.load(nodes, links, rev)
+
     def on_createNode(self, id, rev, origin=None):
         self._check_rev(rev)
         self.graph.node_added(id, rev, origin)
@@ -193,14 +528,45 @@ class ClientGraphModel(object):
         self._check_rev(rev)
         self.graph.node_removed(id, rev, origin)
 
+    def on_batch(self, events, rev, origin=None):
+        self._check_rev(rev)
+        if events is None:
+            self.graph.batch_rejected(origin)
+        else:
+            self.graph.batch_applied(events, rev, origin)
+
+    def on_showNode(self, id, ports, state, links, rev):
+        self._check_rev(rev)
+        self.graph.node_shown(id, ports, state, links, rev)
+
+    def on_hideNode(self, id, rev):
+        self._check_rev(rev)
+        self.graph.node_hidden(id, rev)
+
     def on_changeState(self, id, state, rev, origin=None):
         self._check_rev(rev)
         self.graph.state_changed(id, state, rev, origin)
 
+    def on_patchState(self, id, patch, rev, origin=None):
+        self._check_rev(rev)
+        self.graph.state_patched(id, patch, rev, origin)
+
     def on_changePorts(self, id, ports, rev, origin=None):
         self._check_rev(rev)
         self.graph.ports_changed(id, ports, rev, origin)
 
+    def on_addPort(self, id, port, index, rev):
+        self._check_rev(rev)
+        self.graph.port_added(id, port, index, rev)
+
+    def on_removePort(self, id, name, rev):
+        self._check_rev(rev)
+        self.graph.port_removed(id, name, rev)
+
+    def on_movePort(self, id, name, index, rev):
+        self._check_rev(rev)
+        self.graph.port_moved(id, name, index, rev)
+
     def on_addLink(self, start_id, start_name, end_id, end_name, rev, origin=None):
         self._check_rev(rev)
         self.graph.link_added(start_id, start_name, end_id, end_name, rev, origin)
@@ -1,9 +1,26 @@
 from .storage import Graph, Port, Link
+from .storage import NoSuchNode
 from .model import GraphModel
+from .scanner import Scan
+from .watcher import Watcher
+from .traversal import descendants
+from .events import *
 
 import os
-import os.path
+import stat
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# input port of entries, entry ports of folders are named by entry_port
+INPUT = "in"
+
+def entry_port(name):
+    """
+    Returns name of folder port for entry `name`. The one named as input
+    port gets a slash, which file names never contain, so they can not
+    collide.
+    """
+    return "/" + name if name == INPUT else name
 
 class FSGraph(Graph):
     def check_change_state(self, id, state):
@@ -17,18 +34,71 @@ class FSGraph(Graph):
         if "path" not in state:
             raise Cancel()
 
-    def walk(self, node, nodes, links):
-        if node.id in nodes:
-            return
-        nodes[node.id] = node
-        for link in self.find_links_startswith(node.id):
-            key = (link.start_id, link.start_name, link.end_id, link.end_name)
-            links[key] = link
-            self.walk(link.end_id, nodes, links)
+    def check_patch_state(self, id, patch):
+        super().check_patch_state(id, patch)
+        # these go through state change and expansion commands only
+        for operation in patch:
+            if operation[0][0] in ("__type__", "path", "expanded", "truncated"):
+                raise Cancel()
+
+    def check_expand_node(self, id):
+        if not self.has_node(id):
+            raise Cancel() from NoSuchNode(id)
+        state = self.get_node(id).get_state()
+        if state["__type__"] not in ("Root", "Folder") or state["path"] is None:
+            raise Cancel()
+        if state.get("expanded"):
+            raise Confirm()
+
+    def check_collapse_node(self, id):
+        if not self.has_node(id):
+            raise Cancel() from NoSuchNode(id)
+        state = self.get_node(id).get_state()
+        if state["__type__"] not in ("Root", "Folder"):
+            raise Cancel()
+        if not state.get("expanded"):
+            raise Confirm()
 
 class FSGraphModel(GraphModel):
+    """
+    Roots mirror directory trees. Trees are scanned by `scan_factory` in
+    `scan_workers` threads and appear in the graph batch by batch.
+    Only `expand_depth` levels are populated at once and at most
+    `max_entries` entries of a folder; deeper folders are created
+    collapsed and populated by `expandNode` command when needed.
+    With `watch` expanded folders are watched by `watcher_factory` where
+    it is available, and entries created or removed on disk are added
+    or removed one by one instead of scanning the tree again.
+    """
     graph_factory = FSGraph
-    
+    scan_factory = Scan
+    scan_workers = 2
+    expand_depth = 1
+    max_entries = 1000
+    watcher_factory = Watcher
+
+    def __init__(self, *args, watch=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._scans = {}
+        self._scanner = None
+        self._watch = watch
+        self._watcher = None
+        self._watched = {}
+        self._removed = None
+
+    def close(self):
+        for scan in list(self._scans.values()):
+            scan.cancel()
+        self._scans = {}
+        if self._scanner is not None:
+            self._scanner.shutdown(wait=True)
+            self._scanner = None
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+        self._watched = {}
+        super().close()
+
     def on_nodeCreated(self, origin, id):
         node = self.graph.node_factory(id)
         node.set_state({
@@ -41,29 +111,204 @@ class FSGraphModel(GraphModel):
         self.changePortsAll(None, id, node.get_ports())
         self.changeStateAll(None, id, node.get_state())
 
-    def fill_node(self, path, root):
-        for name in os.listdir(path):
-            node = self.graph.node_factory("NODE-" + uuid.uuid4().hex)
-            self.createNodeAll(None, node.id)
-            subpath = os.path.join(path, name)
-            if os.path.isdir(subpath): 
-                node.set_state({
-                    "__type__": "Folder",
-                    "path": subpath,
-                    })
-                self.fill_node(subpath, node)
+    def batch_nodeCreated(self, undo, events, id):
+        super().batch_nodeCreated(undo, events, id)
+        node = self.graph.get_node(id)
+        node.set_state({
+            "__type__": "Root",
+            "path": None,
+            })
+        events[-1] = ["changeState", [id, node.get_state()]]
+
+    def on_batch(self, origin, operations):
+        self._removed = []
+        try:
+            super().on_batch(origin, operations)
+        finally:
+            removed, self._removed = self._removed, None
+        for id, path in removed:
+            # batch may have been rolled back, then the node is back
+            if not self.graph.has_node(id):
+                self.cancel_scan(id)
+                self.unwatch(id, path)
+
+    def batch_nodeRemoved(self, undo, events, id):
+        self.graph.check_remove_node(id)
+        path = self.graph.get_node(id).get_state().get("path")
+        super().batch_nodeRemoved(undo, events, id)
+        # scan and watch stop once the batch is applied, they are not undoable
+        self._removed.append((id, path))
+
+    def batch_nodeStateChanged(self, undo, events, id, state):
+        # filling folders is not undoable, paths are changed one at a time
+        raise Cancel()
+
+    def scan(self, id, path):
+        """
+        Starts filling node `id` with contents of `path`, cancelling scan
+        of the node still in progress. Returns the scan.
+        """
+        self.cancel_scan(id)
+        self.watch(id, path)
+        if self._scanner is None:
+            self._scanner = ThreadPoolExecutor(max_workers=self.scan_workers)
+        paths = {path: id}
+        scan = self.scan_factory(path, lambda batch: self.fill_entries(paths, batch),
+            self.loop, self._scanner, self.expand_depth, self.max_entries)
+        self._scans[id] = scan
+        def finished(future):
+            if self._scans.get(id) is scan:
+                del self._scans[id]
+            if not future.cancelled() and future.exception() is None:
+                for folder in scan.truncated:
+                    folder_id = paths.get(folder)
+                    if folder_id is not None and self.graph.has_node(folder_id):
+                        self.patch_node(None, folder_id, [[["truncated"], True]])
+        scan.done.add_done_callback(finished)
+        return scan.start()
+
+    def cancel_scan(self, id):
+        scan = self._scans.pop(id, None)
+        if scan is not None:
+            scan.cancel()
+
+    def fill_entries(self, paths, entries):
+        "Adds batch of scanned entries, `paths` maps folders to their nodes"
+        for parent, name, path, is_dir, expanded in entries:
+            parent_id = paths.get(parent)
+            if parent_id is None or not self.graph.has_node(parent_id):
+                # folder was removed meanwhile, so is its content
+                continue
+            if not self.graph.get_node(parent_id).get_state().get("expanded"):
+                # collapsed meanwhile
+                continue
+            try:
+                self.graph.check_add_port(parent_id, entry_port(name))
+            except Cancel:
+                # populated by another scan
+                continue
+            node = self.add_entry(parent_id, name, path, is_dir, expanded)
+            if expanded:
+                paths[path] = node.id
+                self.watch(node.id, path)
+
+    def watch(self, id, path):
+        "Keeps folder node `id` in sync with `path` if watching is on"
+        if not self._watch:
+            return
+        if self._watcher is None:
+            if not self.watcher_factory.available():
+                self._watch = False
+                return
+            self._watcher = self.watcher_factory(self.loop, self.sync_entries)
+        if self._watcher.add(path):
+            self._watched[path] = id
+
+    def unwatch(self, id, path=None):
+        "Stops syncing node `id` with its path, or `path` if given"
+        if path is None:
+            path = self.graph.get_node(id).get_state().get("path")
+        if path is not None and self._watched.get(path) == id:
+            del self._watched[path]
+            self._watcher.remove(path)
+
+    def sync_entries(self, changes):
+        """
+        Applies `(folder, name, exists)` changes reported by watcher,
+        `None` means some were lost and watched roots are read again.
+        """
+        if changes is None:
+            for path, id in list(self._watched.items()):
+                if (self.graph.has_node(id) and
+                        self.graph.get_node(id).get_state()["__type__"] == "Root"):
+                    self.prune(id)
+                    self.scan(id, path)
+            return
+        for folder, name, exists in changes:
+            id = self._watched.get(folder)
+            if id is None or not self.graph.has_node(id):
+                continue
+            if exists:
+                self.sync_created(id, folder, name)
             else:
-                node.set_state({
-                    "__type__": "File",
-                    "path": subpath,
-                    })
-            self.changeStateAll(None, node.id, node.get_state())
-
-            node.add_port(Port("in", ""))
-            root.add_port(Port(name, name))
+                self.remove_entry(id, name)
+
+    def sync_created(self, parent_id, folder, name):
+        try:
+            self.graph.check_add_port(parent_id, entry_port(name))
+        except Cancel:
+            return
+        parent = self.graph.get_node(parent_id)
+        state = parent.get_state()
+        entries = parent.count_ports() - parent.has_port(INPUT)
+        if self.max_entries is not None and entries >= self.max_entries:
+            if not state.get("truncated"):
+                self.patch_node(None, parent_id, [[["truncated"], True]])
+            return
+        path = os.path.join(folder, name)
+        try:
+            is_dir = stat.S_ISDIR(os.lstat(path).st_mode)
+        except OSError:
+            # gone again before we got here
+            return
+        self.add_entry(parent_id, name, path, is_dir)
+
+    def add_entry(self, parent_id, name, path, is_dir, expanded=False):
+        node = self.graph.node_factory("NODE-" + uuid.uuid4().hex)
+        self.graph.add_node(node)
+        self.createNodeAll(None, node.id)
+        if is_dir:
+            state = {"__type__": "Folder", "path": path, "expanded": expanded}
+        else:
+            state = {"__type__": "File", "path": path}
+        node.set_state(state)
+        self.changeStateAll(None, node.id, node.get_state())
+
+        port = Port(INPUT, "")
+        node.add_port(port)
+        self.addPortAll(None, node.id, port)
+        parent = self.graph.get_node(parent_id)
+        port = Port(entry_port(name), name)
+        parent.add_port(port)
+        self.addPortAll(None, parent_id, port)
+        self.graph.add_link(Link(parent_id, port.name, node.id, INPUT))
+        self.addLinkAll(None, parent_id, port.name, node.id, INPUT)
+        return node
+
+    def remove_entry(self, parent_id, name):
+        "Removes entry `name` of folder `parent_id` with everything below it"
+        name = entry_port(name)
+        for link in list(self.graph.find_links_from(parent_id, name)):
+            for sub_id in descendants(self.graph, link.end_id):
+                self.drop_node(sub_id)
+            self.drop_node(link.end_id)
+        parent = self.graph.get_node(parent_id)
+        if parent.has_port(name):
+            parent.remove_port(name)
+            self.removePortAll(None, parent_id, name)
+
+    def patch_node(self, origin, id, patch):
+        node = self.graph.get_node(id)
+        node.set_state(self.graph.patched_state(id, patch))
+        self.patchStateAll(origin, id, patch, node.get_state())
+
+    def prune(self, id):
+        "Removes everything below node `id` and its ports"
+        self.cancel_scan(id)
+        node = self.graph.get_node(id)
+        for sub_id in descendants(self.graph, id):
+            self.drop_node(sub_id)
+
+        if node.get_ports():
+            node.set_ports([])
             self.changePortsAll(None, node.id, node.get_ports())
-            self.graph.add_link(Link(root.id, name, node.id, "in"))
-            self.addLinkAll(None, root.id, name, node.id, "in")
+
+    def drop_node(self, id):
+        self.cancel_scan(id)
+        self.unwatch(id)
+        links = self.drop_links(id)
+        self.graph.remove_node(id)
+        self.removeNodeAll(None, id, links)
 
     def on_nodeStateChanged(self, origin, id, state):
         try:
@@ -71,22 +316,48 @@ class FSGraphModel(GraphModel):
         except Cancel:
             self.changeStateSelf(origin, id, None)
         else:
+            self.prune(id)
+            self.unwatch(id)
             node = self.graph.get_node(id)
-            old = node.get_state()
-            old["path"] = state["path"]
-            subnodes = {}
-            sublinks = {}
-            self.graph.walk(node, subnodes, sublinks)
-            for sublink in sublinks:
-                self.graph.remove_link(sublink.start_id, sublink.start_name, sublink.end_id, sublink.end_name)
-                self.removeLinkAll(None, sublink.start_id, sublink.start_name, sublink.end_id, sublink.end_name)
-            for sub_id in subnodes:
-                if sub_id == id: continue
-                self.graph.remove_node(sub_id)
-                self.removeNodeAll(None, sub_id)
-
-            self.fill_node(state["path"], node)
-
-            self.changePortsAll(None, node.id, node.get_ports())
-            node.set_state(old)
+            new = dict(node.get_state())
+            new["path"] = state["path"]
+            new["expanded"] = state["path"] is not None
+            new.pop("truncated", None)
+            node.set_state(new)
             self.changeStateAll(origin, id, node.get_state())
+            if state["path"] is not None:
+                self.scan(id, state["path"])
+
+    def on_expandNode(self, origin, id):
+        "Populates collapsed folder `id` with `expand_depth` levels"
+        try:
+            self.graph.check_expand_node(id)
+        except Confirm:
+            self.patchStateSelf(origin, id, [])
+        except Cancel:
+            self.patchStateSelf(origin, id, None)
+        else:
+            self.patch_node(origin, id, [[["expanded"], True]])
+            self.scan(id, self.graph.get_node(id).get_state()["path"])
+
+    def on_collapseNode(self, origin, id):
+        "Removes contents of folder `id` from graph"
+        try:
+            self.graph.check_collapse_node(id)
+        except Confirm:
+            self.patchStateSelf(origin, id, [])
+        except Cancel:
+            self.patchStateSelf(origin, id, None)
+        else:
+            self.prune(id)
+            self.unwatch(id)
+            patch = [[["expanded"], False]]
+            if "truncated" in self.graph.get_node(id).get_state():
+                patch.append([["truncated"]])
+            self.patch_node(origin, id, patch)
+
+    def on_nodeRemoved(self, origin, id):
+        self.cancel_scan(id)
+        if self.graph.has_node(id):
+            self.unwatch(id)
+        super().on_nodeRemoved(origin, id)
@@ -0,0 +1,147 @@
+import math
+import numbers
+from collections import defaultdict
+
+__all__ = [
+    "Interests",
+    ]
+
+class Interests(object):
+    """
+    Index from node ids and spatial cells to users interested in them.
+
+    Users which never registered interest see everything. A registered
+    user sees nodes listed explicitly plus nodes positioned inside the
+    cells covered by their viewport. Nodes without position are seen by
+    everybody.
+    """
+    position_keys = ("x", "y")
+    cell_size = 512
+    max_cells = 4096
+
+    def __init__(self):
+        self._everything = set()
+        self._registered = {}
+        self._by_node = defaultdict(set)
+        self._by_cell = defaultdict(set)
+        self._cell_of = {}
+
+    def add_user(self, user):
+        self._everything.add(user)
+
+    def remove_user(self, user):
+        self.set_interest(user)
+        self._everything.discard(user)
+
+    def _cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def _cells(self, viewport):
+        """
+        Returns cells covered by `viewport`, None when it is not four finite
+        numbers or covers more than `max_cells`. Size is known before any
+        cell is listed, so huge viewports cost nothing.
+        """
+        try:
+            x0, y0, x1, y1 = viewport
+        except (TypeError, ValueError):
+            return None
+        for value in (x0, y0, x1, y1):
+            if not isinstance(value, numbers.Real) or not math.isfinite(value):
+                return None
+        x0, y0 = self._cell(x0, y0)
+        x1, y1 = self._cell(x1, y1)
+        if max(0, x1 - x0 + 1) * max(0, y1 - y0 + 1) > self.max_cells:
+            return None
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    def set_interest(self, user, ids=None, viewport=None):
+        """
+        Replaces interest of `user`. Viewport is `[x0, y0, x1, y1]`.
+        Without both arguments, or with viewport which is malformed or too
+        large, user gets everything again.
+        """
+        ids_before, cells_before = self._registered.pop(user, ((), ()))
+        for id in ids_before:
+            self._discard(self._by_node, id, user)
+        for cell in cells_before:
+            self._discard(self._by_cell, cell, user)
+
+        cells = self._cells(viewport) if viewport is not None else []
+        if (ids is None and viewport is None) or cells is None:
+            self._everything.add(user)
+            return
+        self._register(user, list(ids or ()), cells)
+
+    def _register(self, user, ids, cells):
+        self._everything.discard(user)
+        for id in ids:
+            self._by_node[id].add(user)
+        for cell in cells:
+            self._by_cell[cell].add(user)
+        self._registered[user] = (ids, cells)
+
+    def registration(self, user):
+        "Interest of `user` to be restored later, None if it sees everything"
+        return self._registered.get(user)
+
+    def restore(self, user, registration):
+        "Gives `user` interest returned by `registration` for another one"
+        self.set_interest(user)
+        self._register(user, *registration)
+
+    @staticmethod
+    def _discard(index, key, user):
+        users = index.get(key)
+        if users is not None:
+            users.discard(user)
+            if not users:
+                del index[key]
+
+    # ======================================================================== #
+
+    def place(self, id, state):
+        "Updates position of node `id` from its state"
+        try:
+            x, y = (state[key] for key in self.position_keys)
+            cell = self._cell(x, y)
+        except (KeyError, TypeError, ValueError, OverflowError):
+            self._cell_of.pop(id, None)
+        else:
+            self._cell_of[id] = cell
+
+    def forget(self, id):
+        self._cell_of.pop(id, None)
+        self._by_node.pop(id, None)
+
+    def rebuild(self, graph):
+        self._cell_of = {}
+        for id, node in graph._nodes_by_id.items():
+            self.place(id, node.get_state())
+
+    # ======================================================================== #
+
+    def watchers(self, *ids):
+        "Returns users interested in any of nodes `ids`, None stands for all"
+        if not self._registered or not ids:
+            return None
+        result = set(self._everything)
+        for id in ids:
+            cell = self._cell_of.get(id)
+            if cell is None:
+                return None
+            result.update(self._by_node.get(id, ()))
+            result.update(self._by_cell.get(cell, ()))
+        return result
+
+    def has_interest(self, user):
+        "Whether `user` sees less than everything"
+        return user in self._registered
+
+    def sees(self, user, id):
+        if user not in self._registered:
+            return True
+        cell = self._cell_of.get(id)
+        if cell is None:
+            return True
+        return user in self._by_node.get(id, ()) or user in self._by_cell.get(cell, ())
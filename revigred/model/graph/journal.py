@@ -0,0 +1,119 @@
+import os
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = [
+    "Journal",
+    ]
+
+class Journal(object):
+    """
+    Append-only log of accepted graph events, one `[rev, name, args]`
+    JSON line per event. Records appended during one loop iteration (or
+    `interval` seconds) are written by a single background write + fsync,
+    so durability does not block the event loop.
+    """
+
+    def __init__(self, path, interval=0, loop=None):
+        self._path = path
+        self._interval = interval
+        self._loop = loop
+        self._pending = []
+        self._handle = None
+        self._executor = None
+        self._file = open(path, "ab")
+        self._repair()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def rotated_path(self):
+        return self._path + ".old"
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    def _repair(self):
+        "Cuts off a record torn by crash so new records start on a fresh line"
+        size = self._file.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        with open(self._path, "rb") as stream:
+            stream.seek(size - 1)
+            if stream.read(1) == b"\n":
+                return
+            stream.seek(0)
+            end = stream.read().rfind(b"\n") + 1
+        self._file.truncate(end)
+
+    @staticmethod
+    def read(path):
+        "Yields `(rev, name, args)` records, ignoring torn tail of the file"
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as stream:
+            for line in stream:
+                if not line.endswith(b"\n"):
+                    break
+                rev, name, args = json.loads(line.decode("utf-8"))
+                yield rev, name, args
+
+    def append(self, rev, name, args):
+        record = json.dumps([rev, name, args], separators=(",", ":"))
+        self._pending.append(record.encode("utf-8") + b"\n")
+        if self._handle is None:
+            if self._interval:
+                self._handle = self.loop.call_later(self._interval, self.flush)
+            else:
+                self._handle = self.loop.call_soon(self.flush)
+
+    def flush(self):
+        "Hands pending records to the writer thread, returns its future"
+        return self._submit(self._write)
+
+    def rotate(self):
+        """
+        Moves everything appended so far to `rotated_path` and continues
+        with empty journal. Returns future resolved once it is done.
+        """
+        return self._submit(self._rotate)
+
+    def _submit(self, func):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        data, self._pending = b"".join(self._pending), []
+        if self._executor is None:
+            # single worker keeps writes ordered
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        return self.loop.run_in_executor(self._executor, func, data)
+
+    def _write(self, data):
+        if data:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _rotate(self, data):
+        self._write(data)
+        self._file.close()
+        os.rename(self._path, self.rotated_path)
+        self._file = open(self._path, "ab")
+
+    def close(self):
+        "Synchronously writes everything still pending and closes the file"
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        data, self._pending = b"".join(self._pending), []
+        self._write(data)
+        self._file.close()
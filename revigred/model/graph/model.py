@@ -1,10 +1,24 @@
+import os
+import asyncio
+from collections import deque, OrderedDict
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
 from revigred.utils import DocDescribed
+from revigred.frame import Frame
+from revigred.frozen import apply_patch
 from revigred.model.users import (
     Users,
     User,
     Origin,
     )
 from .storage import Graph
+from .journal import Journal
+from .interest import Interests
+from .checkpoint import (
+    load_checkpoint,
+    compact,
+    )
 from .events import *
 
 __all__ = [
@@ -20,22 +34,219 @@ class GraphUser(User):
         origin = Origin(self, rev)
         func(origin, *args, **kwargs)
 
+    def __init__(self, model):
+        super().__init__(model)
+        self._resume_rev = None
+
+    def resume(self, rev):
+        "Client of this user has seen revisions up to `rev` already"
+        self._resume_rev = rev
+
+    def channel_opened(self):
+        # frames queued before are covered by what is sent now
+        self._outbox = []
+        self._nops = 0
+        super().channel_opened()
+        frames = None
+        if self._resume_rev is not None:
+            frames = self.model.missed_frames(self, self._resume_rev)
+            self._resume_rev = None
+        if frames is None:
+            self.send_frame(self.model.snapshot_frame(self))
+        else:
+            for frame in frames:
+                self.send_frame(frame)
+
+    def resync_frame(self):
+        return self.model.snapshot_frame(self)
+
 class GraphModel(Users):
     graph_factory = Graph
     user_factory = GraphUser
+    journal_factory = Journal
+    interests_factory = Interests
+    # revisions kept for resumed sessions, older ones get a snapshot
+    history = 4096
 
-    def __init__(self):
+    def __init__(self, journal=None, checkpoint=None, compact_every=None, loop=None):
+        if compact_every is not None and (journal is None or checkpoint is None):
+            raise ValueError("compact_every needs both journal and checkpoint")
         super().__init__()
+        self._loop = loop
         self._graph = self.graph_factory()
+        self._interests = self.interests_factory()
+        self._snapshot = None
+        self._journal = None
+        self._checkpoint = checkpoint
+        self._compact_every = compact_every
+        self._compacted_rev = 0
+        self._compaction = None
+        self._compactor = None
         self._graph.on("node:add", self.node_added)
         self._graph.on("node:remove", self.node_removed)
         self._graph.on("link:add", self.link_added)
         self._graph.on("link:remove", self.link_removed)
+        if checkpoint is not None and os.path.exists(checkpoint):
+            load_checkpoint(self.graph, checkpoint)
+            self._compacted_rev = self.graph.next_rev
+        if journal is not None:
+            self.open_journal(journal)
+        self._interests.rebuild(self.graph)
+        # first revision not every user has heard of
+        self._since = self.graph.next_rev
+        self._history = deque(maxlen=self.history)
+        self._forgotten = self.graph.next_rev - 1
 
     @property
     def graph(self):
         return self._graph
 
+    @property
+    def loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    @property
+    def interests(self):
+        return self._interests
+
+    def create_new_user(self, factory=None, session=None):
+        user = super().create_new_user(factory, session)
+        if not self.interests.has_interest(user):
+            self.interests.add_user(user)
+        return user
+
+    def session_state(self, user):
+        return super().session_state(user), self.interests.registration(user)
+
+    def restore_session(self, user, state):
+        id, registration = state
+        super().restore_session(user, id)
+        if registration is not None:
+            # resumed user watches what it did before
+            self.interests.restore(user, registration)
+
+    def resume_user(self, session, rev):
+        """
+        Creates user continuing `session`, whose client has seen revisions
+        up to `rev`. Once channel is open it gets only revisions it has
+        missed, if they are still in history. Otherwise, or if session is
+        not known, it gets a snapshot. Interest of the session is kept, the
+        snapshot is limited to it.
+        """
+        user = super().resume_user(session, rev)
+        if user.session == session:
+            user.resume(rev)
+        return user
+
+    def missed_frames(self, user, rev):
+        """
+        Frames for `user` after revision `rev`, None if history lacks them.
+        History is not filtered by interests, so users having one get None.
+        """
+        if rev < self._forgotten or rev >= self.graph.next_rev:
+            return None
+        if self.interests.has_interest(user):
+            return None
+        frames = []
+        for entry_rev, frame, sender, origin_rev, shared in self._history:
+            if entry_rev <= rev:
+                continue
+            if sender == user.id:
+                name, args, kwargs = frame.message
+                frames.append(Frame(name, args, dict(kwargs, origin=origin_rev)))
+            elif shared:
+                frames.append(frame)
+        return frames
+
+    def _remember(self, rev, frame, origin, shared=True):
+        "Keeps revision for resumed sessions, `shared` unless sender's only"
+        history = self._history
+        if len(history) == history.maxlen:
+            self._forgotten = history[0][0]
+        if origin is None:
+            history.append((rev, frame, None, None, shared))
+        else:
+            history.append((rev, frame, origin.user.id, origin.rev, shared))
+
+    def remove_user(self, user):
+        super().remove_user(user)
+        self.interests.remove_user(user)
+
+    def open_journal(self, path):
+        "Restores graph from journal at `path` and records further events there"
+        journal = self.journal_factory(path, loop=self._loop)
+        for segment in (journal.rotated_path, path):
+            for rev, name, args in journal.read(segment):
+                if rev >= self.graph.next_rev:
+                    self.replay(rev, name, *args)
+        self._journal = journal
+
+    def compact(self):
+        """
+        Folds journal written so far into checkpoint. The work is done by
+        a worker process; returns future with revision of the checkpoint.
+        Model without journal or checkpoint raises RuntimeError.
+        """
+        if self._compaction is not None:
+            return self._compaction
+        if self._journal is None or self._checkpoint is None:
+            raise RuntimeError("compaction needs both journal and checkpoint")
+        journal = self._journal
+        loop = self.loop
+        self._compaction = future = asyncio.Future(loop=loop)
+        if self._compactor is None:
+            self._compactor = ProcessPoolExecutor(max_workers=1)
+
+        def rotated(result):
+            if result is not None and result.exception() is not None:
+                return finished(result)
+            folding = loop.run_in_executor(self._compactor, compact, 
+                self.__class__, self._checkpoint, journal.rotated_path)
+            folding.add_done_callback(finished)
+
+        def finished(result):
+            self._compaction = None
+            if result.exception() is not None:
+                future.set_exception(result.exception())
+            else:
+                self._compacted_rev = result.result() + 1
+                future.set_result(result.result())
+
+        if os.path.exists(journal.rotated_path):
+            # leftover of interrupted compaction goes first
+            rotated(None)
+        else:
+            journal.rotate().add_done_callback(rotated)
+        return future
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self._compactor is not None:
+            self._compactor.shutdown(wait=True)
+            self._compactor = None
+
+    def snapshot_frame(self, user=None):
+        """
+        Full graph contents for joining users. The frame is shared until
+        the next revision, so its encodings are reused by every user
+        joining in between. With `user` having registered interest, only
+        contents it sees, built for it alone.
+        """
+        rev = self.graph.next_rev
+        if user is not None and self.interests.has_interest(user):
+            nodes, links = self.graph.snapshot(
+                lambda id: self.interests.sees(user, id))
+            return Frame("snapshot", (nodes, links), dict(rev=rev))
+        frame = self._snapshot
+        if frame is None or frame.message[2]["rev"] != rev:
+            nodes, links = self.graph.snapshot()
+            frame = self._snapshot = Frame("snapshot", (nodes, links), dict(rev=rev))
+        return frame
+
     # ======================================================================== #
 
     def node_added(self, id): pass
@@ -67,20 +278,22 @@ class GraphModel(Users):
         except Cancel:
             self.createNodeSelf(origin, id)
         else:
-            for link in self.graph.find_links_startswith(id):
-                self.remove_link(link)
-                self.removeLinkAll(None,
-                    link.start_id, link.start_name, 
-                    link.end_id, link.end_name)
-
-            for link in self.graph.find_links_endswith(id):
-                self.remove_link(link)
-                self.removeLinkAll(None,
-                    link.start_id, link.start_name, 
-                    link.end_id, link.end_name)
-
+            links = self.drop_links(id)
             self.graph.remove_node(id)
-            self.removeNodeAll(origin, id)
+            self.removeNodeAll(origin, id, links)
+
+    def drop_links(self, id):
+        """
+        Removes links of node `id` without broadcasting, as `removeNode`
+        implies them. Returns removed links.
+        """
+        links = list(self.graph.find_links_startswith(id))
+        links.extend(link for link in self.graph.find_links_endswith(id)
+            if link.start_id != id)
+        for link in links:
+            self.graph.remove_link(link.start_id, link.start_name,
+                link.end_id, link.end_name)
+        return links
 
     def on_nodeStateChanged(self, origin, id, state):
         try:
@@ -92,6 +305,30 @@ class GraphModel(Users):
             node.set_state(state)
             self.changeStateAll(origin, id, node.get_state())
 
+    def on_nodeStatePatched(self, origin, id, patch):
+        """
+        Changes only parts of state listed in `patch`, see `apply_patch`.
+        Others get the patch, not the whole state.
+        """
+        try:
+            self.graph.check_patch_state(id, patch)
+            state = self.graph.patched_state(id, patch)
+        except Cancel:
+            self.patchStateSelf(origin, id, None)
+        else:
+            node = self.graph.get_node(id)
+            node.set_state(state)
+            self.patchStateAll(origin, id, patch, node.get_state())
+
+    def on_interestChanged(self, origin, ids=None, viewport=None):
+        """
+        Narrows events delivered to user down to nodes `ids` and nodes
+        within `viewport`. User gets currently visible contents right away.
+        """
+        user = origin.user
+        self.interests.set_interest(user, ids, viewport)
+        user.send_frame(self.snapshot_frame(user))
+
     def on_linkAdded(self, origin, start_id, start_name, end_id, end_name):
         try:
             self.graph.check_add_link(start_id, start_name, end_id, end_name)
@@ -117,56 +354,373 @@ class GraphModel(Users):
 
     # ======================================================================== #
 
+    def on_batch(self, origin, operations):
+        """
+        Applies list of `[command, args]` operations as one transaction.
+        Operations are checked against the graph as changed by previous
+        ones. Any `Cancel`, or malformed operation, rolls back whole batch;
+        other errors roll it back too, but are raised further.
+        `Confirm` makes the single operation a no-op. Resulting events
+        share one revision.
+        """
+        undo = []
+        events = []
+        try:
+            for name, args in operations:
+                func = getattr(self, "batch_" + name, None)
+                if func is None:
+                    raise Cancel()
+                try:
+                    func(undo, events, *args)
+                except Confirm:
+                    pass
+        except (Cancel, TypeError, ValueError, KeyError):
+            # malformed operations are refused like cancelled ones
+            self._undo(undo)
+            self.batchSelf(origin, None)
+        except Exception:
+            # graph is left as it was, the error goes on to be logged
+            self._undo(undo)
+            raise
+        else:
+            self.batchAll(origin, events)
+
+    @staticmethod
+    def _undo(undo):
+        for func in reversed(undo):
+            func()
+
+    def batch_nodeCreated(self, undo, events, id):
+        self.graph.check_create_node(id)
+        node = self.graph.node_factory(id)
+        self.graph.add_node(node)
+        undo.append(partial(self.graph.remove_node, id))
+        events.append(["createNode", [id]])
+        events.append(["changePorts", [id, node.get_ports()]])
+        events.append(["changeState", [id, node.get_state()]])
+
+    def batch_nodeRemoved(self, undo, events, id):
+        self.graph.check_remove_node(id)
+        for link in self.drop_links(id):
+            undo.append(partial(self.graph.add_link, link))
+        node = self.graph.get_node(id)
+        self.graph.remove_node(id)
+        undo.append(partial(self.graph.add_node, node))
+        events.append(["removeNode", [id]])
+
+    def batch_nodeStateChanged(self, undo, events, id, state):
+        self.graph.check_change_state(id, state)
+        node = self.graph.get_node(id)
+        undo.append(partial(node.set_state, node.get_state()))
+        node.set_state(state)
+        events.append(["changeState", [id, node.get_state()]])
+
+    def batch_nodeStatePatched(self, undo, events, id, patch):
+        self.graph.check_patch_state(id, patch)
+        state = self.graph.patched_state(id, patch)
+        node = self.graph.get_node(id)
+        undo.append(partial(node.set_state, node.get_state()))
+        node.set_state(state)
+        events.append(["patchState", [id, patch]])
+
+    def batch_linkAdded(self, undo, events, start_id, start_name, end_id, end_name):
+        self.graph.check_add_link(start_id, start_name, end_id, end_name)
+        link = self.graph.link_factory(start_id, start_name, end_id, end_name)
+        self.graph.add_link(link)
+        undo.append(partial(self.graph.remove_link, 
+            start_id, start_name, end_id, end_name))
+        events.append(["addLink", [start_id, start_name, end_id, end_name]])
+
+    def batch_linkRemoved(self, undo, events, start_id, start_name, end_id, end_name):
+        self.graph.check_remove_link(start_id, start_name, end_id, end_name)
+        link = self.graph.get_link(start_id, start_name, end_id, end_name)
+        self.graph.remove_link(start_id, start_name, end_id, end_name)
+        undo.append(partial(self.graph.add_link, link))
+        events.append(["removeLink", [start_id, start_name, end_id, end_name]])
+
+    # ======================================================================== #
+
+    def replay(self, rev, name, *args):
+        "Applies previously broadcast event to the graph without broadcasting"
+        func = getattr(self, "replay_" + name)
+        func(*args)
+        self.graph.advance(rev)
+
+    def replay_createNode(self, id):
+        self.graph.add_node(self.graph.node_factory(id))
+
+    def replay_removeNode(self, id):
+        self.drop_links(id)
+        self.graph.remove_node(id)
+
+    def replay_changeState(self, id, state):
+        self.graph.get_node(id).set_state(state)
+
+    def replay_patchState(self, id, patch):
+        node = self.graph.get_node(id)
+        node.set_state(apply_patch(node.get_state(), patch))
+
+    def replay_changePorts(self, id, ports):
+        node = self.graph.get_node(id)
+        node.set_ports([node.port_factory(port["name"], port["title"]) 
+            for port in ports])
+
+    def replay_addPort(self, id, port, index):
+        node = self.graph.get_node(id)
+        node.add_port(node.port_factory(port["name"], port["title"]), index)
+
+    def replay_removePort(self, id, name):
+        self.graph.get_node(id).remove_port(name)
+
+    def replay_movePort(self, id, name, index):
+        self.graph.get_node(id).move_port(name, index)
+
+    def replay_addLink(self, start_id, start_name, end_id, end_name):
+        link = self.graph.link_factory(start_id, start_name, end_id, end_name)
+        self.graph.add_link(link)
+
+    def replay_removeLink(self, start_id, start_name, end_id, end_name):
+        self.graph.remove_link(start_id, start_name, end_id, end_name)
+
+    def replay_batch(self, events):
+        for name, args in events:
+            getattr(self, "replay_" + name)(*args)
+
+    # ======================================================================== #
+
     def _callSelf(self, name, origin, *args, **kwargs):
+        """
+        Answers `origin` only. Nobody else hears of the revision, the next
+        broadcast tells them it was skipped.
+        """
         rev = self.graph.rev
+        if origin is not None and origin.user.model is self:
+            kwargs.update(self._stamp(rev))
+            self._remember(rev, Frame(name, args, dict(kwargs)), origin, shared=False)
+            origin.user.reply(False, name, *args, origin=origin.rev, **kwargs)
+
+    def _stamp(self, rev):
+        """
+        Revision of a frame, with `since` once revisions before it were
+        answered to their senders only: users then skip from `since` on.
+        """
+        if self._since < rev:
+            return dict(rev=rev, since=self._since)
+        return dict(rev=rev)
+
+    def _record(self, rev, name, args):
+        if self._journal is not None:
+            self._journal.append(rev, name, args)
+            if (self._checkpoint is not None and self._compact_every is not None
+                    and rev - self._compacted_rev >= self._compact_every):
+                self.compact()
+
+    def _callAll(self, name, origin, *args, subjects=(), **kwargs):
+        """
+        Sends event to users watching any of `subjects` node ids, the rest
+        only get `nop` to advance their revision.
+        """
+        rev = self.graph.rev
+        self._record(rev, name, args)
+        stamp = self._stamp(rev)
+        self._since = rev + 1
+        watchers = self.interests.watchers(*subjects)
+        common = Frame(name, args, dict(kwargs, **stamp))
+        self._remember(rev, common, origin)
+        skip = None
         for user in self._users.values():
             if origin is not None and origin.user is user:
-                user.send(name, *args, rev=rev, origin=origin.rev, **kwargs)
+                user.reply(True, name, *args, origin=origin.rev, **dict(kwargs, **stamp))
+            elif watchers is None or user in watchers:
+                user.send_frame(common)
             else:
-                user.send("nop", rev=rev)
+                if skip is None:
+                    skip = Frame("nop", (), stamp)
+                user.send_frame(skip)
 
-    def _callAll(self, name, origin, *args, **kwargs):
+    def _callMoved(self, origin, id, state, before, after):
+        """
+        Sends state change which moved node across interests. Users which
+        start watching node get it whole, ones which stop get it hidden.
+        """
         rev = self.graph.rev
+        self._record(rev, "changeState", (id, state))
+        stamp = self._stamp(rev)
+        self._since = rev + 1
+        frames = {}
+        def frame(name, *args):
+            if name not in frames:
+                frames[name] = Frame(name, args, stamp)
+            return frames[name]
+        # history serves resumed users without interest, they see everything
+        self._remember(rev, frame("changeState", id, state), origin)
         for user in self._users.values():
+            watched = before is None or user in before
+            watches = after is None or user in after
             if origin is not None and origin.user is user:
-                user.send(name, *args, rev=rev, origin=origin.rev, **kwargs)
+                user.reply(True, "changeState", id, state, origin=origin.rev, **stamp)
+            elif watched and watches:
+                user.send_frame(frame("changeState", id, state))
+            elif watches:
+                node = self.graph.get_node(id)
+                user.send_frame(frame("showNode", id, node.get_ports(), state,
+                    self._node_links(id)))
+            elif watched:
+                user.send_frame(frame("hideNode", id))
             else:
-                user.send(name, *args, rev=rev, **kwargs)
+                user.send_frame(frame("nop"))
+
+    def _node_links(self, id):
+        "Links of node `id` as sent along with `showNode`"
+        links = [[link.start_id, link.start_name, link.end_id, link.end_name]
+            for link in self.graph.find_links_startswith(id)]
+        links.extend([link.start_id, link.start_name, link.end_id, link.end_name]
+            for link in self.graph.find_links_endswith(id))
+        return links
 
     def createNodeSelf(self, origin, id):
         self._callSelf("createNode", origin, id)
 
     def createNodeAll(self, origin, id):
-        self._callAll("createNode", origin, id)
+        self._callAll("createNode", origin, id, subjects=(id,))
 
     def removeNodeSelf(self, origin, id):
         self._callSelf("removeNode", origin, id)
 
-    def removeNodeAll(self, origin, id):
-        self._callAll("removeNode", origin, id)
+    def removeNodeAll(self, origin, id, links=()):
+        "Removal of node implies removal of its `links` already dropped from graph"
+        subjects = {id}
+        for link in links:
+            subjects.update((link.start_id, link.end_id))
+        self._callAll("removeNode", origin, id, subjects=tuple(subjects))
+        self.interests.forget(id)
 
     def changeStateSelf(self, origin, id, state):
         self._callSelf("changeState", origin, id, state)
 
     def changeStateAll(self, origin, id, state):
-        self._callAll("changeState", origin, id, state)
+        before = self.interests.watchers(id)
+        self.interests.place(id, state)
+        after = self.interests.watchers(id)
+        if before == after:
+            self._callAll("changeState", origin, id, state, subjects=(id,))
+        else:
+            self._callMoved(origin, id, state, before, after)
+
+    def patchStateSelf(self, origin, id, patch):
+        self._callSelf("patchState", origin, id, patch)
+
+    def patchStateAll(self, origin, id, patch, state):
+        "Sends `patch` which has turned state of node `id` into `state`"
+        before = self.interests.watchers(id)
+        self.interests.place(id, state)
+        after = self.interests.watchers(id)
+        if before == after:
+            self._callAll("patchState", origin, id, patch, subjects=(id,))
+        else:
+            self._callMoved(origin, id, state, before, after)
 
     def changePortsSelf(self, origin, id, ports):
         self._callSelf("changePorts", origin, id, ports)
 
     def changePortsAll(self, origin, id, ports):
-        self._callAll("changePorts", origin, id, ports)
+        self._callAll("changePorts", origin, id, ports, subjects=(id,))
+
+    def addPortAll(self, origin, id, port, index=None):
+        "Announces `port` added to node `id` at `index`, None is the end"
+        self._callAll("addPort", origin, id, port.serialize(), index, subjects=(id,))
+
+    def removePortAll(self, origin, id, name):
+        self._callAll("removePort", origin, id, name, subjects=(id,))
+
+    def movePortAll(self, origin, id, name, index):
+        self._callAll("movePort", origin, id, name, index, subjects=(id,))
 
     def addLinkSelf(self, origin, start_id, start_name, end_id, end_name):
         self._callSelf("addLink", origin, start_id, start_name, end_id, end_name)
 
     def addLinkAll(self, origin, start_id, start_name, end_id, end_name):
-        self._callAll("addLink", origin, start_id, start_name, end_id, end_name)
+        self._callAll("addLink", origin, start_id, start_name, end_id, end_name,
+            subjects=(start_id, end_id))
 
     def removeLinkSelf(self, origin, start_id, start_name, end_id, end_name):
         self._callSelf("removeLink", origin, start_id, start_name, end_id, end_name)
     
     def removeLinkAll(self, origin, start_id, start_name, end_id, end_name):
-        self._callAll("removeLink", origin, start_id, start_name, end_id, end_name)
+        self._callAll("removeLink", origin, start_id, start_name, end_id, end_name,
+            subjects=(start_id, end_id))
+
+    def batchSelf(self, origin, events):
+        self._callSelf("batch", origin, events)
+
+    def batchAll(self, origin, events):
+        subjects = set()
+        placed = OrderedDict()
+        moved = False
+        for name, args in events:
+            if name == "addLink" or name == "removeLink":
+                subjects.update((args[0], args[2]))
+                continue
+            id = args[0]
+            subjects.add(id)
+            if name == "removeNode":
+                # implied link removals concern neighbours we no longer know
+                moved = True
+            elif ((name == "changeState" or name == "patchState")
+                    and self.graph.has_node(id)):
+                placed[id] = None
+        before = {id: self.interests.watchers(id) for id in subjects}
+        for id in placed:
+            self.interests.place(id, self.graph.get_node(id).get_state())
+        after = {id: self.interests.watchers(id) for id in subjects}
+        moved = moved or any(before[id] != after[id] for id in placed)
+        if moved:
+            self._callBatch(origin, events, before, after, placed)
+        else:
+            self._callAll("batch", origin, events, subjects=tuple(subjects))
+        for name, args in events:
+            if name == "removeNode":
+                self.interests.forget(args[0])
+
+    def _callBatch(self, origin, events, before, after, placed):
+        """
+        Sends batch which moved nodes across interests or removed some.
+        Each user gets events of nodes it saw before the batch, with nodes
+        it starts watching shown and ones it stops watching hidden at the
+        end. Removals go to everybody, who may hold links to removed nodes.
+        """
+        rev = self.graph.rev
+        self._record(rev, "batch", (events,))
+        stamp = self._stamp(rev)
+        self._since = rev + 1
+        common = Frame("batch", (events,), stamp)
+        self._remember(rev, common, origin)
+        for user in self._users.values():
+            if origin is not None and origin.user is user:
+                user.reply(True, "batch", events, origin=origin.rev, **stamp)
+                continue
+            seen = lambda id, watchers: watchers[id] is None or user in watchers[id]
+            visible = []
+            for name, args in events:
+                if name == "removeNode":
+                    visible.append([name, args])
+                elif name == "addLink" or name == "removeLink":
+                    if seen(args[0], before) or seen(args[2], before):
+                        visible.append([name, args])
+                elif seen(args[0], before):
+                    visible.append([name, args])
+            for id in placed:
+                if not self.graph.has_node(id):
+                    continue
+                if seen(id, before) and not seen(id, after):
+                    visible.append(["hideNode", [id]])
+                elif seen(id, after) and not seen(id, before):
+                    node = self.graph.get_node(id)
+                    visible.append(["showNode", [id, node.get_ports(),
+                        node.get_state(), self._node_links(id)]])
+            if visible == events:
+                user.send_frame(common)
+            else:
+                user.send("batch", visible, **stamp)
 
 # ____________________________________________________________________________ #
@@ -0,0 +1,352 @@
+import json
+import asyncio
+
+from revigred.model.users import Origin
+from .model import (
+    GraphModel,
+    GraphUser,
+    )
+
+__all__ = [
+    "Primary",
+    "ReplicaModel",
+    ]
+
+# commands replicas answer themselves, the rest is forwarded to primary
+LOCAL_COMMANDS = frozenset(["interestChanged"])
+
+def encode_line(frame):
+    return json.dumps(frame.message, separators=(",", ":")).encode("utf-8") + b"\n"
+
+class LineProtocol(asyncio.Protocol):
+    """
+    Exchanges JSON messages, one per line. Subclasses take each decoded
+    message in `message_received(message)`.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.transport = None
+        self._buffer = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self._buffer.append(data)
+        if b"\n" not in data:
+            return
+        lines = b"".join(self._buffer).split(b"\n")
+        self._buffer = [lines.pop()]
+        for line in lines:
+            self.message_received(json.loads(line.decode("utf-8")))
+
+# ____________________________________________________________________________ #
+
+class ReplicaLink(GraphUser):
+    """
+    User of primary model standing for a whole replica. It gets every
+    revision: events as all users see them, and replies to commands of
+    replica users marked with id of the user and whether the command was
+    accepted or only answered to its sender.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self._sender = None
+
+    def forwarded(self, sender, name, args, rev):
+        func = getattr(self.model, "on_" + name, None)
+        if func is None or name in LOCAL_COMMANDS:
+            raise ValueError("command {} was not found".format(name))
+        self._sender = sender
+        try:
+            func(Origin(self, rev), *args)
+        finally:
+            self._sender = None
+
+    def reply(self, accepted, __name, *args, **kwargs):
+        self.send(__name, *args,
+            user=self._sender, accepted=accepted, **kwargs)
+
+class PrimaryProtocol(LineProtocol):
+    "Connection of primary with one replica"
+
+    def __init__(self, model, loop):
+        super().__init__(loop)
+        self.model = model
+        self.link = None
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        self.link = self.model.create_new_user(ReplicaLink)
+        self.link.connect(self)
+        self.link.channel_opened()
+
+    def connection_lost(self, exc):
+        if self.link is not None:
+            self.link.disconnect()
+            self.link = None
+
+    def message_received(self, message):
+        sender, name, args, rev = message
+        try:
+            self.link.forwarded(sender, name, args, rev)
+        except Exception as error:
+            # one bad command should not cut off the whole replica
+            self.loop.call_exception_handler({
+                "message": "Command forwarded by replica failed",
+                "exception": error,
+                "protocol": self,
+                })
+
+    def sendFrame(self, frame):
+        self.transport.write(frame.encode(encode_line, encode_line))
+
+    def sendFrames(self, frames):
+        self.transport.write(b"".join(
+            frame.encode(encode_line, encode_line) for frame in frames))
+
+    def pause_writing(self):
+        self.link.pause_writing()
+
+    def resume_writing(self):
+        self.link.resume_writing()
+
+    @property
+    def write_buffer_size(self):
+        if self.transport is None:
+            return 0
+        return self.transport.get_write_buffer_size()
+
+    def abort(self):
+        self.transport.abort()
+
+class Primary(object):
+    """
+    Serves revision stream of `model` to replicas connecting to unix
+    socket at `path` and applies commands they forward.
+    """
+    protocol_factory = PrimaryProtocol
+
+    def __init__(self, model, path, loop=None):
+        self.model = model
+        self.path = path
+        self._loop = loop
+        self._server = None
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    def start(self):
+        "Starts listening, returns future resolved once it does"
+        future = asyncio.ensure_future(self.loop.create_unix_server(
+            lambda: self.protocol_factory(self.model, self.loop), self.path),
+            loop=self.loop)
+        future.add_done_callback(self._started)
+        return future
+
+    def _started(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self._server = future.result()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+# ____________________________________________________________________________ #
+
+class ReplicaUser(GraphUser):
+    def dispatch(self, name, *args, **kwargs):
+        if name in LOCAL_COMMANDS:
+            return super().dispatch(name, *args, **kwargs)
+        if getattr(self.model.primary_class, "on_" + name, None) is None:
+            raise ValueError("command {} was not found".format(name))
+        self.model.forward(self, name, args, kwargs.pop("rev"))
+
+class ReplicaProtocol(LineProtocol):
+    "Connection of replica with its primary"
+
+    def __init__(self, model, loop):
+        super().__init__(loop)
+        self.model = model
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        self.model.connected(self)
+
+    def connection_lost(self, exc):
+        self.model.disconnected()
+
+    def message_received(self, message):
+        self.model.apply(message)
+
+    def send_message(self, message):
+        self.transport.write(json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n")
+
+class ReplicaModel(GraphModel):
+    """
+    Read copy of graph owned by primary listening at unix socket
+    `primary`, which is a model of `primary_class`. Revisions of primary
+    are replayed here and sent to own users, so fan-out is spread over
+    replica processes. Commands of users are forwarded to primary and
+    take effect once they come back.
+
+    Lost primary is connected to again, waiting longer after each failed
+    attempt. Users are dropped meanwhile, their graph would go stale
+    unnoticed, and reconnecting clients get a fresh snapshot once primary
+    is back. Up to `max_pending` commands wait for primary, senders of
+    more are dropped too.
+    """
+    user_factory = ReplicaUser
+    protocol_factory = ReplicaProtocol
+    primary_class = GraphModel
+    reconnect_delay = 0.1
+    max_reconnect_delay = 5.0
+    max_pending = 1000
+
+    def __init__(self, primary, loop=None, primary_class=None):
+        super().__init__(loop=loop)
+        self._primary = primary
+        if primary_class is not None:
+            self.primary_class = primary_class
+        self._protocol = None
+        self._pending = []
+        self._delay = self.reconnect_delay
+        self._reconnect = None
+        self._closed = False
+
+    def connect(self):
+        "Connects to primary, returns future resolved once it is done"
+        self._reconnect = None
+        future = asyncio.ensure_future(self.loop.create_unix_connection(
+            lambda: self.protocol_factory(self, self.loop), self._primary),
+            loop=self.loop)
+        future.add_done_callback(self._attempted)
+        return future
+
+    def _attempted(self, future):
+        if future.cancelled() or future.exception() is not None:
+            self._retry()
+
+    def _retry(self):
+        if self._closed or self._reconnect is not None:
+            return
+        delay, self._delay = self._delay, min(self._delay * 2, self.max_reconnect_delay)
+        self._reconnect = self.loop.call_later(delay, self.connect)
+
+    def close(self):
+        self._closed = True
+        if self._reconnect is not None:
+            self._reconnect.cancel()
+            self._reconnect = None
+        if self._protocol is not None:
+            self._protocol.transport.close()
+        super().close()
+
+    def connected(self, protocol):
+        self._protocol = protocol
+        self._delay = self.reconnect_delay
+        pending, self._pending = self._pending, []
+        for message in pending:
+            protocol.send_message(message)
+
+    def disconnected(self):
+        self._protocol = None
+        self._pending = []
+        for user in list(self._users.values()):
+            self.remove_user(user)
+            user.abandon()
+        self._retry()
+
+    def forward(self, user, name, args, rev):
+        message = [user.id, name, list(args), rev]
+        if self._protocol is not None:
+            self._protocol.send_message(message)
+        elif len(self._pending) < self.max_pending:
+            self._pending.append(message)
+        else:
+            # primary is away too long for this user to wait
+            self.remove_user(user)
+            user.abandon()
+
+    def apply(self, message):
+        "Takes revision from primary and sends it to users"
+        name, args, kwargs = message
+        if name == "auth":
+            return
+        rev = kwargs["rev"]
+        if name == "snapshot":
+            return self.apply_snapshot(rev, *args)
+        # our own events consume revisions in the same order as primary did
+        self.graph.advance(rev - 1)
+        origin = None
+        sender = self._users.get(kwargs.get("user"))
+        if sender is not None:
+            origin = Origin(sender, kwargs["origin"])
+        if name == "nop" or kwargs.get("accepted") is False:
+            self._callSelf(name, origin, *args)
+        else:
+            getattr(self, "relay_" + name)(origin, *args)
+
+    def apply_snapshot(self, rev, nodes, links):
+        self.graph.load(rev - 1, [(id, [(port["name"], port["title"]) for port in ports], state)
+            for id, ports, state in nodes], links)
+        self.interests.rebuild(self.graph)
+        self._since = self.graph.next_rev
+        # revisions before the snapshot can not be replayed to anyone
+        self._history.clear()
+        self._forgotten = rev - 1
+        for user in self._users.values():
+            user.send_frame(self.snapshot_frame(user))
+
+    # ======================================================================== #
+
+    def relay_createNode(self, origin, id):
+        self.replay_createNode(id)
+        self.createNodeAll(origin, id)
+
+    def relay_removeNode(self, origin, id):
+        links = self.drop_links(id)
+        self.graph.remove_node(id)
+        self.removeNodeAll(origin, id, links)
+
+    def relay_changeState(self, origin, id, state):
+        self.replay_changeState(id, state)
+        self.changeStateAll(origin, id, self.graph.get_node(id).get_state())
+
+    def relay_patchState(self, origin, id, patch):
+        self.replay_patchState(id, patch)
+        self.patchStateAll(origin, id, patch, self.graph.get_node(id).get_state())
+
+    def relay_changePorts(self, origin, id, ports):
+        self.replay_changePorts(id, ports)
+        self.changePortsAll(origin, id, ports)
+
+    def relay_addPort(self, origin, id, port, index):
+        self.replay_addPort(id, port, index)
+        self._callAll("addPort", origin, id, port, index, subjects=(id,))
+
+    def relay_removePort(self, origin, id, name):
+        self.replay_removePort(id, name)
+        self.removePortAll(origin, id, name)
+
+    def relay_movePort(self, origin, id, name, index):
+        self.replay_movePort(id, name, index)
+        self.movePortAll(origin, id, name, index)
+
+    def relay_addLink(self, origin, start_id, start_name, end_id, end_name):
+        self.replay_addLink(start_id, start_name, end_id, end_name)
+        self.addLinkAll(origin, start_id, start_name, end_id, end_name)
+
+    def relay_removeLink(self, origin, start_id, start_name, end_id, end_name):
+        self.replay_removeLink(start_id, start_name, end_id, end_name)
+        self.removeLinkAll(origin, start_id, start_name, end_id, end_name)
+
+    def relay_batch(self, origin, events):
+        self.replay_batch(events)
+        self.batchAll(origin, events)
@@ -0,0 +1,137 @@
+import os
+import threading
+from collections import deque
+
+__all__ = [
+    "Scan",
+    ]
+
+class Scan(object):
+    """
+    Walks directory tree at `path` breadth-first in a worker thread, at
+    most `depth` levels down and at most `limit` entries per folder.
+    Entries `(parent_path, name, path, is_dir, expanded)` are handed to
+    `apply` on the loop in batches of at most `batch_size`; parents
+    always come before their contents, `expanded` tells whether contents
+    of the folder are scanned too. No more than `window` batches wait for the
+    loop at once, so a slow loop holds the walk back instead of piling
+    entries up. One batch is applied per loop iteration, so other
+    callbacks run in between.
+    """
+    batch_size = 64
+    window = 4
+
+    def __init__(self, path, apply, loop, executor, depth=None, limit=None):
+        self._path = path
+        self._depth = depth
+        self._limit = limit
+        self._truncated = []
+        self._apply = apply
+        self._loop = loop
+        self._executor = executor
+        self._cancelled = threading.Event()
+        self._slots = threading.Semaphore(self.window)
+        self._done = loop.create_future()
+        self._inbox = deque()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def truncated(self):
+        "Folders which had more than `limit` entries"
+        return self._truncated
+
+    @property
+    def done(self):
+        "Future resolved on the loop once every entry is applied"
+        return self._done
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def start(self):
+        future = self._loop.run_in_executor(self._executor, self._walk)
+        future.add_done_callback(self._finished)
+        return self
+
+    def cancel(self):
+        "Stops the walk, batches not applied yet are dropped"
+        self._stop()
+        if not self._done.done():
+            self._done.cancel()
+
+    def _stop(self):
+        self._cancelled.set()
+        # wakes the worker if it waits for a free slot
+        self._slots.release()
+
+    # ======================================================================== #
+
+    def _walk(self):
+        batch = []
+        depth = self._depth
+        limit = self._limit
+        pending = deque([(self._path, 1)])
+        while pending and not self.cancelled:
+            path, level = pending.popleft()
+            try:
+                with os.scandir(path) as entries:
+                    for count, entry in enumerate(entries):
+                        if self.cancelled:
+                            return
+                        if limit is not None and count >= limit:
+                            self._truncated.append(path)
+                            break
+                        try:
+                            # type comes from the directory entry, no stat
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            is_dir = False
+                        expanded = is_dir and (depth is None or level < depth)
+                        batch.append((path, entry.name, entry.path, is_dir, expanded))
+                        if expanded:
+                            pending.append((entry.path, level + 1))
+                        if len(batch) >= self.batch_size:
+                            self._send(batch, False)
+                            batch = []
+            except OSError:
+                continue
+        self._send(batch, True)
+
+    def _send(self, batch, last):
+        self._slots.acquire()
+        if not self.cancelled:
+            self._loop.call_soon_threadsafe(self._arrived, batch, last)
+
+    def _arrived(self, batch, last):
+        self._inbox.append((batch, last))
+        if len(self._inbox) == 1:
+            self._deliver()
+
+    def _deliver(self):
+        batch, last = self._inbox[0]
+        self._slots.release()
+        if self.cancelled:
+            self._inbox.clear()
+            return
+        try:
+            self._apply(batch)
+        except Exception as error:
+            self._stop()
+            self._done.set_exception(error)
+            return
+        self._inbox.popleft()
+        if last:
+            self._done.set_result(None)
+        elif self._inbox:
+            self._loop.call_soon(self._deliver)
+
+    def _finished(self, future):
+        if future.cancelled() or self._done.done():
+            return
+        error = future.exception()
+        if error is not None:
+            self._done.set_exception(error)
@@ -1,36 +1,63 @@
+import sys
 import weakref
-from copy import deepcopy
-from collections import defaultdict
+from operator import itemgetter
+from itertools import islice
+from collections import defaultdict, OrderedDict
 
 from revigred.record import Record
+from revigred.frozen import (
+    FrozenDict,
+    PatchError,
+    freeze,
+    validate_patch,
+    apply_patch,
+    )
 
 from .events import *
+from .adjacency import Adjacency
+from .topology import TopologicalOrder
 
 __all__ = [
     "Port",
+    "Ports",
     "Node",
     "Link",
     "Graph",
     "NodeExists",
     "NoSuchNode",
     "NoSuchPort",
+    "PortExists",
     "LinkExists",
     "NoSuchLink",
+    "LinkCycle",
     ]
 
+def _intern(value):
+    "Interns strings, ids coming from clients may be of other types"
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
 class MethodsWeakSet(set):
     def add(self, method):
         set.add(self, weakref.WeakMethod(method, self.remove))
 
 class EventEmmiter(object):
+    "Listener table is created on first subscription, most nodes never get one"
+    __slots__ = ("_listeners",)
+
     def __init__(self):
         super().__init__()
-        self._listeners = defaultdict(MethodsWeakSet)
+        self._listeners = None
 
     def on(self, name, method):
+        if self._listeners is None:
+            self._listeners = defaultdict(MethodsWeakSet)
         self._listeners[name].add(method)
 
     def notify(self, name, *args, **kwargs):
+        if self._listeners is None:
+            return
         for method in self._listeners.get(name, ()):
             method()(*args, **kwargs)
 
@@ -47,6 +74,10 @@ class NoSuchPort(ResultException):
     def __init__(self, id, name):
         self.id = id
         self.name = name
+class PortExists(ResultException):
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
 class LinkExists(ResultException):
     def __init__(self, start_id, start_name, end_id, end_name):
         self.start_id = start_id
@@ -59,13 +90,21 @@ class NoSuchLink(ResultException):
         self.start_name = start_name
         self.end_id = end_id
         self.end_name = end_name
+class LinkCycle(ResultException):
+    def __init__(self, start_id, start_name, end_id, end_name):
+        self.start_id = start_id
+        self.start_name = start_name
+        self.end_id = end_id
+        self.end_name = end_name
 
 # ____________________________________________________________________________ #
 
 class Port(object):
+    __slots__ = ("_name", "_title")
+
     def __init__(self, name, title):
         super().__init__()
-        self._name = name
+        self._name = _intern(name)
         self._title = title
 
     @property
@@ -82,87 +121,177 @@ class Port(object):
             title=self._title,
             )
 
+class Ports(object):
+    """
+    Ports of a node in order. Lookup, append and removal by name are O(1),
+    insertion and moves cost O(distance from the end), which is 1 for the
+    usual append. Serialized list is built on demand and kept until the
+    next change.
+    """
+    __slots__ = ("_ports", "_serialized")
+
+    def __init__(self, ports=()):
+        self._ports = OrderedDict((port.name, port) for port in ports)
+        self._serialized = None
+
+    def __len__(self):
+        return len(self._ports)
+
+    def __iter__(self):
+        return iter(self._ports.values())
+
+    def __contains__(self, name):
+        return name in self._ports
+
+    def get(self, name):
+        return self._ports.get(name)
+
+    def index(self, name):
+        for index, key in enumerate(self._ports):
+            if key == name:
+                return index
+        raise KeyError(name)
+
+    def _shift(self, start, stop):
+        "Moves ports from `start` up to `stop` to the end, keeping their order"
+        keys = list(islice(self._ports, start, stop))
+        for key in keys:
+            self._ports.move_to_end(key)
+
+    def insert(self, index, port):
+        if port.name in self._ports:
+            raise KeyError(port.name)
+        size = len(self._ports)
+        self._ports[port.name] = port
+        if index is not None and index < size:
+            self._shift(max(index, 0), size)
+        self._serialized = None
+
+    def remove(self, name):
+        port = self._ports.pop(name)
+        self._serialized = None
+        return port
+
+    def move(self, name, index):
+        port = self.remove(name)
+        self.insert(index, port)
+
+    def serialize(self):
+        if self._serialized is None:
+            self._serialized = freeze([port.serialize() for port in self._ports.values()])
+        return self._serialized
+
+# shared by nodes without ports until the first one is added
+NO_PORTS = Ports()
+NO_STATE = FrozenDict()
+
 class Node(EventEmmiter):
+    __slots__ = ("_id", "_state", "_ports")
+
     port_factory = Port
+    ports_factory = Ports
 
     def __init__(self, id):
         super().__init__()
-        self._id = id
-        self._state = {}
-        self._ports = []
-        self._ports_by_name = {}
+        self._id = _intern(id)
+        self._state = NO_STATE
+        self._ports = NO_PORTS
 
     @property
     def id(self):
         return self._id
 
     def has_port(self, name):
-        return name in self._ports_by_name
+        return name in self._ports
 
     def get_port(self, name):
-        return self._ports_by_name.get(name)
+        return self._ports.get(name)
+
+    def count_ports(self):
+        return len(self._ports)
+
+    def port_index(self, name):
+        return self._ports.index(name)
 
     def add_port(self, port, index=None):
-        if index is None:
-            index = len(self._ports)
+        if self._ports is NO_PORTS:
+            self._ports = self.ports_factory()
         self._ports.insert(index, port)
-        self._ports_by_name[port.name] = port
         self.notify("change:ports", self.id)
 
     def remove_port(self, name):
-        port = self._ports_by_name[name]
-        self._ports.remove(port)
+        self._ports.remove(name)
+        self.notify("change:ports", self.id)
+
+    def move_port(self, name, index):
+        self._ports.move(name, index)
         self.notify("change:ports", self.id)
 
     def get_ports(self):
-        return [port.serialize() for port in self._ports]
+        "Returns frozen serialized ports, shared until ports change"
+        return self._ports.serialize()
 
     def set_ports(self, ports):
-        self._ports = deepcopy(ports)
+        self._ports = self.ports_factory(ports) if ports else NO_PORTS
         self.notify("change:ports", self.id)
 
     def get_state(self):
-        return deepcopy(self._state)
+        "Returns frozen state, it is shared and never changes"
+        return self._state
 
     def set_state(self, state):
-        self._state = state
+        self._state = freeze(state)
         self.notify("change:state", self.id)
 
-class Link(object):
-    def __init__(self, start_id, start_name, end_id, end_name):
-        super().__init__()
-        self._start_id = start_id
-        self._start_name = start_name
-        self._end_id = end_id
-        self._end_name = end_name
-
-    @property
-    def start_id(self): 
-        return self._start_id
-
-    @property
-    def start_name(self): 
-        return self._start_name
-
-    @property
-    def end_id(self): 
-        return self._end_id
-
-    @property
-    def end_name(self): 
-        return self._end_name
+    def dump(self):
+        return [(port.name, port.title) for port in self._ports], self._state
+
+    def restore(self, ports, state):
+        "Sets ports from `(name, title)` pairs and state without notifications"
+        port_factory = self.port_factory
+        if ports:
+            self._ports = self.ports_factory(
+                port_factory(name, title) for name, title in ports)
+        self._state = freeze(state)
+
+class Link(tuple):
+    """
+    Link is its own key `(start_id, start_name, end_id, end_name)`, so
+    graph indexes hold no extra tuple per link. Strings are interned and
+    shared with nodes and ports.
+    """
+    __slots__ = ()
+
+    def __new__(cls, start_id, start_name, end_id, end_name):
+        return tuple.__new__(cls, (_intern(start_id), _intern(start_name),
+            _intern(end_id), _intern(end_name)))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    start_id = property(itemgetter(0))
+    start_name = property(itemgetter(1))
+    end_id = property(itemgetter(2))
+    end_name = property(itemgetter(3))
 
 class Graph(EventEmmiter):
+    """
+    With `acyclic` set links closing a cycle are refused, and topological
+    order of nodes is kept up to date by `topology_factory` as links come.
+    """
     node_factory = Node
     link_factory = Link
+    adjacency_factory = Adjacency
+    topology_factory = TopologicalOrder
+    acyclic = False
 
     def __init__(self):
         super().__init__()
         self._rev = 0
         self._nodes_by_id = {}
         self._links_by_key = {}
-        self._links_by_start_id = defaultdict(dict)
-        self._links_by_end_id = defaultdict(dict)
+        self._adjacency = self.adjacency_factory()
+        self._topology = self.topology_factory(self) if self.acyclic else None
 
     @property
     def rev(self):
@@ -170,6 +299,15 @@ class Graph(EventEmmiter):
         self._rev += 1
         return old
 
+    @property
+    def next_rev(self):
+        "Revision which the next event will get, without consuming it"
+        return self._rev
+
+    def advance(self, rev):
+        "Moves revision counter past already issued `rev`"
+        self._rev = max(self._rev, rev + 1)
+
     def has_node(self, id):
         return id in self._nodes_by_id
 
@@ -178,12 +316,22 @@ class Graph(EventEmmiter):
 
     def add_node(self, node):
         self._nodes_by_id[node.id] = node
+        if self._topology is not None:
+            self._topology.add_node(node.id)
         self.notify("node:add", node.id)
 
     def remove_node(self, id):
         del self._nodes_by_id[id]
+        if self._topology is not None:
+            self._topology.remove_node(id)
         self.notify("node:remove", id)
 
+    @staticmethod
+    def _key(link):
+        if isinstance(link, Link):
+            return link
+        return Link(link.start_id, link.start_name, link.end_id, link.end_name)
+
     def has_link(self, start_id, start_name, end_id, end_name):
         key = (start_id, start_name, end_id, end_name)
         return key in self._links_by_key
@@ -193,24 +341,102 @@ class Graph(EventEmmiter):
         return self._links_by_key[key]
 
     def add_link(self, link):
-        key = (link.start_id, link.start_name, link.end_id, link.end_name)
-        self._links_by_start_id[link.start_id][key] = link
-        self._links_by_end_id[link.end_id][key] = link
+        key = self._key(link)
+        if self._topology is not None:
+            # raises CycleError before anything is changed
+            self._topology.add_link(link.start_id, link.end_id)
+        self._adjacency.add(link)
         self._links_by_key[key] = link
         self.notify("link:add", key)
 
     def remove_link(self, start_id, start_name, end_id, end_name):
         key = (start_id, start_name, end_id, end_name)
+        # adjacency raises KeyError before anything is changed
+        self._adjacency.remove(start_id, start_name, end_id, end_name)
         del self._links_by_key[key]
-        del self._links_by_start_id[start_id][key]
-        del self._links_by_end_id[end_id][key]
         self.notify("link:remove", key)
 
+    def topological_order(self):
+        """
+        Returns node ids where every node comes before nodes its links
+        lead to. Acyclic graph keeps it ready, others build it each time.
+        """
+        topology = self._topology
+        if topology is None:
+            topology = self.topology_factory(self)
+            topology.rebuild(self._ordered_ids())
+        return list(topology)
+
+    def _ordered_ids(self):
+        ids = dict.fromkeys(self._nodes_by_id)
+        for key in self._links_by_key:
+            ids[key[0]] = None
+        return ids
+
     def find_links_startswith(self, start_id):
-        yield from list(self._links_by_start_id[start_id].values())
+        yield from self._adjacency.outgoing(start_id)
 
     def find_links_endswith(self, end_id):
-        yield from list(self._links_by_end_id[end_id].values())
+        yield from self._adjacency.incoming(end_id)
+
+    def iter_links_startswith(self, start_id, names=None):
+        "Live view of links starting at node, optionally at ports `names`"
+        return self._adjacency.iter_outgoing(start_id, names)
+
+    def iter_links_endswith(self, end_id, names=None):
+        "Live view of links ending at node, optionally at ports `names`"
+        return self._adjacency.iter_incoming(end_id, names)
+
+    def find_links_from(self, start_id, start_name):
+        yield from self._adjacency.starting_at(start_id, start_name)
+
+    def fan_out(self, id, name):
+        return self._adjacency.fan_out(id, name)
+
+    def fan_in(self, id, name):
+        return self._adjacency.fan_in(id, name)
+
+    def dump(self):
+        "Returns `(rev, nodes, links)` as plain data, `rev` is the last issued one"
+        nodes = [(id,) + node.dump() for id, node in self._nodes_by_id.items()]
+        return self._rev - 1, nodes, [tuple(key) for key in self._links_by_key]
+
+    def load(self, rev, nodes, links):
+        "Replaces contents with `dump()` result in bulk, without notifications"
+        node_factory = self.node_factory
+        link_factory = self.link_factory
+        self._rev = rev + 1
+        self._nodes_by_id = nodes_by_id = {}
+        self._links_by_key = links_by_key = {}
+        self._adjacency = adjacency = self.adjacency_factory()
+        for id, ports, state in nodes:
+            node = nodes_by_id[id] = node_factory(id)
+            node.restore(ports, state)
+        for key in links:
+            link = link_factory(*key)
+            key = self._key(link)
+            links_by_key[key] = link
+            adjacency.add(link)
+        if self.acyclic:
+            self._topology = self.topology_factory(self)
+            self._topology.rebuild(self._ordered_ids())
+
+    def snapshot(self, visible=None):
+        """
+        Returns serialized nodes `[id, ports, state]` and links 
+        `[start_id, start_name, end_id, end_name]`. Optional `visible`
+        predicate limits nodes and links to ones touching visible nodes.
+        """
+        if visible is None:
+            nodes = [[id, node.get_ports(), node.get_state()]
+                for id, node in self._nodes_by_id.items()]
+            links = [list(key) for key in self._links_by_key]
+        else:
+            nodes = [[id, node.get_ports(), node.get_state()]
+                for id, node in self._nodes_by_id.items() if visible(id)]
+            links = [list(key) for key in self._links_by_key 
+                if visible(key[0]) or visible(key[2])]
+        return nodes, links
 
     # ======================================================================== #
 
@@ -226,6 +452,28 @@ class Graph(EventEmmiter):
         if not self.has_node(id): 
             raise Cancel() from NoSuchNode(id)
 
+    def check_patch_state(self, id, patch):
+        if not self.has_node(id): 
+            raise Cancel() from NoSuchNode(id)
+        try:
+            validate_patch(patch)
+        except PatchError as error:
+            raise Cancel() from error
+
+    def check_add_port(self, id, name):
+        "Port names are unique within node, `Ports` refuses duplicates"
+        if not self.has_node(id):
+            raise Cancel() from NoSuchNode(id)
+        if self.get_node(id).has_port(name):
+            raise Cancel() from PortExists(id, name)
+
+    def patched_state(self, id, patch):
+        "Returns state of node `id` with `patch` applied, node is left intact"
+        try:
+            return apply_patch(self.get_node(id).get_state(), patch)
+        except PatchError as error:
+            raise Cancel() from error
+
     def check_add_link(self, start_id, start_name, end_id, end_name):
         if not self.has_node(start_id): 
             raise Cancel() from NoSuchNode(start_id)
@@ -242,6 +490,10 @@ class Graph(EventEmmiter):
         if self.has_link(start_id, start_name, end_id, end_name):
             raise Confirm() from LinkExists(start_id, start_name, end_id, end_name)
 
+        if (self._topology is not None and
+                self._topology.creates_cycle(start_id, end_id)):
+            raise Cancel() from LinkCycle(start_id, start_name, end_id, end_name)
+
     def check_remove_link(self, start_id, start_name, end_id, end_name):
         if not self.has_node(start_id): 
             raise Confirm() from NoSuchNode(start_id)
@@ -0,0 +1,151 @@
+from collections import deque
+
+__all__ = [
+    "CycleError",
+    "TopologicalOrder",
+    ]
+
+class CycleError(ValueError): pass
+
+class TopologicalOrder(object):
+    """
+    Topological order of graph nodes kept up to date as links are added,
+    following Pearce and Kelly: a link which goes backwards in the order
+    only reorders nodes lying between its ends, which can reach or be
+    reached from them. Removing links never breaks the order. Removed
+    nodes leave holes which are squeezed out once they make up half of
+    the order.
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+        self._order = []
+        self._position = {}
+        self._holes = 0
+
+    def __len__(self):
+        return len(self._position)
+
+    def __iter__(self):
+        "Yields node ids, every node comes before nodes its links lead to"
+        for id in self._order:
+            if id is not None:
+                yield id
+
+    def __contains__(self, id):
+        return id in self._position
+
+    def position(self, id):
+        "Returns number which is smaller for nodes earlier in the order"
+        return self._position[id]
+
+    def add_node(self, id):
+        if id not in self._position:
+            self._position[id] = len(self._order)
+            self._order.append(id)
+
+    def remove_node(self, id):
+        position = self._position.pop(id, None)
+        if position is None:
+            return
+        self._order[position] = None
+        self._holes += 1
+        if self._holes * 2 > len(self._order):
+            self._squeeze()
+
+    def _squeeze(self):
+        self._order = [id for id in self._order if id is not None]
+        self._position = {id: index for index, id in enumerate(self._order)}
+        self._holes = 0
+
+    def creates_cycle(self, start_id, end_id):
+        "Tells whether link from `start_id` to `end_id` closes a cycle"
+        if start_id == end_id:
+            return True
+        position = self._position
+        if start_id not in position or end_id not in position:
+            return False
+        if position[start_id] < position[end_id]:
+            return False
+        return self._forward(end_id, start_id) is None
+
+    def add_link(self, start_id, end_id):
+        """
+        Makes room for link from `start_id` to `end_id`, which is not in
+        the graph yet. Raises `CycleError` if it closes a cycle.
+        """
+        if start_id == end_id:
+            raise CycleError(start_id, end_id)
+        self.add_node(start_id)
+        self.add_node(end_id)
+        position = self._position
+        if position[start_id] < position[end_id]:
+            return
+        forward = self._forward(end_id, start_id)
+        if forward is None:
+            raise CycleError(start_id, end_id)
+        backward = self._backward(start_id, position[end_id])
+        key = position.__getitem__
+        nodes = sorted(backward, key=key) + sorted(forward, key=key)
+        slots = sorted(map(key, nodes))
+        for id, slot in zip(nodes, slots):
+            position[id] = slot
+            self._order[slot] = id
+
+    def _forward(self, id, target):
+        "Nodes reachable from `id` placed before `target`, None if it is reached"
+        position = self._position
+        bound = position[target]
+        links = self._graph.iter_links_startswith
+        seen = {id}
+        pending = [id]
+        while pending:
+            for link in links(pending.pop()):
+                next_id = link[2]
+                if next_id == target:
+                    return None
+                if next_id not in seen and position.get(next_id, bound) < bound:
+                    seen.add(next_id)
+                    pending.append(next_id)
+        return seen
+
+    def _backward(self, id, bound):
+        "Nodes reaching `id` placed after `bound`"
+        position = self._position
+        links = self._graph.iter_links_endswith
+        seen = {id}
+        pending = [id]
+        while pending:
+            for link in links(pending.pop()):
+                next_id = link[0]
+                if next_id not in seen and position.get(next_id, bound) > bound:
+                    seen.add(next_id)
+                    pending.append(next_id)
+        return seen
+
+    def rebuild(self, ids):
+        """
+        Orders nodes `ids`, starts of all links among them, and ends of
+        their links from scratch. Nodes on cycles, which acyclic graph
+        never has, are put last.
+        """
+        graph = self._graph
+        degree = dict.fromkeys(ids, 0)
+        for id in list(degree):
+            for link in graph.iter_links_startswith(id):
+                degree[link[2]] = degree.get(link[2], 0) + 1
+        ready = deque(id for id, count in degree.items() if count == 0)
+        order = []
+        while ready:
+            id = ready.popleft()
+            order.append(id)
+            for link in graph.iter_links_startswith(id):
+                degree[link[2]] -= 1
+                if degree[link[2]] == 0:
+                    ready.append(link[2])
+        if len(order) < len(degree):
+            placed = set(order)
+            order.extend(id for id in degree if id not in placed)
+        self._order = order
+        self._position = {id: index for index, id in enumerate(order)}
+        self._holes = 0
@@ -0,0 +1,125 @@
+'''
+Traversals of `Graph` which follow links through its adjacency index.
+
+Links are followed from start to end, or backwards with `reverse`.
+`ports` limits them to ones leaving nodes through ports of these names:
+start ports going forward, end ports going backwards. Everything is
+iterative, so depth of the graph is not limited by the recursion limit,
+and the graph must not change while a traversal is in progress.
+'''
+
+from collections import deque
+
+__all__ = [
+    'bfs',
+    'dfs',
+    'descendants',
+    'ancestors',
+    'reachable',
+    'shortest_path',
+    'subgraph',
+    ]
+
+def _neighbours(graph, reverse, ports):
+    "Returns function yielding `(next_id, link)` for links leaving node"
+    if reverse:
+        links = graph.iter_links_endswith
+        return lambda id: ((link[0], link) for link in links(id, ports))
+    links = graph.iter_links_startswith
+    return lambda id: ((link[2], link) for link in links(id, ports))
+
+def bfs(graph, start, reverse=False, ports=None):
+    """
+    Yields `(id, link)` for nodes reachable from `start` breadth-first,
+    `link` is the one the node was reached by, `None` for `start`.
+    """
+    neighbours = _neighbours(graph, reverse, ports)
+    seen = {start}
+    pending = deque([start])
+    yield start, None
+    while pending:
+        for next_id, link in neighbours(pending.popleft()):
+            if next_id not in seen:
+                seen.add(next_id)
+                pending.append(next_id)
+                yield next_id, link
+
+def dfs(graph, start, reverse=False, ports=None):
+    "Yields `(id, link)` like `bfs` but depth-first, in preorder"
+    neighbours = _neighbours(graph, reverse, ports)
+    seen = {start}
+    stack = [neighbours(start)]
+    yield start, None
+    while stack:
+        for next_id, link in stack[-1]:
+            if next_id not in seen:
+                seen.add(next_id)
+                yield next_id, link
+                stack.append(neighbours(next_id))
+                break
+        else:
+            stack.pop()
+
+def _reach(graph, start, reverse, ports):
+    "Returns set of nodes reachable from `start`, including it"
+    if reverse:
+        links, side = graph.iter_links_endswith, 0
+    else:
+        links, side = graph.iter_links_startswith, 2
+    seen = {start}
+    pending = [start]
+    while pending:
+        for link in links(pending.pop(), ports):
+            next_id = link[side]
+            if next_id not in seen:
+                seen.add(next_id)
+                pending.append(next_id)
+    return seen
+
+def descendants(graph, id, ports=None):
+    "Returns set of nodes reachable from `id` by links, without `id`"
+    result = _reach(graph, id, False, ports)
+    result.discard(id)
+    return result
+
+def ancestors(graph, id, ports=None):
+    "Returns set of nodes `id` is reachable from, without `id`"
+    result = _reach(graph, id, True, ports)
+    result.discard(id)
+    return result
+
+def reachable(graph, start, end, reverse=False, ports=None):
+    "Tells whether `end` is reachable from `start`, stops as soon as it is"
+    return any(id == end for id, _ in bfs(graph, start, reverse, ports))
+
+def shortest_path(graph, start, end, reverse=False, ports=None):
+    """
+    Returns list of links on a path from `start` to `end` with the
+    fewest links, empty if they are the same node, `None` if there is
+    no path.
+    """
+    parents = {}
+    for id, link in bfs(graph, start, reverse, ports):
+        parents[id] = link
+        if id == end:
+            break
+    else:
+        return None
+    path = []
+    link = parents[end]
+    while link is not None:
+        path.append(link)
+        link = parents[link[2] if reverse else link[0]]
+    path.reverse()
+    return path
+
+def subgraph(graph, ids):
+    """
+    Returns `(nodes, links)` induced by node `ids`: nodes by id and links
+    which both start and end among them.
+    """
+    ids = set(ids)
+    nodes = {id: graph.get_node(id) for id in ids}
+    links = [link for id in ids for link in graph.iter_links_startswith(id)
+        if link[2] in ids]
+    return nodes, links
@@ -0,0 +1,176 @@
+import os
+import sys
+import struct
+import ctypes
+import ctypes.util
+from collections import OrderedDict
+
+__all__ = [
+    "Watcher",
+    ]
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+
+EVENT = struct.Struct("iIII")
+
+def _libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+class Watcher(object):
+    """
+    Watches folders for entries created, deleted or moved in and out,
+    using Linux inotify read from the loop. Changes are collected until
+    nothing happens for `delay` seconds, but no longer than `max_delay`,
+    then coalesced per entry and handed to `apply` as lists of
+    `(folder, name, exists)` in chunks of `batch_size`, one chunk per
+    loop iteration. `apply(None)` means kernel queue overflowed and
+    changes were lost.
+    """
+    mask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+    delay = 0.1
+    max_delay = 1.0
+    batch_size = 256
+
+    _libc = _libc()
+
+    @classmethod
+    def available(cls):
+        return cls._libc is not None
+
+    def __init__(self, loop, apply):
+        if not self.available():
+            raise OSError("inotify is not available")
+        self._loop = loop
+        self._apply = apply
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._paths = {}
+        self._watches = {}
+        self._changes = OrderedDict()
+        self._first = None
+        self._handle = None
+        self._loop.add_reader(self._fd, self._read)
+
+    def add(self, path):
+        "Starts watching folder `path`, returns False if it can not be watched"
+        if path in self._watches:
+            return True
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.mask)
+        if wd < 0:
+            return False
+        self._paths[wd] = path
+        self._watches[path] = wd
+        return True
+
+    def remove(self, path):
+        wd = self._watches.pop(path, None)
+        if wd is not None:
+            del self._paths[wd]
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def close(self):
+        if self._fd is None:
+            return
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._loop.remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = None
+
+    # ======================================================================== #
+
+    def _read(self):
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            self._parse(data)
+        self._schedule()
+
+    def _parse(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, size = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + size].rstrip(b"\0")
+            offset += size
+            if mask & IN_Q_OVERFLOW:
+                self._changes[None] = None
+                continue
+            if mask & IN_IGNORED:
+                path = self._paths.pop(wd, None)
+                if path is not None:
+                    self._watches.pop(path, None)
+                continue
+            folder = self._paths.get(wd)
+            if folder is None or not name:
+                continue
+            self._change(folder, os.fsdecode(name), bool(mask & (IN_CREATE | IN_MOVED_TO)))
+
+    def _change(self, folder, name, exists):
+        "Keeps whether entry existed before the first change and after the last"
+        key = (folder, name)
+        before = self._changes.get(key, (not exists, None))[0]
+        self._changes[key] = (before, exists)
+
+    def _schedule(self):
+        if not self._changes:
+            return
+        now = self._loop.time()
+        if self._first is None:
+            self._first = now
+        if self._handle is not None:
+            self._handle.cancel()
+        when = min(now + self.delay, self._first + self.max_delay)
+        self._handle = self._loop.call_at(when, self._flush)
+
+    def _flush(self):
+        self._handle = None
+        self._first = None
+        changes, self._changes = self._changes, OrderedDict()
+        if None in changes:
+            self._apply(None)
+            return
+        result = []
+        for (folder, name), (before, after) in changes.items():
+            if before and after:
+                # replaced, old entry goes away first
+                result.append((folder, name, False))
+                result.append((folder, name, True))
+            elif before != after:
+                result.append((folder, name, after))
+        self._deliver(result)
+
+    def _deliver(self, changes):
+        if self._fd is None:
+            return
+        chunk, rest = changes[:self.batch_size], changes[self.batch_size:]
+        if chunk:
+            self._apply(chunk)
+        if rest:
+            self._loop.call_soon(self._deliver, rest)
@@ -1,6 +1,8 @@
 import uuid
+from collections import OrderedDict
 
 from revigred.record import Record
+from revigred.frame import Frame
 
 __all__ = [
     "User",
@@ -21,10 +23,56 @@ class Origin(object):
     def rev(self):
         return self._rev
 
+def coalesce(frames):
+    """
+    Returns `frames` where state changes followed by `changeState` of the
+    same node are replaced with `nop`, so revisions stay contiguous.
+    Replies to user's own commands are kept.
+    """
+    result = []
+    replaced = set()
+    for frame in reversed(frames):
+        name, args, kwargs = frame.message
+        if name == "changeState" or name == "patchState":
+            if args[0] in replaced:
+                if "origin" not in kwargs:
+                    stamp = {key: kwargs[key] for key in ("rev", "since") if key in kwargs}
+                    frame = Frame("nop", (), stamp)
+            elif name == "changeState":
+                replaced.add(args[0])
+        result.append(frame)
+    result.reverse()
+    return result
+
 class User(object):
+    """
+    Frames sent within one loop iteration are written together. While the
+    transport can not keep up and asks to pause writing they wait in the
+    outbox. Once more than `max_queue` of them wait, not counting `nop`,
+    slow consumer policy `overflow_<slow_policy>` is applied:
+
+    * "resync" drops them and sends `resync_frame()` when writing resumes;
+    * "coalesce" replaces superseded state changes with `nop` first and
+      resyncs if that is not enough, or there are too many `nop` already;
+    * "disconnect" drops the connection.
+    """
+    max_queue = 10000
+    slow_policy = "resync"
+
     def __init__(self, model):
         self._protocol = None
+        self._outbox = []
+        self._nops = 0
+        self._paused = False
+        self._stale = False
+        self._resync = False
+        self._peak = 0
+        self._dropped = 0
+        self._coalesced = 0
+        self._resyncs = 0
         self.id = "USER-" + uuid.uuid4().hex
+        # secret which lets another connection continue as this user
+        self.session = uuid.uuid4().hex
         self.model = model
 
     def connect(self, protocol):
@@ -32,12 +80,21 @@ class User(object):
 
     def disconnect(self):
         self.model.remove_user(self)
+        self._outbox = []
         self._protocol = None
         self.model = None
 
+    def abandon(self):
+        "Session was taken over by another connection, this one is dropped"
+        self._outbox = []
+        self._nops = 0
+        self._stale = True
+        if self._protocol is not None:
+            self._protocol.abort()
+
     @property
     def profile(self):
-        return Record(id=self.id)
+        return Record(id=self.id, session=self.session)
 
     def dispatch(self, name, *args, **kwargs):
         func = getattr(self, "on_" + name, None)
@@ -49,24 +106,171 @@ class User(object):
         self.send("auth", **self.profile)
 
     def send(self, __name, *args, **kwargs):
-        message = (__name, args, kwargs)
-        self._protocol.sendMessage(message)
+        self.send_frame(Frame(__name, args, kwargs))
+
+    def reply(self, accepted, __name, *args, **kwargs):
+        "Answers own command, not `accepted` ones are heard of by nobody else"
+        self.send(__name, *args, **kwargs)
+
+    def send_frame(self, frame):
+        if self._stale:
+            self._dropped += 1
+            return
+        outbox = self._outbox
+        if not outbox and not self._paused:
+            self._protocol.loop.call_soon(self.flush)
+        outbox.append(frame)
+        if frame.name == "nop":
+            self._nops += 1
+        # nops are cheap to keep, but not without limit
+        if len(outbox) - self._nops > self.max_queue or len(outbox) > 4 * self.max_queue:
+            self._peak = max(self._peak, len(outbox))
+            getattr(self, "overflow_" + self.slow_policy)()
+
+    def flush(self):
+        if self._paused and self._protocol is not None:
+            return
+        frames, self._outbox = self._outbox, []
+        self._peak = max(self._peak, len(frames))
+        self._nops = 0
+        if self._protocol is None:
+            return
+        if self._resync:
+            self._resync = self._stale = False
+            frames = [self.resync_frame()]
+        if not frames:
+            return
+        if len(frames) == 1:
+            self._protocol.sendFrame(frames[0])
+        else:
+            self._protocol.sendFrames(frames)
+
+    def pause_writing(self):
+        "Transport buffer is full, frames wait in outbox until resumed"
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        if self._outbox or self._resync:
+            self.flush()
+
+    def resync_frame(self):
+        "Frame bringing user up to date after dropped ones, None if unsupported"
+        return None
+
+    def overflow_resync(self):
+        if self.resync_frame() is None:
+            return self.overflow_disconnect()
+        self._dropped += len(self._outbox)
+        self._outbox = []
+        self._nops = 0
+        self._stale = self._resync = True
+        self._resyncs += 1
+
+    def overflow_coalesce(self):
+        before = len(self._outbox) - self._nops
+        self._outbox = coalesce(self._outbox)
+        self._nops = sum(1 for frame in self._outbox if frame.name == "nop")
+        self._coalesced += before - (len(self._outbox) - self._nops)
+        if (len(self._outbox) - self._nops > self.max_queue // 2 or
+                len(self._outbox) > 2 * self.max_queue):
+            self.overflow_resync()
+
+    def overflow_disconnect(self):
+        self._dropped += len(self._outbox)
+        self._outbox = []
+        self._nops = 0
+        self._stale = True
+        self._protocol.abort()
+
+    @property
+    def stats(self):
+        "Outbound queue metrics"
+        buffered = 0
+        if self._protocol is not None:
+            buffered = self._protocol.write_buffer_size
+        return Record(
+            queued=len(self._outbox),
+            peak=max(self._peak, len(self._outbox)),
+            buffered=buffered,
+            paused=self._paused,
+            dropped=self._dropped,
+            coalesced=self._coalesced,
+            resyncs=self._resyncs,
+            )
 
 class Users(object):
+    """
+    Connected users. Sessions of `max_sessions` users gone most recently
+    are remembered, so they can be resumed by reconnecting clients.
+    """
     user_factory = User
+    max_sessions = 10000
 
     def __init__(self):
         self._users = {}
+        self._sessions = {}
+        self._gone = OrderedDict()
+        # called without arguments when the last user leaves
+        self.emptied = None
 
-    def create_new_user(self):
-        user = self.user_factory(self)
+    @property
+    def idle(self):
+        "True while nobody is connected"
+        return not self._users
+
+    def create_new_user(self, factory=None, session=None):
+        user = (factory or self.user_factory)(self)
+        if session is not None:
+            self._take_over(user, session)
         self._users[user.id] = user
+        self._sessions[user.session] = user
         return user
 
+    def resume_user(self, session, rev):
+        "Creates user continuing `session`, which client has seen up to `rev`"
+        return self.create_new_user(session=session)
+
+    def _take_over(self, user, session):
+        "Gives `user` identity of the one which had `session`, if known"
+        old = self._sessions.get(session)
+        if old is not None:
+            # client is back before its old connection was noticed gone
+            self.remove_user(old)
+            old.abandon()
+        state = self._gone.pop(session, None)
+        if state is not None:
+            user.session = session
+            self.restore_session(user, state)
+
+    def session_state(self, user):
+        "What is kept of gone `user` for the one resuming its session"
+        return user.id
+
+    def restore_session(self, user, state):
+        user.id = state
+
     def remove_user(self, user):
+        if self._users.get(user.id) is not user:
+            # its session has been taken over already
+            return
         del self._users[user.id]
+        del self._sessions[user.session]
+        self._gone[user.session] = self.session_state(user)
+        if len(self._gone) > self.max_sessions:
+            self._gone.popitem(last=False)
+        if not self._users and self.emptied is not None:
+            self.emptied()
+
+    def queue_stats(self):
+        "Returns outbound queue metrics by user id"
+        return {id: user.stats for id, user in self._users.items()}
+
+    def close(self):
+        pass
 
     def broadcast(self, __name, *args, **kwargs):
+        frame = Frame(__name, args, kwargs)
         for id, user in self._users.items():
-            user.send(__name, *args, **kwargs)
+            user.send_frame(frame)
 
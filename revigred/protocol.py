@@ -1,49 +1,135 @@
-import asyncio
-import json
-
 from autobahn.asyncio.websocket import (
     WebSocketServerProtocol,
     WebSocketServerFactory,
     )
+from autobahn.websocket.types import ConnectionDeny
+
+from revigred.frame import Frame
+from revigred.model.documents import document_name
+from revigred.codec import (
+    CODECS,
+    select_codec,
+    )
+
+def resume_point(params):
+    """
+    Returns `(session, rev)` from query `params` of reconnecting client,
+    None if it starts afresh or they are malformed.
+    """
+    session = params.get("session")
+    rev = params.get("rev")
+    if not session or not rev:
+        return None
+    try:
+        return session[0], int(rev[0])
+    except ValueError:
+        return None
 
 class ServerProtocol(WebSocketServerProtocol):
     def onConnect(self, request):
-        self.client = self.model.create_new_user()
+        self.codec = select_codec(request.protocols, self.factory.codecs)
+        try:
+            self.model = self.factory.model_for(request.path)
+        except ValueError as error:
+            raise ConnectionDeny(ConnectionDeny.NOT_FOUND, str(error))
+        point = resume_point(request.params)
+        if point is not None:
+            # reconnecting client continues where it was
+            self.client = self.model.resume_user(*point)
+        else:
+            self.client = self.model.create_new_user()
         self.client.connect(self)
-        self.logger.debug("Client connecting: {0}", request.peer)
+        if self.factory.write_buffer_limit is not None:
+            self.transport.set_write_buffer_limits(high=self.factory.write_buffer_limit)
+        self.logger.debug("Client connecting: {0} using {1}", request.peer, self.codec)
+        if self.codec.subprotocol in request.protocols:
+            return self.codec.subprotocol
 
-    @asyncio.coroutine
     def onOpen(self):
         self.client.channel_opened()
 
-    @asyncio.coroutine
     def onMessage(self, payload, isBinary):
-        if isBinary:
-            pass
+        if isBinary != self.codec.binary:
+            self.logger.warning("Unexpected frame type from {0}", self.client)
         else:
-            message = json.loads(payload.decode('utf8'))
-            self.logger.debug("Text message received from {0}: {1}", self.client, payload.decode('utf8'))
+            message = self.codec.decode(payload)
+            self.logger.debug("Message received from {0}: {1}", self.client, message)
             name, args, kwargs = message
-            self.client.dispatch(name, *args, **kwargs)
+            try:
+                self.client.dispatch(name, *args, **kwargs)
+            except Exception:
+                self.logger.exception("Command {0} from {1} failed", name, self.client)
+                raise
 
     def onClose(self, wasClean, code, reason):
-        self.client.disconnect()
+        client = getattr(self, "client", None)
+        if client is not None:
+            # connections to unknown documents are denied without one
+            client.disconnect()
         self.logger.debug("WebSocket connection closed: {0}", reason)
 
     def sendMessage(self, message):
-        data = json.dumps(message).encode("utf-8")
-        super().sendMessage(data, False)
+        self.sendFrame(Frame(*message))
+
+    def sendFrame(self, frame):
+        prepared = frame.encode((self.factory, self.codec), self._prepareFrame)
+        self.sendPreparedMessage(prepared)
+
+    def sendFrames(self, frames):
+        data = self.codec.encode_batch(
+            [self.codec.encode_frame(frame) for frame in frames])
+        super().sendMessage(data, self.codec.binary)
+
+    def _prepareFrame(self, frame):
+        data = self.codec.encode_frame(frame)
+        return self.factory.prepareMessage(data, self.codec.binary)
+
+    def pause_writing(self):
+        super().pause_writing()
+        client = getattr(self, "client", None)
+        if client is not None:
+            client.pause_writing()
+
+    def resume_writing(self):
+        super().resume_writing()
+        client = getattr(self, "client", None)
+        if client is not None:
+            client.resume_writing()
+
+    @property
+    def write_buffer_size(self):
+        if self.transport is None:
+            return 0
+        return self.transport.get_write_buffer_size()
+
+    def abort(self):
+        "Drops connection of client which can not keep up"
+        self.logger.warning("Dropping slow client {0}", self.client)
+        self.dropConnection(abort=True)
+
+    @property
+    def loop(self):
+        return self.factory.loop
 
 class ServerFactory(WebSocketServerFactory):
     protocol = ServerProtocol
 
     def __init__(self, *args, **kwargs):
-        self.model = kwargs.pop("model")
+        # either one model for everyone or models by requested document
+        self.model = kwargs.pop("model", None)
+        self.documents = kwargs.pop("documents", None)
         self.logger = kwargs.pop("logger")
+        self.codecs = kwargs.pop("codecs", None) or CODECS
+        # transport asks to pause writing above this many buffered bytes
+        self.write_buffer_limit = kwargs.pop("write_buffer_limit", 256 * 1024)
         super().__init__(*args, **kwargs)
 
+    def model_for(self, path):
+        if self.documents is None:
+            return self.model
+        return self.documents.get(document_name(path))
+
     def __call__(self):
         proto = super().__call__()
-        proto.model = self.model
         proto.logger = self.logger
-        return proto
\ No newline at end of file
+        return proto
@@ -0,0 +1,347 @@
+import os
+import sys
+import array
+import errno
+import signal
+import socket
+import asyncio
+import traceback
+import zlib
+
+from revigred.model.documents import document_name
+
+__all__ = [
+    "Supervisor",
+    "Worker",
+    "owner",
+    "request_path",
+    ]
+
+def owner(name, workers):
+    "Returns index of worker which hosts document `name`"
+    return zlib.crc32(name.encode("utf-8")) % workers
+
+def request_path(head):
+    """
+    Returns path from HTTP request line at the start of `head`, empty
+    one if line is malformed, None if it is not complete yet.
+    """
+    line, sep, _ = head.partition(b"\r\n")
+    if not sep:
+        return None
+    parts = line.split()
+    if len(parts) < 2:
+        return ""
+    return parts[1].decode("latin-1")
+
+def listen(host, port, backlog=128):
+    "Returns listening socket which shares `port` with other processes"
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+def send_socket(channel, sock):
+    "Passes `sock` over unix `channel` to the process at the other end"
+    fds = array.array("i", [sock.fileno()])
+    channel.sendmsg([b"s"], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+
+def receive_sockets(channel, limit=64):
+    "Returns sockets passed with one message over unix `channel`"
+    fds = array.array("i")
+    _, ancdata, _, _ = channel.recvmsg(1, socket.CMSG_LEN(limit * fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    return [socket.socket(fileno=fd) for fd in fds]
+
+class Worker(object):
+    """
+    One of processes sharing listening port. Peeks at the request line of
+    each accepted connection, without reading it, and serves connection
+    itself when it owns requested document. Otherwise connection is handed
+    over to the owner through its channel, where it is served as if
+    accepted there. When the owner does not take connections for a while
+    they are rejected, a document is never served by two workers.
+    """
+    peek_size = 4096
+    # incomplete request line is looked at again after this many seconds
+    peek_delay = 0.01
+    # connections without request line by then are closed
+    peek_timeout = 10.0
+    # connections waiting for busy owner, more are rejected at once
+    max_handoffs = 64
+    handoff_timeout = 5.0
+    reject_response = (b"HTTP/1.1 503 Service Unavailable\r\n"
+        b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+
+    def __init__(self, index, listener, channels, factory, loop):
+        self.index = index
+        self._listener = listener
+        self._channels = channels
+        self._factory = factory
+        self._loop = loop
+        self._peeking = {}
+        self._delayed = {}
+        self._handoffs = {}
+        self.accepted = 0
+        self.handed = 0
+        self.received = 0
+        self.expired = 0
+        self.rejected = 0
+
+    @property
+    def workers(self):
+        return len(self._channels)
+
+    def start(self):
+        self._loop.add_reader(self._listener.fileno(), self._accept)
+        self._loop.add_reader(self._inbox.fileno(), self._receive)
+
+    def stop(self):
+        self._loop.remove_reader(self._listener.fileno())
+        self._loop.remove_reader(self._inbox.fileno())
+        for target, queue in self._handoffs.items():
+            self._loop.remove_writer(self._channels[target][1].fileno())
+            for conn, timer in queue:
+                timer.cancel()
+                conn.close()
+        self._handoffs.clear()
+        for conn in list(self._peeking):
+            self._unwatch(conn)
+            conn.close()
+
+    @property
+    def _inbox(self):
+        return self._channels[self.index][0]
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as error:
+                if error.errno in (errno.EMFILE, errno.ENFILE, errno.ECONNABORTED):
+                    return
+                raise
+            self.accepted += 1
+            conn.setblocking(False)
+            self._peeking[conn] = self._loop.call_later(
+                self.peek_timeout, self._expire, conn)
+            self._loop.add_reader(conn.fileno(), self._peek, conn)
+
+    def _watch(self, conn):
+        del self._delayed[conn]
+        self._loop.add_reader(conn.fileno(), self._peek, conn)
+
+    def _unwatch(self, conn):
+        self._peeking.pop(conn).cancel()
+        delayed = self._delayed.pop(conn, None)
+        if delayed is not None:
+            delayed.cancel()
+        self._loop.remove_reader(conn.fileno())
+
+    def _expire(self, conn):
+        del self._peeking[conn]
+        delayed = self._delayed.pop(conn, None)
+        if delayed is not None:
+            delayed.cancel()
+        self._loop.remove_reader(conn.fileno())
+        self.expired += 1
+        conn.close()
+
+    def _peek(self, conn):
+        try:
+            head = conn.recv(self.peek_size, socket.MSG_PEEK)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            head = b""
+        if not head:
+            self._unwatch(conn)
+            conn.close()
+            return
+        path = request_path(head)
+        if path is None and len(head) < self.peek_size:
+            # data stays unread, so wait instead of being woken up at once
+            self._loop.remove_reader(conn.fileno())
+            self._delayed[conn] = self._loop.call_later(
+                self.peek_delay, self._watch, conn)
+            return
+        self._unwatch(conn)
+        self.route(conn, document_name(path or ""))
+
+    def route(self, conn, name):
+        target = owner(name, self.workers)
+        if target == self.index:
+            self.serve(conn)
+        elif target in self._handoffs:
+            # keep order of connections already waiting for the owner
+            self._wait(target, conn)
+        else:
+            self._hand(target, conn)
+
+    def _hand(self, target, conn):
+        try:
+            send_socket(self._channels[target][1], conn)
+        except (BlockingIOError, InterruptedError):
+            self._wait(target, conn)
+        except OSError:
+            self.reject(conn)
+        else:
+            self.handed += 1
+            conn.close()
+
+    def _wait(self, target, conn):
+        queue = self._handoffs.get(target)
+        if queue is None:
+            queue = self._handoffs[target] = []
+            self._loop.add_writer(self._channels[target][1].fileno(),
+                self._flush, target)
+        if len(queue) >= self.max_handoffs:
+            self.reject(conn)
+            return
+        timer = self._loop.call_later(self.handoff_timeout, self._give_up, target, conn)
+        queue.append((conn, timer))
+
+    def _flush(self, target):
+        queue = self._handoffs[target]
+        while queue:
+            conn, timer = queue[0]
+            try:
+                send_socket(self._channels[target][1], conn)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                self.reject(conn)
+            else:
+                self.handed += 1
+                conn.close()
+            del queue[0]
+            timer.cancel()
+        self._done(target)
+
+    def _give_up(self, target, conn):
+        queue = self._handoffs[target]
+        for index, (waiting, _) in enumerate(queue):
+            if waiting is conn:
+                del queue[index]
+                break
+        if not queue:
+            self._done(target)
+        self.reject(conn)
+
+    def _done(self, target):
+        del self._handoffs[target]
+        self._loop.remove_writer(self._channels[target][1].fileno())
+
+    def reject(self, conn):
+        self.rejected += 1
+        try:
+            conn.send(self.reject_response)
+        except OSError:
+            pass
+        conn.close()
+
+    def _receive(self):
+        try:
+            socks = receive_sockets(self._inbox)
+        except (BlockingIOError, InterruptedError):
+            return
+        for conn in socks:
+            self.received += 1
+            conn.setblocking(False)
+            self.serve(conn)
+
+    def serve(self, conn):
+        asyncio.ensure_future(
+            self._loop.connect_accepted_socket(self._factory, conn),
+            loop=self._loop)
+
+class Supervisor(object):
+    """
+    Forks `workers` processes, each listening on the same port with
+    SO_REUSEPORT, and waits for them. Each process calls `serve` with its
+    index, listening socket and channels of all workers; `serve` is
+    expected to run `Worker` until process is told to stop with SIGTERM.
+    """
+
+    def __init__(self, host, port, workers, serve):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self._serve = serve
+        self._pids = []
+
+    def start(self):
+        # port 0 is resolved once, so all workers share one port
+        holder = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        holder.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        holder.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        holder.bind((self.host, self.port))
+        self.port = holder.getsockname()[1]
+        channels = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            for _ in range(self.workers)]
+        for pair in channels:
+            for sock in pair:
+                # full channel of busy owner must not block whole worker
+                sock.setblocking(False)
+        try:
+            for index in range(self.workers):
+                pid = os.fork()
+                if pid == 0:
+                    holder.close()
+                    self._run(index, channels)
+                self._pids.append(pid)
+        finally:
+            holder.close()
+            for pair in channels:
+                for sock in pair:
+                    sock.close()
+
+    def _run(self, index, channels):
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+            listener = listen(self.host, self.port)
+            self._serve(index, listener, channels)
+        except KeyboardInterrupt:
+            pass
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def stop(self):
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def wait(self):
+        "Waits for all workers, returns their exit codes"
+        codes = []
+        for pid in self._pids:
+            _, status = os.waitpid(pid, 0)
+            if os.WIFEXITED(status):
+                codes.append(os.WEXITSTATUS(status))
+            else:
+                codes.append(-os.WTERMSIG(status))
+        self._pids = []
+        return codes
+
+    def run(self):
+        self.start()
+        try:
+            return self.wait()
+        except KeyboardInterrupt:
+            self.stop()
+            return self.wait()
@@ -5,6 +5,10 @@ from revigred.model import (
     ClientGraphModel,
     User,
     )
+from revigred.model.graph.client import (
+    Existence,
+    InvalidRevision,
+    )
 from .utils import (
     Counter,
     make_node_id,
@@ -30,3 +34,184 @@ class TestGraphModel(unittest.TestCase):
         self.model.dispatch('createNode', self.id, rev=rev.rev, origin=origin.rev)
         self.model.dispatch('changePorts', self.id, PORTS, rev=rev.rev)
         self.model.dispatch('changeState', self.id, {}, rev=rev.rev)
+
+    def test_create_single_node_batch(self):
+        self.id = make_node_id()
+        rev = Counter()
+        origin = Counter()
+
+        self.model.graph.create_node(self.id)
+        self.model.receive([
+            ('createNode', [self.id], {'rev': rev.rev, 'origin': origin.rev}),
+            ('changePorts', [self.id, PORTS], {'rev': rev.rev}),
+            ('changeState', [self.id, {}], {'rev': rev.rev}),
+            ])
+        self.model.receive(('nop', [], {'rev': rev.rev}))
+        self.assertEqual(self.model._server_rev, 4)
+
+    def test_feed_payload(self):
+        self.id = make_node_id()
+        rev = Counter()
+        codec = self.model.codec
+        self.model.feed(codec.encode(('createNode', [self.id], {'rev': rev.rev})))
+        self.assertEqual(self.model._server_rev, 1)
+        self.assertEqual(codec.decode(self.model.command('nodeCreated', self.id, rev=0)),
+            ['nodeCreated', [self.id], {'rev': 0}])
+
+    def test_snapshot(self):
+        self.id = make_node_id()
+        self.model.receive(('snapshot', [[[self.id, PORTS, {}]], []], {'rev': 5}))
+        self.model.receive(('removeNode', [self.id], {'rev': 5}))
+        self.assertEqual(self.model._server_rev, 6)
+
+    def test_snapshot_keeps_pending(self):
+        self.id = make_node_id()
+        self.model.graph.create_node(self.id)
+        self.model.receive(('snapshot', [[], []], {'rev': 5}))
+        self.model.receive(('createNode', [self.id], {'rev': 5, 'origin': 0}))
+        node = self.model.graph._nodes[self.id]
+        self.assertEqual(node.current(), Existence.CREATED)
+        self.assertEqual(len(node._unresolved), 0)
+
+    def test_skipped_revisions(self):
+        self.id = make_node_id()
+        self.model.receive(('createNode', [self.id], {'rev': 0}))
+        # revisions 1 and 2 answered rejected commands of others
+        self.model.receive(('changeState', [self.id, {'x': 1}], {'rev': 3, 'since': 1}))
+        self.model.receive(('nop', [], {'rev': 4}))
+        self.assertEqual(self.model._server_rev, 5)
+        with self.assertRaises(InvalidRevision):
+            self.model.receive(('nop', [], {'rev': 9, 'since': 6}))
+
+    def test_show_hide_node(self):
+        self.id = make_node_id()
+        self.model.receive(('showNode', [self.id, PORTS, {'x': 1}, []], {'rev': 0}))
+        self.model.receive(('hideNode', [self.id], {'rev': 1}))
+        self.assertEqual(self.model._server_rev, 2)
+
+    def test_batch(self):
+        self.id = make_node_id()
+        self.model.graph.create_node(self.id)
+        self.model.receive(('batch', [[
+            ['createNode', [self.id]],
+            ['changePorts', [self.id, PORTS]],
+            ['changeState', [self.id, {}]],
+            ['changeState', [self.id, {'x': 1}]],
+            ]], {'rev': 0, 'origin': 0}))
+        self.model.receive(('batch', [None], {'rev': 1}))
+        self.assertEqual(self.model._server_rev, 2)
+
+    def test_batch_show_hide(self):
+        id1 = make_node_id()
+        id2 = make_node_id()
+        self.model.receive(('createNode', [id1], {'rev': 0}))
+        self.model.receive(('batch', [[
+            ['hideNode', [id1]],
+            ['showNode', [id2, PORTS, {'x': 1}, [[id2, 'start', id1, 'end']]]],
+            ['patchState', [id2, [[['y'], 2]]]],
+            ]], {'rev': 1}))
+        graph = self.model.graph
+        self.assertEqual(graph._nodes[id1].current(), Existence.REMOVED)
+        self.assertEqual(graph._nodes[id2].current(), Existence.CREATED)
+        self.assertEqual(graph._ports[id2].current(), PORTS)
+        self.assertEqual(graph._links[(id2, 'start', id1, 'end')].current(), Existence.CREATED)
+
+    def test_remove_node_cascades_links(self):
+        id1 = make_node_id()
+        id2 = make_node_id()
+        rev = Counter()
+        self.model.receive([
+            ('createNode', [id1], {'rev': rev.rev}),
+            ('createNode', [id2], {'rev': rev.rev}),
+            ('addLink', [id1, 'start', id2, 'end'], {'rev': rev.rev}),
+            ('addLink', [id2, 'start', id1, 'end'], {'rev': rev.rev}),
+            ('removeLink', [id2, 'start', id1, 'end'], {'rev': rev.rev}),
+            ('removeNode', [id1], {'rev': rev.rev}),
+            ])
+        links = self.model.graph._links
+        self.assertEqual(links[(id1, 'start', id2, 'end')].current(), Existence.REMOVED)
+        self.assertEqual(links[(id1, 'start', id2, 'end')]._their.top(), 5)
+        self.assertEqual(links[(id2, 'start', id1, 'end')]._their.top(), 4)
+
+    def test_patch_state(self):
+        self.id = make_node_id()
+        rev = Counter()
+        self.model.receive([
+            ('createNode', [self.id], {'rev': rev.rev}),
+            ('changeState', [self.id, {'x': 1, 'props': {'a': 1}}], {'rev': rev.rev}),
+            ('patchState', [self.id, [[['x'], 2], [['props', 'a']]]], {'rev': rev.rev}),
+            ('batch', [[
+                ['patchState', [self.id, [[['y'], 3]]]],
+                ['patchState', [self.id, [[['x'], 4]]]],
+                ]], {'rev': rev.rev}),
+            ])
+        state = self.model.graph._states[self.id]
+        self.assertEqual(state.current(), {'x': 4, 'y': 3, 'props': {}})
+        self.assertEqual(state._their.get(2), {'x': 2, 'props': {}})
+
+    def test_port_deltas(self):
+        self.id = make_node_id()
+        rev = Counter()
+        self.model.receive([
+            ('createNode', [self.id], {'rev': rev.rev}),
+            ('changePorts', [self.id, PORTS], {'rev': rev.rev}),
+            ('addPort', [self.id, {'name': 'a', 'title': ''}, 1], {'rev': rev.rev}),
+            ('addPort', [self.id, {'name': 'b', 'title': ''}, None], {'rev': rev.rev}),
+            ('movePort', [self.id, 'b', 0], {'rev': rev.rev}),
+            ('removePort', [self.id, 'start'], {'rev': rev.rev}),
+            ])
+        ports = self.model.graph._ports[self.id]
+        self.assertEqual([port['name'] for port in ports.current()], ['b', 'a', 'end'])
+        self.assertEqual([port['name'] for port in ports._their.get(1)], ['start', 'end'])
+        # deltas edit one copy in place
+        self.assertIs(ports._their.get(2), ports.current())
+
+class ShortGraph(ClientGraph):
+    history = 4
+
+class ShortModelGraph(ClientGraphModel):
+    graph_factory = ShortGraph
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.model = ShortModelGraph()
+        self.graph = self.model.graph
+        self.rev = Counter()
+
+    def churn(self, id1, id2):
+        self.model.receive([
+            ('createNode', [id1], {'rev': self.rev.rev}),
+            ('createNode', [id2], {'rev': self.rev.rev}),
+            ('changeState', [id1, {'x': 1}], {'rev': self.rev.rev}),
+            ('addLink', [id1, 'start', id2, 'end'], {'rev': self.rev.rev}),
+            ('removeNode', [id1], {'rev': self.rev.rev}),
+            ('removeNode', [id2], {'rev': self.rev.rev}),
+            ])
+
+    def test_compaction(self):
+        id = make_node_id()
+        self.model.receive(('createNode', [id], {'rev': self.rev.rev}))
+        for x in range(20):
+            self.model.receive(('changeState', [id, {'x': x}], {'rev': self.rev.rev}))
+        state = self.graph._states[id]
+        self.assertLessEqual(len(state._their), 9)
+        self.assertEqual(state.current(), {'x': 19})
+        self.assertEqual(state._their.top(), 20)
+
+    def test_removed_forgotten(self):
+        for _ in range(10):
+            self.churn(make_node_id(), make_node_id())
+        for _ in range(10):
+            self.model.receive(('nop', [], {'rev': self.rev.rev}))
+        for repos in (self.graph._nodes, self.graph._ports,
+                self.graph._states, self.graph._links):
+            self.assertEqual(len(repos), 0)
+        self.assertEqual(len(self.graph._links_by_node), 0)
+
+    def test_pending_kept(self):
+        id = make_node_id()
+        self.graph.create_node(id)
+        for _ in range(10):
+            self.model.receive(('nop', [], {'rev': self.rev.rev}))
+        self.model.receive(('createNode', [id], {'rev': self.rev.rev, 'origin': 0}))
+        self.assertEqual(self.graph._nodes[id].current(), Existence.CREATED)
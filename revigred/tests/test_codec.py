@@ -0,0 +1,75 @@
+import unittest
+
+from revigred.frame import Frame
+from revigred.record import Record
+from revigred.codec import (
+    JSONCodec,
+    MsgPackCodec,
+    CODECS,
+    select_codec,
+    msgpack,
+    )
+from .utils import (
+    make_node_id,
+    )
+
+PORTS = [Record(name='start', title=''), Record(name='end', title='')]
+
+def make_messages():
+    id1 = make_node_id()
+    id2 = make_node_id()
+    return [
+        ('createNode', [id1], {'rev': 0, 'origin': 0}),
+        ('changePorts', [id1, PORTS], {'rev': 1}),
+        ('changeState', [id1, {'__type__': 'Root', 'path': None, 'x': 1.5}], {'rev': 2}),
+        ('addLink', [id1, 'start', id2, 'end'], {'rev': 3}),
+        ('say', ['NODE-not-an-id', 'hello'], {'name': 'John Smith'}),
+        ('say', [id1 + '\n', 'USER-' + 'a' * 32 + '\n'], {}),
+        ]
+
+class CodecTestsMixin(object):
+    def test_roundtrip(self):
+        for message in make_messages():
+            decoded = self.codec.decode(self.codec.encode(message))
+            self.assertEqual(decoded, list(message))
+
+    def test_batch(self):
+        messages = make_messages()
+        parts = [self.codec.encode(message) for message in messages]
+        decoded = self.codec.decode(self.codec.encode_batch(parts))
+        self.assertEqual(decoded, [list(message) for message in messages])
+
+    def test_frame_encoded_once(self):
+        frame = Frame('nop', (), {'rev': 0})
+        self.assertIs(self.codec.encode_frame(frame), self.codec.encode_frame(frame))
+
+class TestJSONCodec(CodecTestsMixin, unittest.TestCase):
+    def setUp(self):
+        self.codec = JSONCodec()
+
+@unittest.skipIf(msgpack is None, "msgpack is not installed")
+class TestMsgPackCodec(CodecTestsMixin, unittest.TestCase):
+    def setUp(self):
+        self.codec = MsgPackCodec()
+
+    def test_large_batch(self):
+        message = ('nop', [], {'rev': 0})
+        for size in (15, 16, 0x10000):
+            parts = [self.codec.encode(message)] * size
+            decoded = self.codec.decode(self.codec.encode_batch(parts))
+            self.assertEqual(len(decoded), size)
+
+    def test_smaller_than_json(self):
+        json_codec = JSONCodec()
+        for message in make_messages()[:4]:
+            self.assertLess(len(self.codec.encode(message)), 
+                len(json_codec.encode(message)))
+
+class TestSelectCodec(unittest.TestCase):
+    def test_default(self):
+        self.assertIs(select_codec([]), CODECS[0])
+        self.assertIs(select_codec(["unknown"]), CODECS[0])
+
+    def test_client_preference(self):
+        for codec in CODECS:
+            self.assertIs(select_codec(["unknown", codec.subprotocol]), codec)
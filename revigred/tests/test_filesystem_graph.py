@@ -1,5 +1,10 @@
-import unittest
+import os
 import uuid
+import asyncio
+import tempfile
+import unittest
+from revigred.model.graph.scanner import Scan
+from revigred.model.graph.watcher import Watcher
 from revigred.model.graph.fs import (
     FSGraph, 
     FSGraphModel,
@@ -31,10 +36,9 @@ class FakeUser(User):
         super().__init__(model)
         self._message_pool = []
 
-    def send(self, name, *args, **kwargs):
-        message = (name, args, kwargs)
-        print(*message)
-        self._message_pool.append(message)
+    def send_frame(self, frame):
+        print(*frame.message)
+        self._message_pool.append(frame.message)
 
     @property
     def messages(self):
@@ -87,3 +91,259 @@ class TestGraphModel(unittest.TestCase):
         #     ('createNode', (self.id,), {'rev': rev.rev}),
         #     ('changeState', (self.id, {}), {'rev': rev.rev}),
         #     ])
+
+    def test_patch_state(self):
+        self.id = make_node_id()
+        test = Counter()
+        self.user.dispatch("nodeCreated", self.id, rev=test.rev)
+        self.user.dispatch("nodeStatePatched", self.id, [[["path"], "."]], rev=test.rev)
+        self.user.dispatch("nodeStatePatched", self.id, [[["x"], 5]], rev=test.rev)
+
+        self.assertSequenceEqual(self.user.messages[-2:], [
+            ('patchState', (self.id, None), {'rev': 3, 'origin': 1}),
+            ('patchState', (self.id, [[["x"], 5]]), {'rev': 4, 'since': 3, 'origin': 2}),
+            ])
+        self.assertEqual(self.graph.get_node(self.id).get_state(),
+            {"__type__": "Root", "path": None, "x": 5})
+
+class TestScan(unittest.TestCase):
+    expand_depth = None
+    max_entries = None
+    watch = False
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.model = FakeModelGraph(loop=self.loop, watch=self.watch)
+        self.model.expand_depth = self.expand_depth
+        self.model.max_entries = self.max_entries
+        self.graph = self.model.graph
+        self.user = self.model.create_new_user()
+        self.temp = tempfile.TemporaryDirectory()
+        self.make_tree(self.temp.name, {
+            "a": {"b": {"c.txt": None}, "d.txt": None},
+            "e.txt": None,
+            })
+        self.id = make_node_id()
+        self.user.dispatch("nodeCreated", self.id, rev=0)
+
+    def tearDown(self):
+        self.model.close()
+        self.loop.close()
+        self.temp.cleanup()
+
+    def make_tree(self, path, tree):
+        for name, content in tree.items():
+            subpath = os.path.join(path, name)
+            if content is None:
+                open(subpath, "w").close()
+            else:
+                os.mkdir(subpath)
+                self.make_tree(subpath, content)
+
+    def tree(self, id):
+        "Returns nested `{name: subtree}` rebuilt from graph links"
+        result = {}
+        for link in self.graph.find_links_startswith(id):
+            result[link.start_name] = self.tree(link.end_id)
+        return result
+
+    def scan(self, path, rev=1):
+        self.user.dispatch("nodeStateChanged", self.id, {"path": path}, rev=rev)
+        return self.model._scans[self.id]
+
+    def test_scan(self):
+        scan = self.scan(self.temp.name)
+        self.loop.run_until_complete(scan.done)
+        self.assertEqual(self.tree(self.id),
+            {"a": {"b": {"c.txt": {}}, "d.txt": {}}, "e.txt": {}})
+        folder = self.graph.get_node(next(
+            link.end_id for link in self.graph.find_links_startswith(self.id)
+            if link.start_name == "a"))
+        self.assertEqual(folder.get_state()["__type__"], "Folder")
+        self.assertNotIn(self.id, self.model._scans)
+
+    def test_input_named_entry(self):
+        self.model.expand_depth = None
+        self.model.max_entries = None
+        self.make_tree(os.path.join(self.temp.name, "a"), {"in": None})
+        self.loop.run_until_complete(self.scan(self.temp.name).done)
+        folder = self.graph.get_node(next(
+            link.end_id for link in self.graph.find_links_startswith(self.id)
+            if link.start_name == "a"))
+        self.assertEqual(self.tree(folder.id), {"b": {"c.txt": {}}, "d.txt": {}, "/in": {}})
+        self.assertEqual(folder.get_port("/in").title, "in")
+        self.assertTrue(folder.has_port("in"))
+
+    def test_batches(self):
+        self.model.scan_factory = type("SmallScan", (Scan,), {"batch_size": 1, "window": 1})
+        batches = []
+        fill_entries = self.model.fill_entries
+        def counting(paths, entries):
+            batches.append(len(entries))
+            fill_entries(paths, entries)
+        self.model.fill_entries = counting
+        self.loop.run_until_complete(self.scan(self.temp.name).done)
+        self.assertEqual(max(batches), 1)
+        self.assertEqual(len(self.tree(self.id)), 2)
+
+    def test_rescan_cancels(self):
+        other = os.path.join(self.temp.name, "a")
+        first = self.scan(self.temp.name)
+        second = self.scan(other, rev=2)
+        self.assertTrue(first.cancelled)
+        self.loop.run_until_complete(second.done)
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(self.tree(self.id), {"b": {"c.txt": {}}, "d.txt": {}})
+        self.assertEqual(len(self.graph._nodes_by_id), 4)
+
+    def test_remove_cancels(self):
+        scan = self.scan(self.temp.name)
+        self.user.dispatch("nodeRemoved", self.id, rev=2)
+        self.assertTrue(scan.cancelled)
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(len(self.graph._nodes_by_id), 0)
+
+    def test_batch_remove_cancels(self):
+        scan = self.scan(self.temp.name)
+        self.user.dispatch("batch", [["nodeRemoved", [self.id]]], rev=2)
+        self.assertTrue(scan.cancelled)
+        self.assertEqual(self.model._scans, {})
+        self.assertFalse(self.graph.has_node(self.id))
+
+class TestExpand(TestScan):
+    expand_depth = 1
+    max_entries = 2
+
+    def child(self, id, name):
+        for link in self.graph.find_links_startswith(id):
+            if link.start_name == name:
+                return link.end_id
+
+    def run_scans(self):
+        while self.model._scans:
+            self.loop.run_until_complete(
+                next(iter(self.model._scans.values())).done)
+
+    def test_scan(self):
+        self.model.max_entries = None
+        self.scan(self.temp.name)
+        self.run_scans()
+        self.assertEqual(self.tree(self.id), {"a": {}, "e.txt": {}})
+        folder = self.graph.get_node(self.child(self.id, "a"))
+        self.assertFalse(folder.get_state()["expanded"])
+
+    def test_expand_collapse(self):
+        self.model.max_entries = None
+        self.scan(self.temp.name)
+        self.run_scans()
+        folder = self.child(self.id, "a")
+        self.user.dispatch("expandNode", folder, rev=2)
+        self.run_scans()
+        self.assertEqual(self.tree(self.id), {"a": {"b": {}, "d.txt": {}}, "e.txt": {}})
+        self.assertTrue(self.graph.get_node(folder).get_state()["expanded"])
+
+        self.user.dispatch("expandNode", folder, rev=3)
+        self.assertEqual(self.user.messages[-1][:2], ("patchState", (folder, [])))
+
+        self.user.dispatch("collapseNode", folder, rev=4)
+        self.assertEqual(self.tree(self.id), {"a": {}, "e.txt": {}})
+        self.assertEqual(len(self.graph._nodes_by_id), 3)
+        self.assertEqual(self.user.messages[-1][:2],
+            ("patchState", (folder, [[["expanded"], False]])))
+
+        self.user.dispatch("expandNode", make_node_id(), rev=5)
+        self.assertEqual(self.user.messages[-1][1][1], None)
+
+    def test_rescan_cancels(self):
+        self.model.max_entries = None
+        first = self.scan(self.temp.name)
+        second = self.scan(os.path.join(self.temp.name, "a"), rev=2)
+        self.assertTrue(first.cancelled)
+        self.run_scans()
+        self.assertEqual(self.tree(self.id), {"b": {}, "d.txt": {}})
+
+    def test_entry_limit(self):
+        self.make_tree(self.temp.name, {"f.txt": None, "g.txt": None})
+        self.scan(self.temp.name)
+        self.run_scans()
+        self.assertEqual(len(self.tree(self.id)), 2)
+        self.assertTrue(self.graph.get_node(self.id).get_state()["truncated"])
+
+    def test_collapse_while_scanning(self):
+        self.model.expand_depth = None
+        self.model.max_entries = None
+        scan = self.scan(self.temp.name)
+        self.user.dispatch("collapseNode", self.id, rev=2)
+        self.assertTrue(scan.cancelled)
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(len(self.graph._nodes_by_id), 1)
+        self.assertFalse(self.graph.get_node(self.id).get_state()["expanded"])
+
+class QuickWatcher(Watcher):
+    delay = 0.01
+    max_delay = 0.1
+
+@unittest.skipUnless(Watcher.available(), "inotify is not available")
+class TestWatch(TestScan):
+    watch = True
+
+    def setUp(self):
+        super().setUp()
+        self.model.watcher_factory = QuickWatcher
+
+    def settle(self):
+        self.loop.run_until_complete(self.scan(self.temp.name).done)
+        self.sync()
+
+    def sync(self):
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+
+    def test_create_remove(self):
+        self.settle()
+        self.make_tree(os.path.join(self.temp.name, "a", "b"), {"f.txt": None})
+        self.make_tree(self.temp.name, {"g": {"h.txt": None}})
+        self.sync()
+        tree = self.tree(self.id)
+        self.assertEqual(tree["a"]["b"], {"c.txt": {}, "f.txt": {}})
+        # folder created after the scan comes collapsed
+        self.assertEqual(tree["g"], {})
+
+        os.remove(os.path.join(self.temp.name, "a", "b", "c.txt"))
+        os.rename(os.path.join(self.temp.name, "a", "d.txt"),
+            os.path.join(self.temp.name, "d.txt"))
+        self.sync()
+        self.assertEqual(self.tree(self.id),
+            {"a": {"b": {"f.txt": {}}}, "d.txt": {}, "e.txt": {}, "g": {}})
+        self.assertEqual(len(self.graph._nodes_by_id), 7)
+
+        before = len(self.user.messages)
+        os.rename(os.path.join(self.temp.name, "a"),
+            os.path.join(self.temp.name, "z"))
+        self.sync()
+        self.assertEqual(self.tree(self.id), {"d.txt": {}, "e.txt": {}, "g": {}, "z": {}})
+        names = [message[0] for message in self.user.messages[before:]]
+        self.assertEqual(names.count("removeNode"), 3)
+        self.assertNotIn("changePorts", names)
+
+    def test_coalesce(self):
+        self.settle()
+        before = len(self.user.messages)
+        path = os.path.join(self.temp.name, "tmp.txt")
+        for _ in range(10):
+            open(path, "w").close()
+            os.remove(path)
+        self.sync()
+        self.assertEqual(self.user.messages[before:], [])
+
+    def test_batch_remove_unwatches(self):
+        self.settle()
+        self.user.dispatch("batch", [["nodeRemoved", [self.id]]], rev=2)
+        self.assertNotIn(self.temp.name, self.model._watched)
+
+    def test_collapse_unwatches(self):
+        self.settle()
+        self.user.dispatch("collapseNode", self.id, rev=2)
+        self.assertEqual(self.model._watched, {})
+        self.make_tree(self.temp.name, {"f.txt": None})
+        self.sync()
+        self.assertEqual(self.tree(self.id), {})
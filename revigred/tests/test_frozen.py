@@ -0,0 +1,97 @@
+import copy
+import json
+import pickle
+import unittest
+
+from revigred.frozen import (
+    FrozenDict,
+    FrozenError,
+    FrozenList,
+    PatchError,
+    apply_patch,
+    freeze,
+    thaw,
+    )
+from revigred.model import Node
+
+class TestFrozen(unittest.TestCase):
+    def setUp(self):
+        self.value = {"x": 1, "items": [{"a": [1, 2]}, (3, 4)], "title": "t"}
+        self.frozen = freeze(self.value)
+
+    def test_equal(self):
+        self.assertEqual(self.frozen, {"x": 1, "items": [{"a": [1, 2]}, [3, 4]], "title": "t"})
+        self.assertIsInstance(self.frozen["items"], FrozenList)
+        self.assertIsInstance(self.frozen["items"][0], FrozenDict)
+
+    def test_immutable(self):
+        with self.assertRaises(FrozenError):
+            self.frozen["x"] = 2
+        with self.assertRaises(FrozenError):
+            self.frozen.update(x=2)
+        with self.assertRaises(FrozenError):
+            del self.frozen["title"]
+        with self.assertRaises(FrozenError):
+            self.frozen["items"].append(1)
+        with self.assertRaises(FrozenError):
+            self.frozen["items"][0]["a"][0] = 5
+        self.assertEqual(self.frozen["x"], 1)
+
+    def test_shared(self):
+        self.assertIs(freeze(self.frozen), self.frozen)
+        self.assertIs(copy.deepcopy(self.frozen), self.frozen)
+        changed = freeze(dict(self.frozen, x=2))
+        self.assertIs(changed["items"], self.frozen["items"])
+
+    def test_serialize(self):
+        self.assertEqual(json.loads(json.dumps(self.frozen)), self.frozen)
+        restored = pickle.loads(pickle.dumps(self.frozen))
+        self.assertEqual(restored, self.frozen)
+        self.assertIsInstance(restored, FrozenDict)
+        self.assertIsInstance(restored["items"][0], FrozenDict)
+
+    def test_thaw(self):
+        value = thaw(self.frozen)
+        value["items"][0]["a"].append(3)
+        self.assertEqual(self.frozen["items"][0]["a"], [1, 2])
+        self.assertIs(type(value["items"]), list)
+
+    def test_node_state(self):
+        node = Node("NODE-1")
+        state = {"x": [1]}
+        node.set_state(state)
+        state["x"].append(2)
+        self.assertEqual(node.get_state(), {"x": [1]})
+        self.assertIs(node.get_state(), node.get_state())
+
+    def test_patch(self):
+        patched = apply_patch(self.frozen, [
+            [["x"], 2],
+            [["items", 0, "a", 2], 3],
+            [["items", 1]],
+            [["title"]],
+            [["new"], {"b": [1]}],
+            ])
+        self.assertEqual(patched, {"x": 2, "items": [{"a": [1, 2, 3]}], "new": {"b": [1]}})
+        self.assertIsInstance(patched["new"]["b"], FrozenList)
+        self.assertEqual(self.frozen["x"], 1)
+        self.assertEqual(self.frozen["items"][0]["a"], [1, 2])
+
+    def test_patch_shares_untouched(self):
+        patched = apply_patch(self.frozen, [[["x"], 2]])
+        self.assertIs(patched["items"], self.frozen["items"])
+
+    def test_patch_errors(self):
+        for patch in (
+                [[["missing"]]],
+                [[["missing", "x"], 1]],
+                [[["items", 5], 1]],
+                [[["items", "a"], 1]],
+                [[["x", "y"], 1]],
+                [[["x"], 1, 2]],
+                [["x"]],
+                [[[], 1]],
+                {"x": 1},
+                ):
+            with self.assertRaises(PatchError):
+                apply_patch(self.frozen, patch)
@@ -1,11 +1,14 @@
 import unittest
 import uuid
+import json
+import asyncio
 from revigred.model import (
     Node, 
     Graph, 
     GraphModel,
     User,
     )
+from revigred.model.graph.model import GraphUser
 from .utils import (
     Counter,
     make_node_id,
@@ -24,15 +27,14 @@ class FakeOrigin(object):
     def rev(self):
         return self._rev
 
-class FakeUser(User):
+class FakeUser(GraphUser):
     def __init__(self, model):
         super().__init__(model)
         self._message_pool = []
 
-    def send(self, name, *args, **kwargs):
-        message = (name, args, kwargs)
-        print(*message)
-        self._message_pool.append(message)
+    def send_frame(self, frame):
+        print(*frame.message)
+        self._message_pool.append(frame.message)
 
     @property
     def messages(self):
@@ -111,7 +113,6 @@ class TestGraphModel(unittest.TestCase):
             ('createNode', (self.id,), {'rev': rev.rev}),
             ('changePorts', (self.id, PORTS), {'rev': rev.rev}),
             ('changeState', (self.id, {}), {'rev': rev.rev}),
-            ('nop', (), {'rev': rev.rev}),
             ])
 
     def test_create_single_node_remove_node(self):
@@ -150,7 +151,6 @@ class TestGraphModel(unittest.TestCase):
 
         rev = Counter()
         self.assertSequenceEqual(self.observer.messages, [
-            ('nop', (), {'rev': rev.rev}),
             ])
 
     def test_create_single_node_double_remove_node_conflict(self):
@@ -176,7 +176,6 @@ class TestGraphModel(unittest.TestCase):
             ('changePorts', (self.id, PORTS), {'rev': rev.rev}),
             ('changeState', (self.id, {}), {'rev': rev.rev}),
             ('removeNode', (self.id,), {'rev': rev.rev}),
-            ('nop', (), {'rev': rev.rev}),
             ])
 
     def test_create_remove_create_single(self):
@@ -245,9 +244,73 @@ class TestGraphModel(unittest.TestCase):
 
         rev = Counter()
         self.assertSequenceEqual(self.observer.messages, [
-            ('nop', (), {'rev': rev.rev}),
             ])
 
+    def test_patch_state(self):
+        self.id = make_node_id()
+        test = Counter()
+        patch = [[["x"], 10], [["props"], {"color": "red"}]]
+        self.user.dispatch("nodeCreated", self.id, rev=test.rev)
+        self.user.dispatch("nodeStatePatched", self.id, patch, rev=test.rev)
+        self.user.dispatch("nodeStatePatched", self.id, [[["props", "color"]]], rev=test.rev)
+        self.user.dispatch("nodeStatePatched", self.id, [[["y", "z"], 1]], rev=test.rev)
+
+        rev = Counter(3)
+        self.assertSequenceEqual(self.observer.messages[3:], [
+            ('patchState', (self.id, patch), {'rev': rev.rev}),
+            ('patchState', (self.id, [[["props", "color"]]]), {'rev': rev.rev}),
+            ])
+        self.assertEqual(self.user.messages[-1],
+            ('patchState', (self.id, None), {'rev': 5, 'origin': 3}))
+        self.assertEqual(self.graph.get_node(self.id).get_state(),
+            {"x": 10, "props": {}})
+
+        replica = FakeModelGraph()
+        for rev, (name, args, kwargs) in enumerate(self.observer.messages[:5]):
+            replica.replay(rev, name, *args)
+        self.assertEqual(replica.graph.snapshot(), self.graph.snapshot())
+
+    def test_patch_state_malformed(self):
+        self.id = make_node_id()
+        test = Counter()
+        self.user.dispatch("nodeCreated", self.id, rev=test.rev)
+        for patch in ({"x": 1}, [["x", 1]], [[[], 1]], [[[1.5], 1]]):
+            self.user.dispatch("nodeStatePatched", self.id, patch, rev=test.rev)
+            self.assertEqual(self.user.messages[-1][:2], ('patchState', (self.id, None)))
+        self.user.dispatch("nodeStatePatched", make_node_id(), [[["x"], 1]], rev=test.rev)
+        self.assertEqual(self.user.messages[-1][1][1], None)
+
+    def test_port_deltas(self):
+        self.id = make_node_id()
+        test = Counter()
+        self.user.dispatch("nodeCreated", self.id, rev=test.rev)
+        node = self.graph.get_node(self.id)
+        port = node.port_factory("middle", "Middle")
+        node.add_port(port, 1)
+        self.model.addPortAll(None, self.id, port, 1)
+        port = node.port_factory("last", "")
+        node.add_port(port)
+        self.model.addPortAll(None, self.id, port)
+        node.move_port("last", 0)
+        self.model.movePortAll(None, self.id, "last", 0)
+        node.remove_port("start")
+        self.model.removePortAll(None, self.id, "start")
+
+        rev = Counter(3)
+        self.assertSequenceEqual(self.observer.messages[3:], [
+            ('addPort', (self.id, {"name": "middle", "title": "Middle"}, 1), {'rev': rev.rev}),
+            ('addPort', (self.id, {"name": "last", "title": ""}, None), {'rev': rev.rev}),
+            ('movePort', (self.id, "last", 0), {'rev': rev.rev}),
+            ('removePort', (self.id, "start"), {'rev': rev.rev}),
+            ])
+        self.assertEqual([port["name"] for port in node.get_ports()],
+            ["last", "middle", "end"])
+
+        replica = FakeModelGraph()
+        for rev, (name, args, kwargs) in enumerate(self.observer.messages):
+            replica.replay(rev, name, *args)
+        self.assertEqual(replica.graph.snapshot(), self.graph.snapshot())
+
 class TestLinks(unittest.TestCase):
     def setUp(self):
         self.model = FakeModelGraph()
@@ -293,7 +356,6 @@ class TestLinks(unittest.TestCase):
         rev = Counter(6)
         self.assertSequenceEqual(self.observer.messages, [
             ('addLink', (self.id1, "start", self.id2, "end"), {'rev': rev.rev}),
-            ('nop', (), {'rev': rev.rev}),
             ])
 
     def test_create_remove_link(self):
@@ -332,9 +394,36 @@ class TestLinks(unittest.TestCase):
         self.assertSequenceEqual(self.observer.messages, [
             ('addLink', (self.id1, "start", self.id2, "end"), {'rev': rev.rev}),
             ('removeLink', (self.id1, "start", self.id2, "end"), {'rev': rev.rev}),
-            ('nop', (), {'rev': rev.rev}),
             ])
 
+    def test_remove_node_with_links(self):
+        test = Counter(2)
+        self.user.dispatch("linkAdded", self.id1, "start", self.id2, "end", rev=test.rev)
+        self.user.dispatch("linkAdded", self.id2, "start", self.id1, "end", rev=test.rev)
+        self.user.dispatch("linkAdded", self.id1, "start", self.id1, "end", rev=test.rev)
+        self.user.dispatch("nodeRemoved", self.id1, rev=test.rev)
+
+        rev = Counter(6)
+        self.assertSequenceEqual(self.observer.messages, [
+            ('addLink', (self.id1, "start", self.id2, "end"), {'rev': rev.rev}),
+            ('addLink', (self.id2, "start", self.id1, "end"), {'rev': rev.rev}),
+            ('addLink', (self.id1, "start", self.id1, "end"), {'rev': rev.rev}),
+            ('removeNode', (self.id1,), {'rev': rev.rev}),
+            ])
+        self.assertEqual(self.graph.snapshot(), ([[self.id2, PORTS, {}]], []))
+
+    def test_create_remove_self_loop(self):
+        test = Counter(2)
+        self.user.dispatch("linkAdded", self.id1, "start", self.id1, "start", rev=test.rev)
+        self.user.dispatch("linkRemoved", self.id1, "start", self.id1, "start", rev=test.rev)
+
+        rev = Counter(6)
+        self.assertSequenceEqual(self.observer.messages, [
+            ('addLink', (self.id1, "start", self.id1, "start"), {'rev': rev.rev}),
+            ('removeLink', (self.id1, "start", self.id1, "start"), {'rev': rev.rev}),
+            ])
+        self.assertEqual(len(self.graph._adjacency), 0)
+
     def test_remove_inexist_link_1(self):
         test = Counter(2)
         self.user.dispatch("linkRemoved", self.id1, "start", self.id2, "end", rev=test.rev)
@@ -347,7 +436,6 @@ class TestLinks(unittest.TestCase):
 
         rev = Counter(6)
         self.assertSequenceEqual(self.observer.messages, [
-            ('nop', (), {'rev': rev.rev}),
             ])
 
     def test_remove_inexist_link_2(self):
@@ -362,7 +450,6 @@ class TestLinks(unittest.TestCase):
 
         rev = Counter(6)
         self.assertSequenceEqual(self.observer.messages, [
-            ('nop', (), {'rev': rev.rev}),
             ])
 
     def test_remove_inexist_link_3(self):
@@ -377,7 +464,6 @@ class TestLinks(unittest.TestCase):
 
         rev = Counter(6)
         self.assertSequenceEqual(self.observer.messages, [
-            ('nop', (), {'rev': rev.rev}),
             ])
 
     def test_remove_inexist_link_4(self):
@@ -392,7 +478,6 @@ class TestLinks(unittest.TestCase):
 
         rev = Counter(6)
         self.assertSequenceEqual(self.observer.messages, [
-            ('nop', (), {'rev': rev.rev}),
             ])
 
     def test_remove_inexist_link_5(self):
@@ -407,5 +492,513 @@ class TestLinks(unittest.TestCase):
 
         rev = Counter(6)
         self.assertSequenceEqual(self.observer.messages, [
+            ])
+
+class AcyclicGraph(FakeGraph):
+    acyclic = True
+
+class AcyclicModelGraph(FakeModelGraph):
+    graph_factory = AcyclicGraph
+
+class TestAcyclicLinks(unittest.TestCase):
+    def setUp(self):
+        self.model = AcyclicModelGraph()
+        self.graph = self.model.graph
+        self.user = self.model.create_new_user()
+        self.id1 = make_node_id()
+        self.id2 = make_node_id()
+        test = Counter()
+        self.user.dispatch("nodeCreated", self.id1, rev=test.rev)
+        self.user.dispatch("nodeCreated", self.id2, rev=test.rev)
+        self.user.dispatch("linkAdded", self.id2, "start", self.id1, "end", rev=test.rev)
+        self.user.drop()
+
+    def test_cycle_refused(self):
+        self.user.dispatch("linkAdded", self.id1, "start", self.id2, "end", rev=3)
+        self.assertSequenceEqual(self.user.messages, [
+            ('removeLink', (self.id1, "start", self.id2, "end"), {'rev': 7, 'origin': 3}),
+            ])
+        self.assertFalse(self.graph.has_link(self.id1, "start", self.id2, "end"))
+        self.assertEqual(self.graph.topological_order(), [self.id2, self.id1])
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.model = FakeModelGraph()
+        self.graph = self.model.graph
+        self.user = self.model.create_new_user()
+        self.observer = self.model.create_new_user()
+        self.id1 = make_node_id()
+        self.id2 = make_node_id()
+
+    def test_batch(self):
+        self.user.dispatch("batch", [
+            ["nodeCreated", [self.id1]],
+            ["nodeCreated", [self.id2]],
+            ["nodeStateChanged", [self.id1, {"x": 1}]],
+            ["linkAdded", [self.id1, "start", self.id2, "end"]],
+            ["linkAdded", [self.id1, "start", self.id2, "end"]],
+            ], rev=0)
+
+        events = [
+            ["createNode", [self.id1]],
+            ["changePorts", [self.id1, PORTS]],
+            ["changeState", [self.id1, {}]],
+            ["createNode", [self.id2]],
+            ["changePorts", [self.id2, PORTS]],
+            ["changeState", [self.id2, {}]],
+            ["changeState", [self.id1, {"x": 1}]],
+            ["addLink", [self.id1, "start", self.id2, "end"]],
+            ]
+        self.assertSequenceEqual(self.user.messages, [
+            ('batch', (events,), {'rev': 0, 'origin': 0}),
+            ])
+        self.assertSequenceEqual(self.observer.messages, [
+            ('batch', (events,), {'rev': 0}),
+            ])
+        self.assertTrue(self.graph.has_link(self.id1, "start", self.id2, "end"))
+
+        replica = FakeModelGraph()
+        replica.replay(0, "batch", events)
+        self.assertEqual(replica.graph.snapshot(), self.graph.snapshot())
+
+    def test_batch_patch_state(self):
+        self.user.dispatch("batch", [
+            ["nodeCreated", [self.id1]],
+            ["nodeStatePatched", [self.id1, [[["x"], 1]]]],
+            ["nodeStatePatched", [self.id1, [[["y"], 2]]]],
+            ], rev=0)
+        self.assertEqual(self.observer.messages[-1][1][0][-2:], [
+            ["patchState", [self.id1, [[["x"], 1]]]],
+            ["patchState", [self.id1, [[["y"], 2]]]],
+            ])
+        self.assertEqual(self.graph.get_node(self.id1).get_state(), {"x": 1, "y": 2})
+
+        self.user.dispatch("batch", [
+            ["nodeStatePatched", [self.id1, [[["x"], 5]]]],
+            ["nodeStatePatched", [self.id1, [[["q", "w"], 2]]]],
+            ], rev=1)
+        self.assertEqual(self.graph.get_node(self.id1).get_state(), {"x": 1, "y": 2})
+
+    def test_rollback(self):
+        self.user.dispatch("nodeCreated", self.id1, rev=0)
+        self.user.dispatch("nodeStateChanged", self.id1, {"x": 1}, rev=1)
+        before = self.graph.snapshot()
+        self.user.drop()
+        self.observer.drop()
+        self.user.dispatch("batch", [
+            ["nodeCreated", [self.id2]],
+            ["linkAdded", [self.id1, "start", self.id2, "end"]],
+            ["nodeStateChanged", [self.id1, {"x": 2}]],
+            ["nodeRemoved", [self.id1]],
+            ["linkAdded", [self.id1, "start", self.id2, "end"]],
+            ], rev=2)
+
+        self.assertEqual(self.graph.snapshot(), before)
+        self.assertSequenceEqual(self.user.messages, [
+            ('batch', (None,), {'rev': 4, 'origin': 2}),
+            ])
+        self.assertSequenceEqual(self.observer.messages, [])
+
+    def test_rollback_malformed(self):
+        for operations in (
+                [["nodeCreated", [self.id1]], ["nodeStateChanged", [self.id1]]],
+                [["nodeCreated", [self.id1]], ["nodeRemoved"]],
+                [["nodeCreated", [self.id1]], 5]):
+            self.user.dispatch("batch", operations, rev=0)
+            self.assertFalse(self.graph.has_node(self.id1))
+        self.assertEqual(self.graph.snapshot(), ([], []))
+        self.assertEqual([message[:2] for message in self.user.messages],
+            [('batch', (None,))] * 3)
+        self.assertSequenceEqual(self.observer.messages, [])
+
+    def test_rollback_error(self):
+        def broken(undo, events, id):
+            raise RuntimeError(id)
+        self.model.batch_nodeRemoved = broken
+        with self.assertRaises(RuntimeError):
+            self.user.dispatch("batch", [
+                ["nodeCreated", [self.id1]],
+                ["nodeRemoved", [self.id1]],
+                ], rev=0)
+        self.assertFalse(self.graph.has_node(self.id1))
+        self.assertSequenceEqual(self.user.messages, [])
+
+class EncodingUser(FakeUser):
+    encoded = []
+
+    @classmethod
+    def encoder(cls, frame):
+        data = json.dumps(frame.message)
+        cls.encoded.append(data)
+        return data
+
+    def send_frame(self, frame):
+        super().send_frame(frame)
+        frame.encode("json", self.encoder)
+
+class EncodingModelGraph(FakeModelGraph):
+    user_factory = EncodingUser
+
+class TestFanOut(unittest.TestCase):
+    def setUp(self):
+        self.model = EncodingModelGraph()
+        self.user = self.model.create_new_user()
+        self.observers = [self.model.create_new_user() for i in range(10)]
+        EncodingUser.encoded = []
+
+    def test_encode_once_per_event(self):
+        self.id = make_node_id()
+        test = Counter()
+        self.user.dispatch("nodeCreated", self.id, rev=test.rev)
+        # origin's own copy plus one shared copy per event
+        self.assertEqual(len(EncodingUser.encoded), 4)
+        for observer in self.observers:
+            self.assertSequenceEqual(observer.messages, self.observers[0].messages)
+
+    def test_rejection_not_broadcast(self):
+        self.id = make_node_id()
+        for rev in range(3):
+            self.user.dispatch("nodeRemoved", self.id, rev=rev)
+        # replies to the sender only
+        self.assertEqual(len(EncodingUser.encoded), 3)
+        for observer in self.observers:
+            self.assertSequenceEqual(observer.messages, [])
+        self.user.drop()
+        self.user.dispatch("nodeCreated", self.id, rev=3)
+        self.assertEqual(self.observers[0].messages[0],
+            ('createNode', (self.id,), {'rev': 3, 'since': 0}))
+        self.assertEqual(self.observers[0].messages[1],
+            ('changePorts', (self.id, PORTS), {'rev': 4}))
+        self.assertEqual(self.user.messages[0],
+            ('createNode', (self.id,), {'rev': 3, 'since': 0, 'origin': 3}))
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.model = EncodingModelGraph()
+        self.user = self.model.create_new_user()
+        self.id1 = make_node_id()
+        self.id2 = make_node_id()
+        test = Counter()
+        self.user.dispatch("nodeCreated", self.id1, rev=test.rev)
+        self.user.dispatch("nodeCreated", self.id2, rev=test.rev)
+        self.user.dispatch("linkAdded", self.id1, "start", self.id2, "end", rev=test.rev)
+        EncodingUser.encoded = []
+
+    def test_snapshot_on_join(self):
+        joined = self.model.create_new_user()
+        joined.channel_opened()
+        self.assertSequenceEqual(joined.messages, [
+            ('auth', (), {'id': joined.id, 'session': joined.session}),
+            ('snapshot', ([
+                [self.id1, PORTS, {}],
+                [self.id2, PORTS, {}],
+                ], [
+                [self.id1, "start", self.id2, "end"],
+                ]), {'rev': 7}),
+            ])
+
+    def test_snapshot_shared_until_next_rev(self):
+        for i in range(10):
+            self.model.create_new_user().channel_opened()
+        # every auth differs, snapshot is encoded once
+        self.assertEqual(len(EncodingUser.encoded), 11)
+        self.user.dispatch("nodeRemoved", self.id2, rev=3)
+        EncodingUser.encoded = []
+        joined = self.model.create_new_user()
+        joined.channel_opened()
+        self.assertEqual(joined.messages[1], 
+            ('snapshot', ([[self.id1, PORTS, {}]], []), {'rev': 8}))
+
+class ShortHistoryModelGraph(FakeModelGraph):
+    history = 8
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        self.model = ShortHistoryModelGraph()
+        self.user = self.model.create_new_user()
+        self.leaving = self.model.create_new_user()
+        self.id = make_node_id()
+        self.user.dispatch("nodeCreated", self.id, rev=0)
+
+    def resume(self, rev):
+        user = self.model.resume_user(self.leaving.session, rev)
+        user.channel_opened()
+        return user
+
+    def test_missed_only(self):
+        self.leaving.disconnect()
+        self.user.dispatch("nodeStateChanged", self.id, {"x": 1}, rev=1)
+        self.user.dispatch("nodeRemoved", make_node_id(), rev=2)
+        self.user.dispatch("nodeStateChanged", self.id, {"x": 2}, rev=3)
+        user = self.resume(2)
+        self.assertEqual(user.id, self.leaving.id)
+        self.assertSequenceEqual(user.messages[1:], [
+            ('changeState', (self.id, {"x": 1}), {'rev': 3}),
+            ('changeState', (self.id, {"x": 2}), {'rev': 5, 'since': 4}),
+            ])
+
+    def test_own_replies(self):
+        missing = make_node_id()
+        self.leaving.dispatch("nodeStateChanged", self.id, {"x": 1}, rev=7)
+        self.leaving.dispatch("nodeRemoved", missing, rev=8)
+        self.leaving.disconnect()
+        user = self.resume(2)
+        self.assertSequenceEqual(user.messages[1:], [
+            ('changeState', (self.id, {"x": 1}), {'rev': 3, 'origin': 7}),
+            ('removeNode', (missing,), {'rev': 4, 'origin': 8}),
+            ])
+
+    def test_forgotten(self):
+        self.leaving.disconnect()
+        for x in range(10):
+            self.user.dispatch("nodeStateChanged", self.id, {"x": x}, rev=x + 1)
+        user = self.resume(2)
+        self.assertEqual([message[0] for message in user.messages], ["auth", "snapshot"])
+        self.assertEqual(self.resume(12).messages[1:], [])
+
+    def test_unknown_session(self):
+        user = self.model.resume_user("0" * 32, 2)
+        user.channel_opened()
+        self.assertNotEqual(user.id, self.leaving.id)
+        self.assertEqual(user.messages[1][0], "snapshot")
+
+    def test_take_over(self):
+        user = self.resume(2)
+        self.assertEqual(user.id, self.leaving.id)
+        self.assertIs(self.model._users[user.id], user)
+        # old connection is noticed gone later on
+        self.leaving.disconnect()
+        self.assertIs(self.model._users[user.id], user)
+
+    def test_interest_kept(self):
+        far = make_node_id()
+        self.user.dispatch("nodeStateChanged", self.id, {"x": 10, "y": 10}, rev=1)
+        self.user.dispatch("nodeCreated", far, rev=2)
+        self.user.dispatch("nodeStateChanged", far, {"x": 5000, "y": 10}, rev=3)
+        self.leaving.dispatch("interestChanged", viewport=[0, 0, 1000, 1000], rev=0)
+        self.leaving.disconnect()
+        self.user.dispatch("nodeStatePatched", far, [[["title"], "far"]], rev=4)
+        user = self.resume(7)
+        interests = self.model.interests
+        self.assertTrue(interests.has_interest(user))
+        self.assertFalse(interests.sees(user, far))
+        name, (nodes, links), kwargs = user.messages[-1]
+        self.assertEqual(name, "snapshot")
+        self.assertEqual([node[0] for node in nodes], [self.id])
+
+class TestInterests(unittest.TestCase):
+    def setUp(self):
+        self.model = FakeModelGraph()
+        self.user = self.model.create_new_user()
+        self.observer = self.model.create_new_user()
+        self.id1 = make_node_id()
+        self.id2 = make_node_id()
+        self.test = Counter()
+        self.user.dispatch("nodeCreated", self.id1, rev=self.test.rev)
+        self.user.dispatch("nodeCreated", self.id2, rev=self.test.rev)
+        self.user.dispatch("nodeStateChanged", self.id1, {"x": 10, "y": 10}, rev=self.test.rev)
+        self.user.dispatch("nodeStateChanged", self.id2, {"x": 5000, "y": 10}, rev=self.test.rev)
+        self.observer.dispatch("interestChanged", viewport=[0, 0, 1000, 1000], rev=0)
+        self.user.drop()
+        self.observer.drop()
+
+    def test_snapshot_of_viewport(self):
+        observer = self.model.create_new_user()
+        observer.dispatch("interestChanged", viewport=[0, 0, 1000, 1000], rev=0)
+        self.assertSequenceEqual(observer.messages, [
+            ('snapshot', ([[self.id1, PORTS, {"x": 10, "y": 10}]], []), {'rev': 8}),
+            ])
+
+    def test_filtered_delivery(self):
+        self.user.dispatch("nodeStateChanged", self.id1, {"x": 20, "y": 10}, rev=self.test.rev)
+        self.user.dispatch("nodeStateChanged", self.id2, {"x": 5020, "y": 10}, rev=self.test.rev)
+        self.user.dispatch("linkAdded", self.id1, "start", self.id2, "end", rev=self.test.rev)
+
+        rev = Counter(8)
+        self.assertSequenceEqual(self.observer.messages, [
+            ('changeState', (self.id1, {"x": 20, "y": 10}), {'rev': rev.rev}),
             ('nop', (), {'rev': rev.rev}),
+            ('addLink', (self.id1, "start", self.id2, "end"), {'rev': rev.rev}),
             ])
+
+    def test_show_hide(self):
+        self.user.dispatch("linkAdded", self.id1, "start", self.id2, "end", rev=self.test.rev)
+        self.user.dispatch("nodeStateChanged", self.id2, {"x": 20, "y": 10}, rev=self.test.rev)
+        self.user.dispatch("nodeStateChanged", self.id2, {"x": 5020, "y": 10}, rev=self.test.rev)
+
+        rev = Counter(8)
+        link = [self.id1, "start", self.id2, "end"]
+        self.assertSequenceEqual(self.observer.messages, [
+            ('addLink', tuple(link), {'rev': rev.rev}),
+            ('showNode', (self.id2, PORTS, {"x": 20, "y": 10}, [link]), {'rev': rev.rev}),
+            ('hideNode', (self.id2,), {'rev': rev.rev}),
+            ])
+        self.assertEqual(self.user.messages[1], 
+            ('changeState', (self.id2, {"x": 20, "y": 10}), {'rev': 9, 'origin': 5}))
+
+    def test_batch_across_interests(self):
+        self.user.dispatch("batch", [
+            ["nodeStatePatched", [self.id2, [[["title"], "far"]]]],
+            ["nodeStateChanged", [self.id1, {"x": 5000, "y": 10}]],
+            ], rev=self.test.rev)
+        self.user.dispatch("batch", [
+            ["nodeStateChanged", [self.id2, {"x": 20, "y": 10}]],
+            ["nodeStatePatched", [self.id2, [[["title"], "near"]]]],
+            ], rev=self.test.rev)
+
+        state = {"x": 20, "y": 10, "title": "near"}
+        self.assertSequenceEqual(self.observer.messages, [
+            ('batch', ([["changeState", [self.id1, {"x": 5000, "y": 10}]],
+                ["hideNode", [self.id1]]],), {'rev': 8}),
+            ('batch', ([["showNode", [self.id2, PORTS, state, []]]],), {'rev': 9}),
+            ])
+
+    def test_removed_user(self):
+        self.model.remove_user(self.observer)
+        self.assertIsNone(self.model.interests.watchers(self.id2))
+
+    def test_bad_viewport(self):
+        interests = self.model.interests
+        huge = 1e12
+        for viewport in ([0, 0, huge, huge], [0, 0, float("nan"), 10],
+                [0, 0, float("inf"), 10], [0, 0, "a", 10], [0, 0, 10], 5):
+            self.observer.dispatch("interestChanged", viewport=viewport, rev=0)
+            self.assertTrue(interests.sees(self.observer, self.id2))
+            self.assertNotIn(self.observer, interests._registered)
+        self.assertEqual(interests._by_cell, {})
+
+class RecordingProtocol(object):
+    write_buffer_size = 0
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.sent = []
+        self.aborted = False
+
+    def abort(self):
+        self.aborted = True
+
+    def sendFrame(self, frame):
+        self.sent.append([frame.message])
+
+    def sendFrames(self, frames):
+        self.sent.append([frame.message for frame in frames])
+
+class ConnectedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.model = GraphModel()
+        self.user = self.model.create_new_user()
+        self.user.connect(RecordingProtocol(self.loop))
+        self.observer = self.model.create_new_user()
+        self.observer.connect(RecordingProtocol(self.loop))
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_tick(self):
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+class TestCoalescing(ConnectedTestCase):
+    def test_one_frame_per_tick(self):
+        self.id = make_node_id()
+        test = Counter()
+        self.user.dispatch("nodeCreated", self.id, rev=test.rev)
+        self.assertSequenceEqual(self.observer._protocol.sent, [])
+        self.run_tick()
+
+        rev = Counter()
+        self.assertSequenceEqual(self.observer._protocol.sent, [[
+            ('createNode', (self.id,), {'rev': rev.rev}),
+            ('changePorts', (self.id, []), {'rev': rev.rev}),
+            ('changeState', (self.id, {}), {'rev': rev.rev}),
+            ]])
+
+        self.user.dispatch("nodeRemoved", self.id, rev=test.rev)
+        self.run_tick()
+        self.assertSequenceEqual(self.observer._protocol.sent[1], [
+            ('removeNode', (self.id,), {'rev': rev.rev}),
+            ])
+
+class TestSlowConsumer(ConnectedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.id = make_node_id()
+        self.test = Counter()
+        self.user.dispatch("nodeCreated", self.id, rev=self.test.rev)
+        self.run_tick()
+        self.observer._protocol.sent = []
+        self.observer.max_queue = 4
+        self.observer.pause_writing()
+
+    def change(self, count):
+        for x in range(count):
+            self.user.dispatch("nodeStateChanged", self.id, {"x": x}, rev=self.test.rev)
+        self.run_tick()
+
+    def test_paused(self):
+        self.change(3)
+        self.assertEqual(self.observer._protocol.sent, [])
+        self.assertEqual(self.observer.stats.queued, 3)
+        self.observer.resume_writing()
+        self.assertEqual(len(self.observer._protocol.sent), 1)
+        self.assertEqual(self.observer._protocol.sent[0][-1],
+            ('changeState', (self.id, {"x": 2}), {'rev': 5}))
+
+    def test_resync(self):
+        self.change(6)
+        stats = self.observer.stats
+        self.assertEqual((stats.queued, stats.dropped, stats.resyncs), (0, 6, 1))
+        self.observer.resume_writing()
+        [[(name, args, kwargs)]] = self.observer._protocol.sent
+        self.assertEqual(name, "snapshot")
+        self.assertEqual(kwargs, {"rev": 9})
+        self.assertEqual(args[0][0][2], {"x": 5})
+
+        self.change(1)
+        self.assertEqual(self.observer._protocol.sent[-1],
+            [('changeState', (self.id, {"x": 0}), {'rev': 9})])
+
+    def test_resync_viewport(self):
+        far = make_node_id()
+        self.user.dispatch("nodeCreated", far, rev=self.test.rev)
+        self.user.dispatch("nodeStateChanged", far, {"x": 5000, "y": 0}, rev=self.test.rev)
+        self.model.interests.set_interest(self.observer, viewport=[0, 0, 1000, 1000])
+        self.change(6)
+        self.observer.resume_writing()
+        [[(name, (nodes, links), kwargs)]] = self.observer._protocol.sent[-1:]
+        self.assertEqual(name, "snapshot")
+        self.assertEqual([node[0] for node in nodes], [self.id])
+        self.assertIsNot(self.observer.resync_frame(), self.model.snapshot_frame())
+
+    def test_coalesce(self):
+        self.observer.slow_policy = "coalesce"
+        self.change(5)
+        stats = self.observer.stats
+        self.assertEqual((stats.queued, stats.coalesced, stats.resyncs), (5, 4, 0))
+        self.observer.resume_writing()
+        self.assertEqual(self.observer._protocol.sent, [[
+            ('nop', (), {'rev': 3}),
+            ('nop', (), {'rev': 4}),
+            ('nop', (), {'rev': 5}),
+            ('nop', (), {'rev': 6}),
+            ('changeState', (self.id, {"x": 4}), {'rev': 7}),
+            ]])
+
+    def test_coalesce_keeps_since(self):
+        self.observer.slow_policy = "coalesce"
+        self.user.dispatch("nodeRemoved", make_node_id(), rev=self.test.rev)
+        self.change(5)
+        self.observer.resume_writing()
+        self.assertEqual(self.observer._protocol.sent[0][:2], [
+            ('nop', (), {'rev': 4, 'since': 3}),
+            ('nop', (), {'rev': 5}),
+            ])
+
+    def test_disconnect(self):
+        self.observer.slow_policy = "disconnect"
+        self.change(5)
+        self.assertTrue(self.observer._protocol.aborted)
+        self.assertEqual(self.observer.stats.dropped, 5)
+        self.assertEqual(self.model.queue_stats()[self.user.id].queued, 0)
@@ -0,0 +1,150 @@
+import os
+import asyncio
+import tempfile
+import unittest
+
+from revigred.model import (
+    GraphModel,
+    Journal,
+    read_checkpoint,
+    write_checkpoint,
+    )
+from .test_graph_model import (
+    FakeModelGraph,
+    PORTS,
+    )
+from .utils import (
+    Counter,
+    make_node_id,
+    )
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        fd, self.path = tempfile.mkstemp(suffix=".journal")
+        os.close(fd)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        os.remove(self.path)
+
+    def run_tick(self):
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+    def test_group_commit(self):
+        journal = Journal(self.path, loop=self.loop)
+        writes = []
+        write = journal._write
+        journal._write = lambda data: writes.append(data) or write(data)
+        journal.append(0, "createNode", ("NODE-1",))
+        journal.append(1, "changeState", ("NODE-1", {"x": 1}))
+        self.assertEqual(os.path.getsize(self.path), 0)
+        self.run_tick()
+        journal.close()
+        self.assertEqual(len(writes), 2) # one per tick plus final one on close
+        self.assertEqual(writes[1], b"")
+        self.assertSequenceEqual(list(Journal.read(self.path)), [
+            (0, "createNode", ["NODE-1"]),
+            (1, "changeState", ["NODE-1", {"x": 1}]),
+            ])
+
+    def test_torn_tail(self):
+        with open(self.path, "wb") as stream:
+            stream.write(b'[0,"createNode",["NODE-1"]]\n[1,"creat')
+        self.assertEqual(len(list(Journal.read(self.path))), 1)
+        journal = Journal(self.path, loop=self.loop)
+        journal.append(1, "createNode", ("NODE-2",))
+        journal.close()
+        self.assertSequenceEqual(list(Journal.read(self.path)), [
+            (0, "createNode", ["NODE-1"]),
+            (1, "createNode", ["NODE-2"]),
+            ])
+
+    def test_replay(self):
+        model = FakeModelGraph(journal=self.path)
+        user = model.create_new_user()
+        id1 = make_node_id()
+        id2 = make_node_id()
+        test = Counter()
+        user.dispatch("nodeCreated", id1, rev=test.rev)
+        user.dispatch("nodeCreated", id2, rev=test.rev)
+        user.dispatch("nodeStateChanged", id1, {"x": 10}, rev=test.rev)
+        user.dispatch("linkAdded", id1, "start", id2, "end", rev=test.rev)
+        user.dispatch("linkAdded", id2, "start", id1, "end", rev=test.rev)
+        user.dispatch("linkRemoved", id2, "start", id1, "end", rev=test.rev)
+        user.dispatch("nodeRemoved", make_node_id(), rev=test.rev)
+        self.run_tick()
+        model.close()
+
+        restored = GraphModel(journal=self.path)
+        self.assertEqual(restored.graph.snapshot(), model.graph.snapshot())
+        self.assertEqual(restored.graph.next_rev, 10)
+        self.assertEqual(restored.graph.get_node(id1).get_ports(), PORTS)
+        restored.close()
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.directory = tempfile.TemporaryDirectory()
+        self.journal = os.path.join(self.directory.name, "graph.journal")
+        self.checkpoint = os.path.join(self.directory.name, "graph.checkpoint")
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        self.directory.cleanup()
+
+    def make_model(self, **kwargs):
+        return FakeModelGraph(journal=self.journal, checkpoint=self.checkpoint, **kwargs)
+
+    def populate(self, model, test):
+        user = model.create_new_user()
+        ids = [make_node_id() for i in range(5)]
+        for id in ids:
+            user.dispatch("nodeCreated", id, rev=test.rev)
+            user.dispatch("nodeStateChanged", id, {"id": id}, rev=test.rev)
+        for start, end in zip(ids, ids[1:]):
+            user.dispatch("linkAdded", start, "start", end, "end", rev=test.rev)
+        user.dispatch("nodeRemoved", ids[-1], rev=test.rev)
+        model.remove_user(user)
+
+    def test_roundtrip(self):
+        model = self.make_model()
+        self.populate(model, Counter())
+        rev, nodes, links = model.graph.dump()
+        write_checkpoint(self.checkpoint, rev, nodes, links)
+        self.assertEqual(read_checkpoint(self.checkpoint), (rev, nodes, links))
+
+        graph = FakeModelGraph().graph
+        graph.load(rev, nodes, links)
+        self.assertEqual(graph.snapshot(), model.graph.snapshot())
+        self.assertEqual(graph.next_rev, model.graph.next_rev)
+        model.close()
+
+    def test_compaction_needs_journal(self):
+        with self.assertRaises(ValueError):
+            FakeModelGraph(checkpoint=self.checkpoint, compact_every=10)
+        model = FakeModelGraph(checkpoint=self.checkpoint)
+        with self.assertRaises(RuntimeError):
+            model.compact()
+        model.close()
+
+    def test_compaction(self):
+        test = Counter()
+        model = self.make_model()
+        self.populate(model, test)
+        rev = self.loop.run_until_complete(model.compact())
+        self.assertEqual(rev, model.graph.next_rev - 1)
+        self.assertEqual(read_checkpoint(self.checkpoint)[0], rev)
+        self.assertFalse(os.path.exists(self.journal + ".old"))
+        self.populate(model, test)
+        model.close()
+
+        restored = self.make_model()
+        self.assertEqual(restored.graph.snapshot(), model.graph.snapshot())
+        self.assertEqual(restored.graph.next_rev, model.graph.next_rev)
+        restored.close()
@@ -0,0 +1,67 @@
+import asyncio
+import unittest
+
+from autobahn.websocket.types import ConnectionDeny
+
+from revigred.model import Documents, GraphModel
+from revigred.protocol import (
+    ServerFactory,
+    resume_point,
+    )
+
+class Request(object):
+    def __init__(self, path, params=None, protocols=()):
+        self.path = path
+        self.params = params or {}
+        self.protocols = list(protocols)
+        self.peer = "tcp:127.0.0.1:1"
+
+class Transport(object):
+    def set_write_buffer_limits(self, high=None):
+        self.high = high
+
+class Logger(object):
+    def debug(self, *args):
+        pass
+
+class TestProtocol(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.documents = Documents(GraphModel, loop=self.loop)
+        self.factory = ServerFactory("ws://127.0.0.1:9000", loop=self.loop,
+            documents=self.documents, logger=Logger())
+
+    def tearDown(self):
+        self.documents.close()
+        self.loop.close()
+
+    def connect(self, request):
+        protocol = self.factory()
+        protocol.transport = Transport()
+        return protocol, protocol.onConnect(request)
+
+    def test_resume_point(self):
+        self.assertEqual(resume_point({}), None)
+        self.assertEqual(resume_point({"session": ["abc"], "rev": ["12"]}), ("abc", 12))
+        self.assertEqual(resume_point({"session": ["abc"], "rev": ["x"]}), None)
+        self.assertEqual(resume_point({"session": ["abc"]}), None)
+
+    def test_connect(self):
+        protocol, subprotocol = self.connect(
+            Request("/doc/a", protocols=["unknown", "revigred.json"]))
+        self.assertEqual(subprotocol, "revigred.json")
+        self.assertIs(protocol.model, self.documents.get("doc/a"))
+        self.assertIn(protocol.client.id, protocol.model._users)
+        self.assertEqual(protocol.transport.high, self.factory.write_buffer_limit)
+
+    def test_resume(self):
+        protocol, _ = self.connect(Request("/doc"))
+        session = protocol.client.session
+        protocol.onClose(True, 1000, "")
+        params = {"session": [session], "rev": ["0"]}
+        resumed, _ = self.connect(Request("/doc", params))
+        self.assertEqual(resumed.client.session, session)
+
+    def test_bad_document(self):
+        with self.assertRaises(ConnectionDeny):
+            self.connect(Request("/a b"))
@@ -0,0 +1,182 @@
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+import multiprocessing
+
+from revigred.model import GraphModel
+from revigred.model.graph.replica import (
+    Primary,
+    ReplicaLink,
+    ReplicaModel,
+    )
+from .test_graph_model import RecordingProtocol
+
+def messages(user):
+    return [message for frames in user._protocol.sent for message in frames]
+
+def events(user):
+    "Messages which advance revision, auth and snapshots left out"
+    return [list(message) for message in messages(user)
+        if message[0] not in ("auth", "snapshot")]
+
+class ReplicaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "primary.sock")
+        self.loop = asyncio.new_event_loop()
+        self.start_primary()
+        self.replicas = [ReplicaModel(self.path, loop=self.loop) for _ in range(2)]
+        for replica in self.replicas:
+            self.loop.run_until_complete(replica.connect())
+        self.users = [self.join(replica) for replica in self.replicas]
+        self.settle()
+
+    def start_primary(self):
+        self.model = GraphModel()
+        self.primary = Primary(self.model, self.path, loop=self.loop)
+        self.loop.run_until_complete(self.primary.start())
+
+    def tearDown(self):
+        for replica in self.replicas:
+            replica.close()
+        self.primary.close()
+        self.settle()
+        self.loop.close()
+        shutil.rmtree(self.folder)
+
+    def join(self, model):
+        user = model.create_new_user()
+        user.connect(RecordingProtocol(self.loop))
+        user.channel_opened()
+        return user
+
+    def settle(self, seconds=0.05):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+class TestReplica(ReplicaTestCase):
+    def test_snapshot(self):
+        self.model.on_nodeCreated(None, "NODE-1")
+        self.settle()
+        user = self.join(self.replicas[1])
+        self.settle()
+        name, (nodes, links), kwargs = messages(user)[-1]
+        self.assertEqual(name, "snapshot")
+        self.assertEqual([node[0] for node in nodes], ["NODE-1"])
+        self.assertEqual(kwargs["rev"], self.model.graph.next_rev)
+
+    def test_write_through_replica(self):
+        local = self.join(self.model)
+        writer, reader = self.users
+        writer.dispatch("nodeCreated", "NODE-1", rev=0)
+        self.settle()
+        self.assertEqual(events(writer)[0], ["createNode", ("NODE-1",), {"rev": 0, "origin": 0}])
+        self.assertEqual(events(reader), events(local))
+        self.assertEqual([message[0] for message in events(reader)],
+            ["createNode", "changePorts", "changeState"])
+        self.assertTrue(self.replicas[1].graph.has_node("NODE-1"))
+        self.assertEqual(self.replicas[1].graph.next_rev, self.model.graph.next_rev)
+
+    def test_refused_write(self):
+        writer, reader = self.users
+        writer.dispatch("nodeRemoved", "NODE-1", rev=0)
+        self.settle()
+        self.assertEqual(events(writer), [["removeNode", ("NODE-1",), {"rev": 0, "origin": 0}]])
+        self.assertEqual(events(reader), [])
+        writer.dispatch("nodeCreated", "NODE-1", rev=1)
+        self.settle()
+        self.assertEqual(events(reader)[0], ["createNode", ("NODE-1",), {"rev": 1, "since": 0}])
+
+    def test_interest_stays_local(self):
+        writer, reader = self.users
+        writer.dispatch("nodeCreated", "NODE-1", rev=0)
+        writer.dispatch("nodeStateChanged", "NODE-1", {"x": 0, "y": 0}, rev=1)
+        self.settle()
+        reader.dispatch("interestChanged", viewport=[5000, 5000, 6000, 6000], rev=0)
+        writer.dispatch("nodeStateChanged", "NODE-1", {"x": 10, "y": 0}, rev=2)
+        self.settle()
+        self.assertEqual(events(reader)[-1], ["nop", (), {"rev": 4}])
+        self.assertEqual(events(writer)[-1][0], "changeState")
+        self.assertIsNone(self.model.interests.watchers("NODE-1"))
+
+    def test_primary_commands(self):
+        class ExpandingModel(GraphModel):
+            def on_nodeExpanded(self, origin, id):
+                self.createNodeSelf(origin, id)
+        writer = self.users[0]
+        with self.assertRaises(ValueError):
+            writer.dispatch("nodeExpanded", "NODE-1", rev=0)
+        self.replicas[0].primary_class = ExpandingModel
+        writer.dispatch("nodeExpanded", "NODE-1", rev=0)
+        self.assertEqual(self.replicas[0]._pending, [])
+
+    def test_reconnect(self):
+        for replica in self.replicas:
+            replica.reconnect_delay = replica._delay = 0.01
+        self.model.on_nodeCreated(None, "NODE-1")
+        self.settle()
+        self.primary.close()
+        for user in list(self.model._users.values()):
+            if isinstance(user, ReplicaLink):
+                user._protocol.transport.close()
+        self.settle()
+        for replica, user in zip(self.replicas, self.users):
+            self.assertIsNone(replica._protocol)
+            self.assertTrue(user._protocol.aborted)
+            self.assertEqual(replica._users, {})
+        self.model.on_nodeCreated(None, "NODE-2")
+        self.primary = Primary(self.model, self.path, loop=self.loop)
+        self.loop.run_until_complete(self.primary.start())
+        self.settle(0.2)
+        user = self.join(self.replicas[1])
+        self.settle()
+        nodes, links = self.replicas[1].graph.snapshot()
+        self.assertEqual([node[0] for node in nodes], ["NODE-1", "NODE-2"])
+        self.assertEqual(self.replicas[1].graph.next_rev, self.model.graph.next_rev)
+
+    def test_pending_bound(self):
+        replica = ReplicaModel(os.path.join(self.folder, "missing.sock"), loop=self.loop)
+        replica.max_pending = 1
+        user = self.join(replica)
+        user.dispatch("nodeCreated", "NODE-1", rev=0)
+        self.assertFalse(user._protocol.aborted)
+        user.dispatch("nodeCreated", "NODE-2", rev=1)
+        self.assertTrue(user._protocol.aborted)
+        self.assertEqual(len(replica._pending), 1)
+        replica.close()
+
+def serve_primary(path, seconds):
+    loop = asyncio.new_event_loop()
+    model = GraphModel()
+    loop.run_until_complete(Primary(model, path, loop=loop).start())
+    loop.run_until_complete(asyncio.sleep(seconds))
+
+class TestPrimaryProcess(ReplicaTestCase):
+    "Replicas follow primary running in another process"
+
+    def start_primary(self):
+        context = multiprocessing.get_context("fork")
+        self.process = context.Process(target=serve_primary, args=(self.path, 10))
+        self.process.start()
+        deadline = time.time() + 5
+        while not os.path.exists(self.path) and time.time() < deadline:
+            time.sleep(0.01)
+        self.primary = Primary(None, self.path, loop=self.loop)
+
+    def tearDown(self):
+        super().tearDown()
+        self.process.terminate()
+        self.process.join()
+
+    def test_write_through_replica(self):
+        writer, reader = self.users
+        for index in range(10):
+            writer.dispatch("nodeCreated", "NODE-{}".format(index), rev=index)
+        self.settle(0.2)
+        self.assertEqual(len(events(reader)), 30)
+        revisions = lambda user: [(name, kwargs["rev"]) for name, _, kwargs in events(user)]
+        self.assertEqual(revisions(reader), revisions(writer))
+        nodes, links = self.replicas[1].graph.snapshot()
+        self.assertEqual(len(nodes), 10)
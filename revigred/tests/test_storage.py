@@ -0,0 +1,285 @@
+import pickle
+import unittest
+
+from revigred.model import (
+    Cancel,
+    Graph,
+    Link,
+    LinkCycle,
+    Node,
+    Port,
+    Ports,
+    )
+from revigred.model.graph.topology import CycleError
+from .utils import (
+    make_node_id,
+    )
+
+def fresh(value):
+    return (value + " ")[:-1]
+
+class TestCompactStorage(unittest.TestCase):
+    def setUp(self):
+        self.graph = Graph()
+        self.id1 = make_node_id()
+        self.id2 = make_node_id()
+        for id in (self.id1, self.id2):
+            node = Node(fresh(id))
+            node.add_port(Port(fresh("start"), ""))
+            node.add_port(Port(fresh("end"), ""))
+            self.graph.add_node(node)
+
+    def node_added(self, id):
+        self.added.append(id)
+
+    def test_no_instance_dicts(self):
+        node = self.graph.get_node(self.id1)
+        link = Link(self.id1, "start", self.id2, "end")
+        for item in (node, node.get_port("start"), link):
+            self.assertFalse(hasattr(item, "__dict__"))
+
+    def test_listeners_created_on_demand(self):
+        node = Node(make_node_id())
+        self.assertIsNone(node._listeners)
+        self.graph.on("node:add", self.node_added)
+        self.added = []
+        self.graph.add_node(node)
+        self.assertEqual(self.added, [node.id])
+        self.assertIsNone(node._listeners)
+
+    def test_empty_ports_shared(self):
+        node1 = Node(make_node_id())
+        node2 = Node(make_node_id())
+        self.assertIs(node1._ports, node2._ports)
+        node1.add_port(Port("in", ""))
+        self.assertTrue(node1.has_port("in"))
+        self.assertFalse(node2.has_port("in"))
+
+    def test_link_is_key(self):
+        link = Link(fresh(self.id1), fresh("start"), fresh(self.id2), fresh("end"))
+        self.graph.add_link(link)
+        key = (self.id1, "start", self.id2, "end")
+        self.assertEqual(link, key)
+        self.assertTrue(self.graph.has_link(*key))
+        self.assertIs(self.graph.get_link(*key), link)
+        (stored, ), = [list(self.graph._links_by_key)]
+        self.assertIs(stored, link)
+        self.assertEqual(link.start_name, "start")
+        self.assertEqual(link.end_id, self.id2)
+
+    def test_strings_interned(self):
+        link = Link(fresh(self.id1), fresh("start"), fresh(self.id2), fresh("end"))
+        node = self.graph.get_node(self.id1)
+        self.assertIs(link.start_id, node.id)
+        self.assertIs(link.start_name, node.get_port("start").name)
+
+    def test_other_ids_kept(self):
+        node = Node(5)
+        self.graph.add_node(node)
+        self.assertTrue(self.graph.has_node(5))
+        self.assertEqual(Link(5, "start", self.id2, "end").start_id, 5)
+
+    def test_pickle(self):
+        link = Link(self.id1, "start", self.id2, "end")
+        self.assertEqual(pickle.loads(pickle.dumps(link)), link)
+        self.assertIs(type(pickle.loads(pickle.dumps(link))), Link)
+
+    def test_dump_load(self):
+        self.graph.add_link(Link(self.id1, "start", self.id2, "end"))
+        graph = Graph()
+        graph.load(*self.graph.dump())
+        self.assertEqual(graph.snapshot(), self.graph.snapshot())
+        self.assertIs(type(graph.dump()[2][0]), tuple)
+
+class TestAdjacency(unittest.TestCase):
+    def setUp(self):
+        self.graph = Graph()
+        self.ids = [make_node_id() for i in range(3)]
+        for id in self.ids:
+            node = Node(id)
+            node.add_port(Port("start", ""))
+            node.add_port(Port("end", ""))
+            self.graph.add_node(node)
+
+    def assertEmpty(self):
+        adjacency = self.graph._adjacency
+        self.assertEqual(len(adjacency), 0)
+        for index in (adjacency._node_of, adjacency._port_of, adjacency._ports,
+                adjacency._outgoing, adjacency._incoming):
+            self.assertEqual(index, {})
+
+    def test_lookup_leaves_nothing(self):
+        id = make_node_id()
+        self.assertEqual(list(self.graph.find_links_startswith(id)), [])
+        self.assertEqual(list(self.graph.find_links_endswith(id)), [])
+        self.assertEqual(self.graph.fan_out(id, "start"), 0)
+        self.assertEqual(self.graph.fan_in(id, "end"), 0)
+        self.assertEmpty()
+
+    def test_fan_counts(self):
+        id1, id2, id3 = self.ids
+        self.graph.add_link(Link(id1, "start", id2, "end"))
+        self.graph.add_link(Link(id1, "start", id3, "end"))
+        self.graph.add_link(Link(id2, "start", id3, "end"))
+        self.assertEqual(self.graph.fan_out(id1, "start"), 2)
+        self.assertEqual(self.graph.fan_in(id3, "end"), 2)
+        self.assertEqual(self.graph.fan_in(id1, "end"), 0)
+        self.assertEqual(len(list(self.graph.find_links_endswith(id3))), 2)
+        self.assertEqual(list(self.graph.find_links_startswith(id2)),
+            [(id2, "start", id3, "end")])
+
+    def test_self_loop(self):
+        id1 = self.ids[0]
+        self.graph.add_link(Link(id1, "start", id1, "end"))
+        self.assertEqual(list(self.graph.find_links_startswith(id1)),
+            list(self.graph.find_links_endswith(id1)))
+        self.graph.remove_link(id1, "start", id1, "end")
+        self.assertEmpty()
+
+    def test_self_loop_on_port(self):
+        id1 = self.ids[0]
+        self.graph.add_link(Link(id1, "start", id1, "start"))
+        self.assertEqual(self.graph.fan_out(id1, "start"), 1)
+        self.assertEqual(self.graph.fan_in(id1, "start"), 1)
+        self.graph.remove_link(id1, "start", id1, "start")
+        self.assertFalse(self.graph.has_link(id1, "start", id1, "start"))
+        self.assertEmpty()
+
+    def test_remove_missing(self):
+        id1, id2, id3 = self.ids
+        self.graph.add_link(Link(id1, "start", id2, "end"))
+        with self.assertRaises(KeyError):
+            self.graph._adjacency.remove(id1, "start", id3, "end")
+        self.assertEqual(self.graph.fan_out(id1, "start"), 1)
+
+    def test_cycles_leave_nothing(self):
+        for i in range(1000):
+            ids = [make_node_id() for j in range(3)]
+            for id in ids:
+                self.graph.add_node(Node(id))
+            for start, end in zip(ids, ids[1:] + ids[:1]):
+                self.graph.add_link(Link(start, "start", end, "end"))
+            for start, end in zip(ids, ids[1:] + ids[:1]):
+                self.graph.remove_link(start, "start", end, "end")
+            for id in ids:
+                self.graph.remove_node(id)
+        self.assertEmpty()
+
+class TestPorts(unittest.TestCase):
+    def setUp(self):
+        self.node = Node(make_node_id())
+        for name in "abc":
+            self.node.add_port(Port(name, name.upper()))
+
+    def names(self):
+        return [port["name"] for port in self.node.get_ports()]
+
+    def test_insert(self):
+        self.node.add_port(Port("d", ""), 1)
+        self.node.add_port(Port("e", ""), 0)
+        self.node.add_port(Port("f", ""), 100)
+        self.assertEqual(self.names(), ["e", "a", "d", "b", "c", "f"])
+        self.assertEqual(self.node.port_index("d"), 2)
+        with self.assertRaises(KeyError):
+            self.node.add_port(Port("a", ""))
+
+    def test_check_add_port(self):
+        graph = Graph()
+        graph.add_node(self.node)
+        graph.check_add_port(self.node.id, "d")
+        for id, name in ((self.node.id, "a"), (make_node_id(), "d")):
+            with self.assertRaises(Cancel):
+                graph.check_add_port(id, name)
+
+    def test_remove_move(self):
+        self.node.remove_port("b")
+        self.assertFalse(self.node.has_port("b"))
+        self.node.move_port("c", 0)
+        self.assertEqual(self.names(), ["c", "a"])
+        self.node.move_port("c", 1)
+        self.assertEqual(self.names(), ["a", "c"])
+        with self.assertRaises(KeyError):
+            self.node.remove_port("b")
+
+    def test_serialized_cached(self):
+        ports = self.node.get_ports()
+        self.assertEqual(ports, [{"name": "a", "title": "A"},
+            {"name": "b", "title": "B"}, {"name": "c", "title": "C"}])
+        self.assertIs(self.node.get_ports(), ports)
+        self.node.move_port("a", 2)
+        self.assertIsNot(self.node.get_ports(), ports)
+        self.assertEqual(self.names(), ["b", "c", "a"])
+
+    def test_dump_restore(self):
+        node = Node(self.node.id)
+        node.restore(*self.node.dump())
+        self.assertEqual(node.get_ports(), self.node.get_ports())
+        node.set_ports([])
+        self.assertEqual(node.get_ports(), [])
+
+class AcyclicGraph(Graph):
+    acyclic = True
+
+class TestTopology(unittest.TestCase):
+    def setUp(self):
+        self.graph = AcyclicGraph()
+        for id in "abcdef":
+            node = Node(id)
+            node.add_port(Port("out", ""))
+            node.add_port(Port("in", ""))
+            self.graph.add_node(node)
+
+    def link(self, start_id, end_id):
+        self.graph.add_link(Link(start_id, "out", end_id, "in"))
+
+    def assertOrdered(self, graph):
+        order = graph.topological_order()
+        position = {id: index for index, id in enumerate(order)}
+        self.assertEqual(len(order), len(position))
+        for start_id, _, end_id, _ in graph.dump()[2]:
+            self.assertLess(position[start_id], position[end_id])
+
+    def test_reorder(self):
+        self.link("e", "b")
+        self.link("b", "a")
+        self.link("f", "e")
+        self.link("c", "d")
+        self.assertOrdered(self.graph)
+        self.assertEqual(set(self.graph.topological_order()), set("abcdef"))
+
+    def test_cycle(self):
+        self.link("a", "b")
+        self.link("b", "c")
+        with self.assertRaises(Cancel) as context:
+            self.graph.check_add_link("c", "out", "a", "in")
+        self.assertIsInstance(context.exception.__cause__, LinkCycle)
+        with self.assertRaises(CycleError):
+            self.link("c", "a")
+        with self.assertRaises(CycleError):
+            self.link("a", "a")
+        self.assertFalse(self.graph.has_link("c", "out", "a", "in"))
+        # parallel path is fine
+        self.link("a", "c")
+        self.assertOrdered(self.graph)
+
+    def test_remove_node(self):
+        self.link("c", "b")
+        for id in "abde":
+            self.graph.remove_node(id)
+        self.assertEqual(self.graph.topological_order(), ["c", "f"])
+
+    def test_load(self):
+        self.link("d", "a")
+        self.link("a", "c")
+        graph = AcyclicGraph()
+        graph.load(*self.graph.dump())
+        self.assertOrdered(graph)
+        with self.assertRaises(CycleError):
+            graph.add_link(Link("c", "out", "d", "in"))
+
+    def test_not_acyclic(self):
+        graph = Graph()
+        graph.add_link(Link("b", "out", "a", "in"))
+        self.assertEqual(graph.topological_order(), ["b", "a"])
+        graph.add_link(Link("a", "out", "b", "in"))
+        self.assertEqual(set(graph.topological_order()), {"a", "b"})
@@ -0,0 +1,218 @@
+import socket
+import asyncio
+import unittest
+
+from revigred.model import Documents, GraphModel, document_name
+from revigred.supervisor import (
+    Supervisor,
+    Worker,
+    owner,
+    request_path,
+    send_socket,
+    receive_sockets,
+    listen,
+    )
+
+class TestRouting(unittest.TestCase):
+    def test_request_path(self):
+        self.assertEqual(request_path(b"GET /doc/a?x=1 HTTP/1.1\r\nHost: x\r\n"), "/doc/a?x=1")
+        self.assertEqual(request_path(b"GET /doc/a HT"), None)
+        self.assertEqual(request_path(b"\r\n"), "")
+
+    def test_document_name(self):
+        self.assertEqual(document_name("/doc/a?x=1"), "doc/a")
+        self.assertEqual(document_name("/"), "")
+
+    def test_owner(self):
+        names = ["doc-{}".format(i) for i in range(100)]
+        owners = [owner(name, 4) for name in names]
+        self.assertEqual(owners, [owner(name, 4) for name in names])
+        self.assertEqual(set(owners), {0, 1, 2, 3})
+
+    def test_documents(self):
+        loop = asyncio.new_event_loop()
+        documents = Documents(GraphModel, loop=loop)
+        model = documents.get("a")
+        self.assertIs(documents.get("a"), model)
+        self.assertIsNot(documents.get("b"), model)
+        self.assertEqual(sorted(documents), ["a", "b"])
+        documents.close()
+        self.assertEqual(len(documents), 0)
+        loop.close()
+
+    def test_document_limits(self):
+        loop = asyncio.new_event_loop()
+        documents = Documents(GraphModel, loop=loop)
+        documents.max_documents = 1
+        for name in ("a b", "a\nb", "a//b", "x" * 300):
+            with self.assertRaises(ValueError):
+                documents.get(name)
+        documents.get("doc/a")
+        with self.assertRaises(ValueError):
+            documents.get("doc/b")
+        documents.close()
+        loop.close()
+
+    def test_idle_document(self):
+        loop = asyncio.new_event_loop()
+        documents = Documents(GraphModel, loop=loop)
+        documents.idle_timeout = 0.01
+        model = documents.get("a")
+        user = model.create_new_user()
+        loop.run_until_complete(asyncio.sleep(0.05))
+        self.assertIn("a", documents)
+        model.remove_user(user)
+        loop.run_until_complete(asyncio.sleep(0.05))
+        self.assertNotIn("a", documents)
+        self.assertIsNot(documents.get("a"), model)
+        documents.close()
+        loop.close()
+
+    def test_socket_handoff(self):
+        inbox, outbox = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        left, right = socket.socketpair()
+        send_socket(outbox, left)
+        left.close()
+        received, = receive_sockets(inbox)
+        received.sendall(b"over")
+        self.assertEqual(right.recv(4), b"over")
+        for sock in (inbox, outbox, right, received):
+            sock.close()
+
+class TestWorker(unittest.TestCase):
+    "Worker 0 of two, the inbox of worker 1 is never read"
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.listener = listen("127.0.0.1", 0)
+        self.channels = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            for _ in range(2)]
+        for pair in self.channels:
+            for sock in pair:
+                sock.setblocking(False)
+        self.worker = Worker(0, self.listener, self.channels, asyncio.Protocol, self.loop)
+        self.worker.start()
+        self.name = next(name for name in ("doc-{}".format(i) for i in range(100))
+            if owner(name, 2) == 1)
+        self.clients = []
+
+    def tearDown(self):
+        self.worker.stop()
+        for sock in self.clients + [self.listener]:
+            sock.close()
+        for pair in self.channels:
+            for sock in pair:
+                sock.close()
+        self.loop.close()
+
+    def settle(self, seconds=0.05):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def connect(self):
+        client = socket.create_connection(self.listener.getsockname(), timeout=1)
+        self.clients.append(client)
+        return client
+
+    def fill(self):
+        "Hands connections to worker 1 until its channel is full"
+        for _ in range(10000):
+            left, right = socket.socketpair()
+            self.clients.append(right)
+            self.worker.route(left, self.name)
+            if self.worker._handoffs:
+                return
+        self.fail("channel never filled")
+
+    def test_peek_timeout(self):
+        self.worker.peek_timeout = 0.1
+        silent = self.connect()
+        partial = self.connect()
+        partial.sendall(b"GET /doc")
+        self.settle(0.3)
+        self.assertEqual(self.worker.expired, 2)
+        self.assertEqual(self.worker._peeking, {})
+        self.assertEqual(silent.recv(1), b"")
+        # closed with unread request, so it is reset
+        with self.assertRaises(ConnectionResetError):
+            partial.recv(1)
+
+    def test_stop(self):
+        partial = self.connect()
+        partial.sendall(b"GET /doc")
+        self.settle()
+        self.fill()
+        self.worker.stop()
+        self.assertEqual(self.worker._peeking, {})
+        self.assertEqual(self.worker._delayed, {})
+        self.assertEqual(self.worker._handoffs, {})
+        with self.assertRaises(ConnectionResetError):
+            partial.recv(1)
+
+    def test_busy_owner(self):
+        self.fill()
+        handed = self.worker.handed
+        inbox = self.channels[1][0]
+        for _ in range(handed):
+            for sock in receive_sockets(inbox):
+                sock.close()
+        self.settle()
+        self.assertEqual(self.worker.handed, handed + 1)
+        self.assertEqual(self.worker._handoffs, {})
+        self.assertEqual(self.worker.rejected, 0)
+
+    def test_owner_gone(self):
+        self.worker.max_handoffs = 1
+        self.worker.handoff_timeout = 0.1
+        self.fill()
+        left, right = socket.socketpair()
+        self.clients.append(right)
+        self.worker.route(left, self.name)
+        self.assertEqual(self.worker.rejected, 1)
+        self.assertTrue(right.recv(64).startswith(b"HTTP/1.1 503"))
+        self.settle(0.3)
+        self.assertEqual(self.worker.rejected, 2)
+        self.assertEqual(self.worker._handoffs, {})
+
+class Reporter(asyncio.Protocol):
+    "Tells which worker has the connection"
+    def __init__(self, index):
+        self.index = index
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.transport.write("{}\n".format(self.index).encode())
+        self.transport.close()
+
+def serve(index, listener, channels):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    worker = Worker(index, listener, channels, lambda: Reporter(index), loop)
+    worker.start()
+    loop.run_forever()
+
+@unittest.skipUnless(hasattr(socket, "SO_REUSEPORT"), "needs SO_REUSEPORT")
+class TestSupervisor(unittest.TestCase):
+    workers = 3
+
+    def setUp(self):
+        self.supervisor = Supervisor("127.0.0.1", 0, self.workers, serve)
+        self.supervisor.start()
+
+    def tearDown(self):
+        self.supervisor.stop()
+        self.assertEqual(self.supervisor.wait(), [0] * self.workers)
+
+    def request(self, path):
+        sock = socket.create_connection(("127.0.0.1", self.supervisor.port), timeout=10)
+        try:
+            sock.sendall("GET {} HTTP/1.1\r\n\r\n".format(path).encode())
+            return int(sock.makefile().readline())
+        finally:
+            sock.close()
+
+    def test_served_by_owner(self):
+        for i in range(30):
+            name = "doc-{}".format(i)
+            self.assertEqual(self.request("/" + name), owner(name, self.workers))
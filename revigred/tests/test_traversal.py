@@ -0,0 +1,91 @@
+import unittest
+
+from revigred.model import (
+    Graph,
+    Link,
+    Node,
+    )
+from revigred.model.graph.traversal import (
+    bfs,
+    dfs,
+    descendants,
+    ancestors,
+    reachable,
+    shortest_path,
+    subgraph,
+    )
+
+class TestTraversal(unittest.TestCase):
+    def setUp(self):
+        #   a --out--> b --out--> d
+        #   a --aux--> c --out--> d --out--> a
+        self.graph = Graph()
+        for id in "abcde":
+            self.graph.add_node(Node(id))
+        for key in [
+                ("a", "out", "b", "in"),
+                ("a", "aux", "c", "in"),
+                ("b", "out", "d", "in"),
+                ("c", "out", "d", "in"),
+                ("d", "out", "a", "back"),
+                ]:
+            self.graph.add_link(Link(*key))
+
+    def test_bfs(self):
+        order = [id for id, _ in bfs(self.graph, "a")]
+        self.assertEqual(order[0], "a")
+        self.assertEqual(set(order[1:3]), {"b", "c"})
+        self.assertEqual(order[3], "d")
+        self.assertEqual(dict(bfs(self.graph, "a"))["b"], ("a", "out", "b", "in"))
+
+    def test_dfs(self):
+        order = [id for id, _ in dfs(self.graph, "a")]
+        self.assertEqual(sorted(order), ["a", "b", "c", "d"])
+        # d is visited right after whichever child leads to it first
+        self.assertEqual(order[2], "d")
+
+    def test_ports(self):
+        self.assertEqual(descendants(self.graph, "a"), {"b", "c", "d"})
+        self.assertEqual(descendants(self.graph, "a", ports={"aux", "out"}),
+            {"b", "c", "d"})
+        self.assertEqual(descendants(self.graph, "b", ports={"out"}), {"d", "a"})
+        self.assertEqual(descendants(self.graph, "d", ports={"out"}), {"a", "b"})
+        self.assertEqual(ancestors(self.graph, "d"), {"a", "b", "c"})
+        self.assertEqual(ancestors(self.graph, "a", ports={"back"}), {"d"})
+        self.assertEqual(descendants(self.graph, "e"), set())
+
+    def test_reachable(self):
+        self.assertTrue(reachable(self.graph, "c", "b"))
+        self.assertFalse(reachable(self.graph, "a", "e"))
+        self.assertTrue(reachable(self.graph, "a", "d", reverse=True))
+
+    def test_shortest_path(self):
+        self.assertEqual(shortest_path(self.graph, "c", "b"), [
+            ("c", "out", "d", "in"),
+            ("d", "out", "a", "back"),
+            ("a", "out", "b", "in"),
+            ])
+        self.assertEqual(shortest_path(self.graph, "b", "d", reverse=True), [
+            ("a", "out", "b", "in"),
+            ("d", "out", "a", "back"),
+            ])
+        self.assertEqual(shortest_path(self.graph, "a", "a"), [])
+        self.assertIsNone(shortest_path(self.graph, "a", "e"))
+
+    def test_subgraph(self):
+        nodes, links = subgraph(self.graph, ["a", "b", "d"])
+        self.assertEqual(set(nodes), {"a", "b", "d"})
+        self.assertEqual(sorted(links), [
+            ("a", "out", "b", "in"),
+            ("b", "out", "d", "in"),
+            ("d", "out", "a", "back"),
+            ])
+
+    def test_deep_chain(self):
+        graph = Graph()
+        size = 20000
+        for i in range(size):
+            graph.add_link(Link(str(i), "out", str(i + 1), "in"))
+        self.assertEqual(len(descendants(graph, "0")), size)
+        self.assertEqual(sum(1 for _ in dfs(graph, "0")), size + 1)
+        self.assertEqual(len(shortest_path(graph, "0", str(size))), size)